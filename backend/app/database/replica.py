@@ -0,0 +1,98 @@
+"""
+Read-replica routing policy for API requests.
+
+When a read replica is configured (see connection.py), sessions from get_db
+send the SELECTs of GET/HEAD requests to it. Everything else uses the
+primary: writes and flushes, all other methods, and sessions the services
+open themselves. A replica lags behind the primary, so a request falls back
+to the primary in these cases:
+
+- read-your-writes: a successful write sets a cookie (or the client sends
+  `X-Read-Primary: 1`) and that client's reads go to the primary for
+  READ_YOUR_WRITES_SECONDS;
+- version-stamped responses: an ETag, or a cache keyed by a version stamp,
+  must not be built from rows older than the stamp, so `avoid_lag(version)`
+  moves the rest of the request to the primary while the stamp is younger
+  than READ_REPLICA_MAX_LAG.
+
+This module must not import the connection module (connection.py imports it).
+"""
+import os
+import time
+from contextvars import ContextVar
+
+READ_REPLICA_MAX_LAG = float(os.getenv("READ_REPLICA_MAX_LAG", "5"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+PIN_COOKIE = "sepcan_primary_until"
+PIN_HEADER = b"x-read-primary"
+READ_METHODS = frozenset({"GET", "HEAD"})
+# POSTs that only read: no read-your-writes pin (their GET sub-requests are routed like any GET)
+READ_ONLY_POST_PATHS = frozenset({"/api/batch", "/api/batch/"})
+
+_replica_allowed: ContextVar[bool] = ContextVar("sepcan_replica_allowed", default=False)
+
+
+def replica_allowed() -> bool:
+    """True if the current request's reads may go to the replica."""
+    return _replica_allowed.get()
+
+
+def use_primary():
+    """Send the rest of the current request to the primary."""
+    _replica_allowed.set(False)
+
+
+def avoid_lag(version: int):
+    """Use the primary if `version` (a versions.py stamp, ns) may not have reached the replica yet."""
+    if _replica_allowed.get() and time.time_ns() - version < READ_REPLICA_MAX_LAG * 1e9:
+        _replica_allowed.set(False)
+
+
+def _pinned(headers) -> bool:
+    for name, value in headers:
+        if name == PIN_HEADER and value.strip() not in (b"", b"0"):
+            return True
+        if name == b"cookie":
+            for part in value.decode("latin-1").split(";"):
+                key, _, until = part.strip().partition("=")
+                if key == PIN_COOKIE:
+                    try:
+                        return float(until) > time.time()
+                    except ValueError:
+                        return False
+    return False
+
+
+class ReplicaRoutingMiddleware:
+    """Decides, per request, whether its reads may use the replica, and pins writers to the primary."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] in READ_METHODS or scope["path"] in READ_ONLY_POST_PATHS:
+            token = _replica_allowed.set(not _pinned(scope["headers"]))
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _replica_allowed.reset(token)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + READ_YOUR_WRITES_SECONDS
+                cookie = (f"{PIN_COOKIE}={until:.3f}; Max-Age={int(READ_YOUR_WRITES_SECONDS)}; "
+                          "Path=/; HttpOnly; SameSite=Lax")
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        token = _replica_allowed.set(False)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _replica_allowed.reset(token)
@@ -0,0 +1,67 @@
+"""
+Delete triggers behind GET /api/sync: every tracked table logs the primary
+key of each deleted row in sync_deletions.
+
+create_sync_triggers is an "after_create" listener on both the app's metadata
+(app/models/models.py) and database_management/database.py, so every
+create_all() that creates sync_deletions also creates the triggers;
+database_management/migrate_sync_tracking.py adds them to existing databases.
+This module imports nothing from the app: the scripts load it by path.
+"""
+
+# Primary key columns (database names) of the tracked tables; row_key joins their values with ":"
+SYNC_KEYS = {
+    "coches": ["ID"],
+    "trabajadores": ["dni"],
+    "trabajos": ["id"],
+    "formularios_coche": ["id_coche", "dni_trabajador", "id_trabajo"],
+    "formularios_trabajo": ["id_coche", "dni_trabajador", "id_trabajo"],
+    "incidencias": ["id_incidencia"],
+}
+
+
+def sync_trigger_ddl(dialect: str) -> list:
+    """Statements that (re)create the delete triggers feeding sync_deletions."""
+    statements = []
+    if dialect == "postgresql":
+        statements.append(
+            "CREATE OR REPLACE FUNCTION sync_log_deletion() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+            "INSERT INTO sync_deletions (table_name, row_key, deleted_at) VALUES (TG_TABLE_NAME, "
+            "array_to_string(ARRAY(SELECT to_jsonb(OLD) ->> c FROM unnest(TG_ARGV) AS c), ':'), "
+            "now() AT TIME ZONE 'utc'); RETURN OLD; END $$"
+        )
+    for table, columns in SYNC_KEYS.items():
+        trigger = f"sync_del_{table}"
+        if dialect == "mssql":
+            key = " + ':' + ".join(f"CAST(d.[{c}] AS NVARCHAR(64))" for c in columns)
+            statements.append(
+                f"CREATE OR ALTER TRIGGER {trigger} ON [{table}] AFTER DELETE AS BEGIN SET NOCOUNT ON; "
+                f"INSERT INTO sync_deletions (table_name, row_key, deleted_at) "
+                f"SELECT '{table}', {key}, SYSUTCDATETIME() FROM deleted d; END"
+            )
+        elif dialect == "postgresql":
+            arguments = ", ".join(f"'{c}'" for c in columns)
+            statements.append(f'DROP TRIGGER IF EXISTS {trigger} ON "{table}"')
+            statements.append(
+                f'CREATE TRIGGER {trigger} AFTER DELETE ON "{table}" FOR EACH ROW '
+                f"EXECUTE FUNCTION sync_log_deletion({arguments})"
+            )
+        elif dialect == "sqlite":
+            key = " || ':' || ".join(f'OLD."{c}"' for c in columns)
+            statements.append(f"DROP TRIGGER IF EXISTS {trigger}")
+            statements.append(
+                f'CREATE TRIGGER {trigger} AFTER DELETE ON "{table}" BEGIN '
+                f"INSERT INTO sync_deletions (table_name, row_key, deleted_at) "
+                f"VALUES ('{table}', {key}, strftime('%Y-%m-%d %H:%M:%f000', 'now')); END"
+            )
+        else:
+            raise ValueError(f"No sync triggers for the {dialect} dialect")
+    return statements
+
+
+def create_sync_triggers(target, connection, **kw):
+    """after_create listener: (re)create the triggers once sync_deletions exists."""
+    if not connection.dialect.has_table(connection, "sync_deletions"):
+        return
+    for statement in sync_trigger_ddl(connection.dialect.name):
+        connection.exec_driver_sql(statement)
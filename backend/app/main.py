@@ -1,13 +1,67 @@
+import logging
+from contextlib import asynccontextmanager
+
+# Logging first: modules imported below log while they load
+from app.utils import log
+log.configure()
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 
+from app.database import connection, replica
 from app.database.connection import create_tables # Keep import if needed elsewhere, but function call removed
-from app.routers import coches, trabajadores, trabajos, formularios, query, incidencias
+from app.routers import coches, trabajadores, trabajos, formularios, query, incidencias, statistics, search, sync, batch, admin
+from app.services import analytics_snapshot, ingest_outbox, reference_cache
+from app.services import sync as sync_service
+from app.utils import diagnostics, idempotency, metrics, profiling
+from app.utils.serialization import ORJSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+def start_background_services():
+    # Columnar snapshot behind /statistics/aggregate, refreshed from a daemon thread
+    analytics_snapshot.start_background_refresh()
+    # Form submissions queued while the database was unavailable (INGEST_MODE)
+    ingest_outbox.start_committer()
+    # Deletion log behind GET /sync
+    sync_service.start_background_prune()
+    # Reference tables behind the foreign-key checks of the form endpoints
+    try:
+        reference_cache.load_all()
+    except Exception as e:
+        logger.warning("Reference cache not loaded at startup (will load on first use): %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Off the event loop: loading the reference cache queries the database
+    await run_in_threadpool(start_background_services)
+    yield
+
 
 # Initialize FastAPI app
-app = FastAPI(title="Service Company API")
+app = FastAPI(title="Service Company API", default_response_class=ORJSONResponse, lifespan=lifespan)
             #   openapi_prefix="/api")
 
+# Per-route latency, DB, LLM and response-size metrics, exposed at /metrics
+metrics.install()
+app.add_middleware(metrics.MetricsMiddleware)
+# Slow-query log, N+1 detection and query budgets
+diagnostics.install()
+app.add_middleware(diagnostics.DiagnosticsMiddleware)
+# Opt-in per-request CPU/allocation profiles (X-Profile header with the admin token)
+app.add_middleware(profiling.ProfilingMiddleware)
+# GET requests read from the replica when one is configured (DATABASE_READ_URL / AZURE_SQL_READ_SCALE_OUT)
+if connection.read_engine is not None:
+    app.add_middleware(replica.ReplicaRoutingMiddleware)
+# Retried POST/PUT with the same Idempotency-Key get the first response back
+app.add_middleware(idempotency.IdempotencyMiddleware)
+# Outermost: request ids for every log line (and the X-Request-ID response header)
+app.add_middleware(log.RequestIdMiddleware)
+
 # CORS Middleware is commented out, which is correct for SWA proxy
 # app.add_middleware(
 #     CORSMiddleware,
@@ -29,14 +83,22 @@ app = FastAPI(title="Service Company API")
 def read_root():
     return {"message": "Service Company API is running"}
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Include routers
 app.include_router(coches.router, prefix="/api")
 app.include_router(trabajadores.router, prefix="/api")
 app.include_router(trabajos.router, prefix="/api")
 app.include_router(formularios.router, prefix="/api")
 app.include_router(query.router, prefix="/api")
-# app.include_router(statistics.router, prefix="/api")
+app.include_router(statistics.router, prefix="/api")
 app.include_router(incidencias.router, prefix="/api")
+app.include_router(search.router, prefix="/api")
+app.include_router(sync.router, prefix="/api")
+app.include_router(batch.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,10 +1,20 @@
-from sqlalchemy import Column, Boolean, Integer, String, Float, ForeignKey, DateTime
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Boolean, Integer, String, Float, ForeignKey, DateTime, event
 from sqlalchemy.orm import relationship
 
+from app.database import sync_triggers
 from app.database.connection import Base
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class Tracked:
+    """Change tracking for GET /sync: updated_at (UTC) is set on every insert and update."""
+    updated_at = Column(DateTime, nullable=False, default=utcnow, onupdate=utcnow, index=True)
+
 # Define models according to ER diagram
-class Coche(Base):
+class Coche(Tracked, Base):
     __tablename__ = "coches"
     
     placa = Column(Integer, unique=True, nullable=False)
@@ -15,7 +25,7 @@ class Coche(Base):
     formularios_trabajo = relationship("FormularioTrabajo", back_populates="coche")
     incidencias = relationship("Incidencia", back_populates="coche", foreign_keys="Incidencia.id_coche")
 
-class Trabajador(Base):
+class Trabajador(Tracked, Base):
     __tablename__ = "trabajadores"
     
     dni = Column(Integer, primary_key=True, index=True)
@@ -28,7 +38,7 @@ class Trabajador(Base):
     formularios_coche = relationship("FormularioCoche", back_populates="trabajador")
     formularios_trabajo = relationship("FormularioTrabajo", back_populates="trabajador")
 
-class Trabajo(Base):
+class Trabajo(Tracked, Base):
     __tablename__ = "trabajos"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -39,7 +49,7 @@ class Trabajo(Base):
     formulario_coche = relationship("FormularioCoche", back_populates="trabajo", uselist=False)
     formulario_trabajo = relationship("FormularioTrabajo", back_populates="trabajo", uselist=False)
 
-class FormularioCoche(Base):
+class FormularioCoche(Tracked, Base):
     __tablename__ = "formularios_coche"
     
     id_coche = Column(Integer, ForeignKey("coches.ID"), primary_key=True)
@@ -55,7 +65,7 @@ class FormularioCoche(Base):
     trabajador = relationship("Trabajador", back_populates="formularios_coche")
     trabajo = relationship("Trabajo", back_populates="formulario_coche")
 
-class FormularioTrabajo(Base):
+class FormularioTrabajo(Tracked, Base):
     __tablename__ = "formularios_trabajo"
     
     id_coche = Column(Integer, ForeignKey("coches.ID"), primary_key=True)
@@ -74,7 +84,7 @@ class FormularioTrabajo(Base):
     trabajo = relationship("Trabajo", back_populates="formulario_trabajo") 
 
 
-class Incidencia(Base):
+class Incidencia(Tracked, Base):
     __tablename__ = "incidencias"
     
     id_incidencia = Column(Integer, primary_key=True, index=True)
@@ -86,4 +96,18 @@ class Incidencia(Base):
     id_mecanico = Column(Integer, ForeignKey("trabajadores.dni"), nullable=True)
     fecha_resolucion = Column(DateTime, nullable=True)
 
-    coche = relationship("Coche", back_populates="incidencias", foreign_keys=[id_coche])
\ No newline at end of file
+    coche = relationship("Coche", back_populates="incidencias", foreign_keys=[id_coche])
+
+
+class SyncDeletion(Base):
+    """Deletion log for GET /sync, written by delete triggers (app/database/sync_triggers.py; existing
+    databases get them from database_management/migrate_sync_tracking.py)."""
+    __tablename__ = "sync_deletions"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String(64), nullable=False)
+    row_key = Column(String(255), nullable=False)  # primary key values joined with ":"
+    deleted_at = Column(DateTime, nullable=False, default=utcnow, index=True)
+
+# create_tables() and every other create_all() on these models also create the delete triggers
+event.listen(Base.metadata, "after_create", sync_triggers.create_sync_triggers)
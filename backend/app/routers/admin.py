@@ -0,0 +1,81 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from typing import Optional
+import hmac
+import os
+
+from app.services import ingest_outbox, reference_cache
+from app.utils import diagnostics, profiling, singleflight
+from app.utils.cache import cache
+
+# Operational endpoints. Disabled (404) unless ADMIN_TOKEN is set; requests must
+# send the same value in the X-Admin-Token header.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/cache")
+def get_cache_stats():
+    """Hit/miss/eviction counters per cache namespace (this worker) and of the reference-table cache."""
+    return {
+        **cache.stats(),
+        "reference_cache": {
+            table.name: {"hits": table.hits, "misses": table.misses} for table in reference_cache.TABLES
+        },
+    }
+
+@router.delete("/cache/{namespace}")
+def clear_cache_namespace(namespace: str):
+    """Drop every entry of a cache namespace (on all workers for the shared backends)."""
+    cache.namespace(namespace).clear()
+    return {"cleared": namespace}
+
+@router.get("/ingest")
+def get_ingest_status():
+    """Form-submission outbox: queue depth, lag of the oldest pending entry, dead entries, committer state."""
+    return {**ingest_outbox.outbox.status(), "dead_entries": ingest_outbox.outbox.dead_entries()}
+
+@router.post("/ingest/{seq}/retry")
+def retry_ingest_entry(seq: int):
+    """Queue a dead outbox entry again (e.g. once the missing coche or trabajo has been created)."""
+    try:
+        retried = ingest_outbox.outbox.retry(seq)
+    except Exception as e:
+        raise HTTPException(status_code=409, detail=f"Entry {seq} cannot be retried: {e}")
+    if not retried:
+        raise HTTPException(status_code=404, detail="Dead entry not found")
+    return {"retried": seq}
+
+@router.get("/coalescing")
+def get_coalescing_stats():
+    """Per group: requests, database executions, requests that joined an in-flight call or hit the micro-TTL."""
+    return singleflight.stats()
+
+@router.get("/queries")
+def get_query_diagnostics():
+    """Recent slow queries (with plans), N+1 suspects and query-budget overruns on this worker."""
+    return diagnostics.report()
+
+@router.get("/profiles")
+def list_profiles():
+    """Stored request profiles (see app/utils/profiling.py), newest first."""
+    return profiling.list_profiles()
+
+@router.get("/profiles/{name}")
+def download_profile(name: str):
+    """One profile file: .speedscope.json, .pstats, .tracemalloc or the .json summary."""
+    path = profiling.profile_file(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=name)
@@ -0,0 +1,115 @@
+"""
+POST /api/batch: several GET requests in one round trip.
+
+A page that needs several lists at load time (the form pages: coches,
+trabajadores, available trabajos) sends them as one batch. Each sub-request
+goes through the whole app, middlewares included (metrics, replica routing,
+request id), exactly as if it had been sent on its own, but all of them
+share one database session and so one pooled connection.
+
+A Session cannot be used by two requests at once, so the sub-requests run
+one after another. They wait for their turn here, on the event loop: had
+they waited inside get_db, each would hold a threadpool thread while the
+one with the session needs another to run its endpoint, and enough
+concurrent batches would hang the worker. The gain is one round trip and
+one pool checkout per page load, not parallel queries.
+
+Results come back in request order as {"status", "body"}; a failed
+sub-request does not fail the batch.
+"""
+import logging
+import os
+from urllib.parse import urlencode
+
+import orjson
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from app.database import connection
+from app.schemas.schemas import BatchRequest, BatchSubRequest
+from app.utils import log
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+
+# Never finish, or would nest batches
+NOT_BATCHABLE = frozenset({"/api/batch", "/api/batch/", "/api/incidencias/stream"})
+# Outer request headers the sub-requests do not inherit
+DROPPED_HEADERS = frozenset({
+    b"content-length", b"content-type", b"transfer-encoding", b"expect", b"idempotency-key", log.REQUEST_ID_HEADER,
+})
+# ASGI scope keys copied from the outer request (not its route, endpoint or dependency state)
+SCOPE_KEYS = ("type", "asgi", "http_version", "scheme", "root_path", "client", "server")
+
+router = APIRouter(
+    prefix="/batch",
+    tags=["batch"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+async def _run(request: Request, headers: list, sub: BatchSubRequest) -> bytes:
+    """Run one sub-request through the app and encode its result."""
+    scope = {key: request.scope[key] for key in SCOPE_KEYS if key in request.scope}
+    scope.update(
+        method="GET",
+        path=sub.path,
+        raw_path=sub.path.encode(),
+        query_string=urlencode(sub.params or {}, doseq=True).encode(),
+        headers=headers,
+    )
+    response = {"status": 500, "json": False, "body": []}
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return await request.receive()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            for name, value in message.get("headers", []):
+                if name.lower() == b"content-type":
+                    response["json"] = value.startswith(b"application/json")
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    try:
+        await request.app(scope, receive, send)
+    except Exception:
+        # The app's error middleware answered with a 500 and re-raised for the server to log
+        logger.exception("Batch sub-request GET %s failed", sub.path)
+        response["status"] = 500
+    body = b"".join(response["body"])
+    if not (response["json"] and body):
+        body = orjson.dumps(body.decode("utf-8", "replace") if body else None)
+    return b'{"status":%d,"body":%s}' % (response["status"], body)
+
+
+@router.post("/")
+async def run_batch(batch: BatchRequest, request: Request):
+    """
+    Runs GET sub-requests ({"method": "GET", "path": "/api/coches/", "params": {...}})
+    over one database session and returns their results in order.
+    """
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"Como máximo {BATCH_MAX_REQUESTS} peticiones por lote")
+    for sub in batch.requests:
+        if sub.method.upper() != "GET":
+            raise HTTPException(status_code=400, detail=f"Solo se admiten peticiones GET en un lote: {sub.method} {sub.path}")
+        if not sub.path.startswith("/api/") or sub.path in NOT_BATCHABLE:
+            raise HTTPException(status_code=400, detail=f"Ruta no admitida en un lote: {sub.path}")
+
+    headers = [(name, value) for name, value in request.scope["headers"] if name.lower() not in DROPPED_HEADERS]
+    rid = log.request_id.get()
+    if rid:
+        headers.append((log.REQUEST_ID_HEADER, rid.encode()))  # sub-requests log under the batch's id
+
+    with connection.shared_session():
+        results = [await _run(request, headers, sub) for sub in batch.requests]
+    return Response(content=b'{"results":[%s]}' % b",".join(results), media_type="application/json",
+                    headers={"Cache-Control": "no-store"})
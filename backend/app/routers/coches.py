@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List, Dict
 
 from app.database.connection import get_db
 from app.models.models import Coche
 from app.schemas.schemas import CocheCreate, CocheUpdate, CocheOut
+from app.services import reference_cache, suggest_index
+from app.utils.conditional import conditional_response
+from app.utils.diagnostics import declare_query_budget
+from app.utils.serialization import columns_for, rows_response
 
 router = APIRouter(
     prefix="/coches",
@@ -13,6 +18,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=CocheOut)
+@declare_query_budget(5)
 def create_coche(coche: CocheCreate, db: Session = Depends(get_db)):
     existing_coche_id = db.query(Coche).filter(Coche.id_coche == coche.id_coche).first()
     if existing_coche_id:
@@ -29,12 +35,15 @@ def create_coche(coche: CocheCreate, db: Session = Depends(get_db)):
         db.add(db_coche)
         db.commit()
         db.refresh(db_coche)
+        suggest_index.safe_update(suggest_index.coches.upsert, db_coche)
+        reference_cache.safe_put(reference_cache.coches, db_coche)
         return db_coche
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=f"Error al crear coche: {str(e)}")
 
 @router.put("/{id_coche}", response_model=CocheOut)
+@declare_query_budget(5)
 def update_coche(id_coche: int, coche_update_data: CocheUpdate, db: Session = Depends(get_db)):
     try:
         db_coche = db.query(Coche).filter(Coche.id_coche == id_coche).first()
@@ -50,6 +59,8 @@ def update_coche(id_coche: int, coche_update_data: CocheUpdate, db: Session = De
         
         db.commit()
         db.refresh(db_coche)
+        suggest_index.safe_update(suggest_index.coches.upsert, db_coche)
+        reference_cache.safe_put(reference_cache.coches, db_coche)
         return db_coche
     except HTTPException as e:
         raise e
@@ -57,6 +68,20 @@ def update_coche(id_coche: int, coche_update_data: CocheUpdate, db: Session = De
         db.rollback()
         raise HTTPException(status_code=400, detail=f"Error al actualizar coche: {str(e)}")
 
+@router.get("/suggest", response_model=List[CocheOut])
+def suggest_coches(
+    q: str = Query("", description="Prefijo o fragmento de la placa o del ID"),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """
+    Typeahead over placa and id_coche, answered from an in-memory index.
+    """
+    try:
+        suggest_index.coches.ensure_fresh()
+        return suggest_index.coches.suggest(q, limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 @router.get("/{id_coche}", response_model=CocheOut)
 def get_coche(id_coche: int, db: Session = Depends(get_db)):
     db_coche = db.query(Coche).filter(Coche.id_coche == id_coche).first()
@@ -66,6 +91,8 @@ def get_coche(id_coche: int, db: Session = Depends(get_db)):
     return db_coche
 
 @router.get("/", response_model=List[CocheOut])
-def get_all_coches(db: Session = Depends(get_db)):
-    coches = db.query(Coche).all()
-    return coches 
\ No newline at end of file
+def get_all_coches(request: Request, db: Session = Depends(get_db)):
+    return conditional_response(
+        request, "coches", lambda: rows_response(db.execute(select(*columns_for(Coche, CocheOut)))),
+        db=db, model=Coche,
+    )
@@ -1,102 +1,129 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List
 import logging
-import sys
-import traceback
 
 from app.database.connection import get_db
-from app.models.models import FormularioCoche, FormularioTrabajo, Coche, Trabajador, Trabajo
-from app.schemas.schemas import FormularioCocheCreate, FormularioTrabajoCreate, FormularioCocheOut, FormularioTrabajoOut, parse_date
-from app.routers.incidencias import determine_incidencia, save_incidencia
+from app.models.models import FormularioCoche, FormularioTrabajo
+from app.schemas.schemas import FormularioCocheCreate, FormularioTrabajoCreate, FormularioCocheOut, FormularioTrabajoOut
+from app.routers.incidencias import determine_incidencia, incidencia_saved, save_incidencia
+from app.services.analytics_snapshot import snapshot as analytics_snapshot
+from app.services import ingest_outbox, reference_cache, search_index, suggest_index
+from app.utils import log, versions
+from app.utils.diagnostics import declare_query_budget
+from app.utils.serialization import ORJSONResponse, columns_for, rows_response
 
-# Configure logging for Azure Web App
+# Output (stdout, which Azure captures) is configured by app.utils.log
 logger = logging.getLogger("sepcan_marina")
-logger.setLevel(logging.DEBUG)
-
-# Add StreamHandler to ensure logs go to stdout/stderr which Azure captures
-if not logger.handlers:
-    handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
 
 router = APIRouter(
     tags=["formularios"],
     responses={404: {"description": "Not found"}},
 )
 
+# Answers when a submission goes to the ingest outbox (app/services/ingest_outbox.py)
+COCHE_QUEUED_MESSAGE = "Formulario de coche recibido; se guardará en cuanto la base de datos responda"
+TRABAJO_QUEUED_MESSAGE = "Formulario de trabajo recibido; se guardará en cuanto la base de datos responda"
+COCHE_CONFLICT_DETAIL = "Este trabajo ya tiene otro formulario de coche pendiente de guardar"
+TRABAJO_CONFLICT_DETAIL = "Este trabajo ya tiene otro formulario de trabajo pendiente de guardar"
+
+def _new_formulario_coche(formulario: FormularioCocheCreate) -> FormularioCoche:
+    return FormularioCoche(
+        id_coche=formulario.id_coche,
+        dni_trabajador=formulario.dni_trabajador,
+        id_trabajo=formulario.id_trabajo,
+        otros=formulario.otros,
+        fecha=formulario.parsed_date("fecha"),  # parsed when the payload was validated
+        hora_partida=formulario.hora_partida,
+        estado_coche=formulario.estado_coche
+    )
+
+def _new_formulario_trabajo(formulario: FormularioTrabajoCreate) -> FormularioTrabajo:
+    return FormularioTrabajo(
+        id_coche=formulario.id_coche,
+        dni_trabajador=formulario.dni_trabajador,
+        id_trabajo=formulario.id_trabajo,
+        otros=formulario.otros,
+        fecha=formulario.parsed_date("fecha"),  # parsed when the payload was validated
+        hora_final=formulario.hora_final,
+        horas_trabajadas=formulario.horas_trabajadas,
+        lugar_trabajo=formulario.lugar_trabajo,
+        tiempo_llegada=formulario.tiempo_llegada
+    )
+
+def _queue_formulario(kind: str, formulario, message: str, conflict_detail: str):
+    """Accept a submission into the ingest outbox (202); the committer stores it later."""
+    try:
+        receipt = ingest_outbox.outbox.enqueue(kind, formulario)
+    except ingest_outbox.Conflict:
+        raise HTTPException(status_code=400, detail=conflict_detail)
+    logger.info("%s for trabajo_id=%s queued as ingest entry %s%s", kind, formulario.id_trabajo, receipt.seq,
+                " (repeated submission)" if receipt.duplicate else "")
+    return ORJSONResponse(status_code=202, content={
+        "success": True,
+        "queued": True,
+        "ingest_id": receipt.seq,
+        "message": message,
+    })
+
 # Formulario Coche endpoints
 @router.post("/formulario-coche/", response_model=dict)
+@declare_query_budget(8)
 def create_formulario_coche(formulario: FormularioCocheCreate, db: Session = Depends(get_db)):
+    if ingest_outbox.should_queue():
+        return _queue_formulario("formulario_coche", formulario, COCHE_QUEUED_MESSAGE, COCHE_CONFLICT_DETAIL)
+    saved = False
     try:
         # Add logging for incoming data
         logger.info("Received FormularioCoche request")
-        logger.debug(f"id_coche: {formulario.id_coche}")
-        logger.debug(f"dni_trabajador: {formulario.dni_trabajador}")
-        logger.debug(f"id_trabajo: {formulario.id_trabajo}")
-        logger.debug(f"fecha: {formulario.fecha}")
+        logger.debug("FormularioCoche payload", extra=log.fields(formulario=formulario))
         
         # Check if coche exists by id_coche
-        coche = db.query(Coche).filter(Coche.id_coche == formulario.id_coche).first()
+        coche = reference_cache.coches.get(db, formulario.id_coche)
         if not coche:
-            logger.error(f"Coche with id_coche={formulario.id_coche} not found")
+            logger.error("Coche with id_coche=%s not found", formulario.id_coche)
             raise HTTPException(status_code=404, detail="Coche no encontrado")
-        logger.debug(f"Coche found: {coche.id_coche}")
+        logger.debug("Coche found: %s", coche.id_coche)
         
         # Check if trabajador exists
-        trabajador = db.query(Trabajador).filter(Trabajador.dni == formulario.dni_trabajador).first()
+        trabajador = reference_cache.trabajadores.get(db, formulario.dni_trabajador)
         if not trabajador:
-            logger.error(f"Trabajador with dni={formulario.dni_trabajador} not found")
+            logger.error("Trabajador with dni=%s not found", formulario.dni_trabajador)
             raise HTTPException(status_code=404, detail="Trabajador no encontrado")
-        logger.debug(f"Trabajador found: {trabajador.dni}")
+        logger.debug("Trabajador found: %s", trabajador.dni)
         
         # Check if trabajo exists
-        trabajo = db.query(Trabajo).filter(Trabajo.id == formulario.id_trabajo).first()
+        trabajo = reference_cache.trabajos.get(db, formulario.id_trabajo)
         if not trabajo:
-            logger.error(f"Trabajo with id={formulario.id_trabajo} not found")
+            logger.error("Trabajo with id=%s not found", formulario.id_trabajo)
             raise HTTPException(status_code=404, detail="Trabajo no encontrado")
-        logger.debug(f"Trabajo found: {trabajo.id}")
+        logger.debug("Trabajo found: %s", trabajo.id)
         
         # Check if job already has a car formulary
         existing_formulario = db.query(FormularioCoche).filter(FormularioCoche.id_trabajo == formulario.id_trabajo).first()
         if existing_formulario:
-            logger.error(f"Trabajo with id={formulario.id_trabajo} already has a formulario coche")
+            logger.error("Trabajo with id=%s already has a formulario coche", formulario.id_trabajo)
             raise HTTPException(status_code=400, detail="Este trabajo ya tiene un formulario de coche asociado")
-        logger.debug(f"No existing formulario coche found for trabajo id={formulario.id_trabajo}")
-        
-        # Convert fecha string to datetime object if it exists
-        fecha_datetime = None
-        if formulario.fecha:
-            logger.debug(f"Processing fecha: {formulario.fecha}, type: {type(formulario.fecha)}")
-            try:
-                fecha_datetime = parse_date(formulario.fecha)
-                logger.debug(f"Converted fecha string '{formulario.fecha}' to datetime object: {fecha_datetime}")
-            except Exception as date_error:
-                logger.error(f"Error parsing fecha: {str(date_error)}")
-                raise HTTPException(status_code=400, detail=f"Error al procesar la fecha: {str(date_error)}")
+        logger.debug("No existing formulario coche found for trabajo id=%s", formulario.id_trabajo)
         
         # Create formulario
-        logger.debug(f"Creating FormularioCoche object")
-        db_formulario = FormularioCoche(
-            id_coche=formulario.id_coche,
-            dni_trabajador=formulario.dni_trabajador,
-            id_trabajo=formulario.id_trabajo,
-            otros=formulario.otros,
-            fecha=fecha_datetime,  # Use the datetime object instead of string
-            hora_partida=formulario.hora_partida,
-            estado_coche=formulario.estado_coche
-        )
-        logger.debug(f"FormularioCoche object created successfully")
+        logger.debug("Creating FormularioCoche object")
+        db_formulario = _new_formulario_coche(formulario)
+        logger.debug("FormularioCoche object created successfully")
         
         # Add to database and commit
-        logger.debug(f"Adding FormularioCoche to database")
+        logger.debug("Adding FormularioCoche to database")
         db.add(db_formulario)
-        logger.debug(f"Committing transaction")
+        logger.debug("Committing transaction")
         db.commit()
-        logger.debug(f"Refreshing object from database")
+        saved = True
+        logger.debug("Refreshing object from database")
         db.refresh(db_formulario)
-        logger.debug(f"FormularioCoche successfully added to database")
+        logger.debug("FormularioCoche successfully added to database")
+        search_index.safe_index(search_index.index.index_formulario_coche, db_formulario)
+        suggest_index.safe_update(suggest_index.trabajos.set_flag, formulario.id_trabajo, "coche")
+        versions.safe_bump("formularios")
         
         # Automatically check for incidences
         severity_num, severity_name = determine_incidencia(formulario)
@@ -129,129 +156,164 @@ def create_formulario_coche(formulario: FormularioCocheCreate, db: Session = Dep
         raise e
     except Exception as e:
         db.rollback()
+        if not saved and ingest_outbox.can_fall_back(e):
+            logger.warning("Database unavailable, queueing FormularioCoche: %s", e)
+            return _queue_formulario("formulario_coche", formulario, COCHE_QUEUED_MESSAGE, COCHE_CONFLICT_DETAIL)
         raise HTTPException(status_code=400, detail=f"Error al crear formulario de coche: {str(e)}")
 
 @router.get("/formularios-coche/", response_model=List[FormularioCocheOut])
 def get_all_formularios_coche(db: Session = Depends(get_db)):
     try:
-        formularios = db.query(FormularioCoche).all()
-        return formularios
+        return rows_response(db.execute(select(*columns_for(FormularioCoche, FormularioCocheOut))))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error al obtener formularios de coche: {str(e)}")
 
 # Formulario Trabajo endpoints
 @router.post("/formulario-trabajo/", response_model=dict)
+@declare_query_budget(6)
 def create_formulario_trabajo(formulario: FormularioTrabajoCreate, db: Session = Depends(get_db)):
+    if ingest_outbox.should_queue():
+        return _queue_formulario("formulario_trabajo", formulario, TRABAJO_QUEUED_MESSAGE, TRABAJO_CONFLICT_DETAIL)
+    saved = False
     try:
         # Enhanced logging for incoming data
         logger.info("Received FormularioTrabajo request")
-        logger.debug(f"id_coche: {formulario.id_coche}")
-        logger.debug(f"dni_trabajador: {formulario.dni_trabajador}")
-        logger.debug(f"id_trabajo: {formulario.id_trabajo}")
-        logger.debug(f"fecha: {formulario.fecha}")
-        logger.debug(f"hora_final: {formulario.hora_final}")
-        logger.debug(f"horas_trabajadas: {formulario.horas_trabajadas} (type: {type(formulario.horas_trabajadas)})")
-        logger.debug(f"lugar_trabajo: {formulario.lugar_trabajo}")
-        logger.debug(f"tiempo_llegada: {formulario.tiempo_llegada} (type: {type(formulario.tiempo_llegada)})")
-        logger.debug(f"otros: {formulario.otros}")
+        logger.debug("FormularioTrabajo payload", extra=log.fields(formulario=formulario))
         
         # Check if coche exists by id_coche
-        logger.debug(f"Checking if coche with id_coche={formulario.id_coche} exists")
-        coche = db.query(Coche).filter(Coche.id_coche == formulario.id_coche).first()
+        logger.debug("Checking if coche with id_coche=%s exists", formulario.id_coche)
+        coche = reference_cache.coches.get(db, formulario.id_coche)
         if not coche:
-            logger.error(f"Coche with id_coche={formulario.id_coche} not found")
+            logger.error("Coche with id_coche=%s not found", formulario.id_coche)
             raise HTTPException(status_code=404, detail="Coche no encontrado")
-        logger.debug(f"Coche found: {coche.id_coche}")
+        logger.debug("Coche found: %s", coche.id_coche)
         
         # Check if trabajador exists
-        logger.debug(f"Checking if trabajador with dni={formulario.dni_trabajador} exists")
-        trabajador = db.query(Trabajador).filter(Trabajador.dni == formulario.dni_trabajador).first()
+        logger.debug("Checking if trabajador with dni=%s exists", formulario.dni_trabajador)
+        trabajador = reference_cache.trabajadores.get(db, formulario.dni_trabajador)
         if not trabajador:
-            logger.error(f"Trabajador with dni={formulario.dni_trabajador} not found")
+            logger.error("Trabajador with dni=%s not found", formulario.dni_trabajador)
             raise HTTPException(status_code=404, detail="Trabajador no encontrado")
-        logger.debug(f"Trabajador found: {trabajador.dni}")
+        logger.debug("Trabajador found: %s", trabajador.dni)
         
         # Check if trabajo exists
-        logger.debug(f"Checking if trabajo with id={formulario.id_trabajo} exists")
-        trabajo = db.query(Trabajo).filter(Trabajo.id == formulario.id_trabajo).first()
+        logger.debug("Checking if trabajo with id=%s exists", formulario.id_trabajo)
+        trabajo = reference_cache.trabajos.get(db, formulario.id_trabajo)
         if not trabajo:
-            logger.error(f"Trabajo with id={formulario.id_trabajo} not found")
+            logger.error("Trabajo with id=%s not found", formulario.id_trabajo)
             raise HTTPException(status_code=404, detail="Trabajo no encontrado")
-        logger.debug(f"Trabajo found: {trabajo.id}")
+        logger.debug("Trabajo found: %s", trabajo.id)
         
         # Check if job already has a job formulary
-        logger.debug(f"Checking if trabajo already has a formulario")
+        logger.debug("Checking if trabajo already has a formulario")
         existing_formulario = db.query(FormularioTrabajo).filter(FormularioTrabajo.id_trabajo == formulario.id_trabajo).first()
         if existing_formulario:
-            logger.error(f"Trabajo with id={formulario.id_trabajo} already has a formulario")
+            logger.error("Trabajo with id=%s already has a formulario", formulario.id_trabajo)
             raise HTTPException(status_code=400, detail="Este trabajo ya tiene un formulario de trabajo asociado")
-        logger.debug(f"No existing formulario found for trabajo id={formulario.id_trabajo}")
-        
-        # Log date conversion if applicable
-        if formulario.fecha:
-            logger.debug(f"Processing fecha: {formulario.fecha}, type: {type(formulario.fecha)}")
-            try:
-                parsed_date = parse_date(formulario.fecha)
-                logger.debug(f"Parsed fecha: {parsed_date}")
-            except Exception as date_error:
-                logger.error(f"Error parsing fecha: {str(date_error)}")
-                raise HTTPException(status_code=400, detail=f"Error al procesar la fecha: {str(date_error)}")
+        logger.debug("No existing formulario found for trabajo id=%s", formulario.id_trabajo)
         
         # Create formulario
-        logger.debug(f"Creating FormularioTrabajo object")
+        logger.debug("Creating FormularioTrabajo object")
         try:
-            # Convert fecha string to datetime object if it exists
-            fecha_datetime = None
-            if formulario.fecha:
-                fecha_datetime = parse_date(formulario.fecha)
-                logger.debug(f"Converted fecha string '{formulario.fecha}' to datetime object: {fecha_datetime}")
-            
-            db_formulario = FormularioTrabajo(
-                id_coche=formulario.id_coche,
-                dni_trabajador=formulario.dni_trabajador,
-                id_trabajo=formulario.id_trabajo,
-                otros=formulario.otros,
-                fecha=fecha_datetime,  # Use the datetime object instead of string
-                hora_final=formulario.hora_final,
-                horas_trabajadas=formulario.horas_trabajadas,
-                lugar_trabajo=formulario.lugar_trabajo,
-                tiempo_llegada=formulario.tiempo_llegada
-            )
-            logger.debug(f"FormularioTrabajo object created successfully")
+            db_formulario = _new_formulario_trabajo(formulario)
+            logger.debug("FormularioTrabajo object created successfully")
         except Exception as obj_error:
-            logger.error(f"Error creating FormularioTrabajo object: {str(obj_error)}")
+            logger.error("Error creating FormularioTrabajo object: %s", obj_error)
             raise
         
         # Add to database
-        logger.debug(f"Adding FormularioTrabajo to database")
+        logger.debug("Adding FormularioTrabajo to database")
         try:
             db.add(db_formulario)
-            logger.debug(f"Committing transaction")
+            logger.debug("Committing transaction")
             db.commit()
-            logger.debug(f"Refreshing object from database")
+            saved = True
+            logger.debug("Refreshing object from database")
             db.refresh(db_formulario)
-            logger.debug(f"FormularioTrabajo successfully added to database")
+            logger.debug("FormularioTrabajo successfully added to database")
         except Exception as db_error:
-            logger.error(f"Database error: {str(db_error)}")
+            logger.error("Database error: %s", db_error)
             raise
         
-        logger.info(f"FormularioTrabajo created successfully for trabajo_id={formulario.id_trabajo}")
+        # Keep the analytics snapshot current without waiting for its next refresh
+        analytics_snapshot.ingest_formulario_trabajo(db_formulario, trabajo)
+        search_index.safe_index(search_index.index.index_formulario_trabajo, db_formulario)
+        suggest_index.safe_update(suggest_index.trabajos.set_flag, formulario.id_trabajo, "trabajo")
+        versions.safe_bump("formularios")
+        
+        logger.info("FormularioTrabajo created successfully for trabajo_id=%s", formulario.id_trabajo)
         return {"success": True, "message": "Formulario de trabajo creado exitosamente"}
     except HTTPException as http_e:
         db.rollback()
-        logger.error(f"HTTP exception: {http_e.detail}")
+        logger.error("HTTP exception: %s", http_e.detail)
         raise http_e
     except Exception as e:
         db.rollback()
-        logger.error(f"Unhandled exception: {str(e)}")
-        logger.error(f"Exception type: {type(e)}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        if not saved and ingest_outbox.can_fall_back(e):
+            logger.warning("Database unavailable, queueing FormularioTrabajo: %s", e)
+            return _queue_formulario("formulario_trabajo", formulario, TRABAJO_QUEUED_MESSAGE, TRABAJO_CONFLICT_DETAIL)
+        logger.exception("Unhandled exception creating FormularioTrabajo")
         raise HTTPException(status_code=400, detail=f"Error al crear formulario de trabajo: {str(e)}")
 
 @router.get("/formularios-trabajo/", response_model=List[FormularioTrabajoOut])
 def get_all_formularios_trabajo(db: Session = Depends(get_db)):
     try:
-        formularios = db.query(FormularioTrabajo).all()
-        return formularios
+        return rows_response(db.execute(select(*columns_for(FormularioTrabajo, FormularioTrabajoOut))))
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error al obtener formularios de trabajo: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=f"Error al obtener formularios de trabajo: {str(e)}")
+
+# Ingest outbox handlers: the committer applies queued forms with the same checks and
+# post-commit hooks as the endpoints above, in grouped transactions
+def _check_references(db: Session, formulario):
+    if not reference_cache.coches.get(db, formulario.id_coche):
+        raise ingest_outbox.Rejected("Coche no encontrado")
+    if not reference_cache.trabajadores.get(db, formulario.dni_trabajador):
+        raise ingest_outbox.Rejected("Trabajador no encontrado")
+    if not reference_cache.trabajos.get(db, formulario.id_trabajo):
+        raise ingest_outbox.Rejected("Trabajo no encontrado")
+
+def _same_form(existing, formulario) -> bool:
+    # A resubmission of a form that reached the database before its answer reached the phone
+    return (existing.id_coche, existing.dni_trabajador) == (formulario.id_coche, formulario.dni_trabajador)
+
+def _apply_formulario_coche(db: Session, formulario: FormularioCocheCreate) -> bool:
+    _check_references(db, formulario)
+    existing = db.query(FormularioCoche).filter(FormularioCoche.id_trabajo == formulario.id_trabajo).first()
+    if existing:
+        if _same_form(existing, formulario):
+            return False
+        raise ingest_outbox.Rejected("Este trabajo ya tiene un formulario de coche asociado")
+    db.add(_new_formulario_coche(formulario))
+    return True
+
+def _after_formulario_coche(db: Session, formulario: FormularioCocheCreate):
+    db_formulario = db.query(FormularioCoche).filter(FormularioCoche.id_trabajo == formulario.id_trabajo).first()
+    search_index.safe_index(search_index.index.index_formulario_coche, db_formulario)
+    suggest_index.safe_update(suggest_index.trabajos.set_flag, formulario.id_trabajo, "coche")
+    versions.safe_bump("formularios")
+    if incidencia_saved(db, formulario):
+        return
+    severity_num, severity_name = determine_incidencia(formulario)
+    save_incidencia(db, formulario, severity_num, severity_name)
+
+def _apply_formulario_trabajo(db: Session, formulario: FormularioTrabajoCreate) -> bool:
+    _check_references(db, formulario)
+    existing = db.query(FormularioTrabajo).filter(FormularioTrabajo.id_trabajo == formulario.id_trabajo).first()
+    if existing:
+        if _same_form(existing, formulario):
+            return False
+        raise ingest_outbox.Rejected("Este trabajo ya tiene un formulario de trabajo asociado")
+    db.add(_new_formulario_trabajo(formulario))
+    return True
+
+def _after_formulario_trabajo(db: Session, formulario: FormularioTrabajoCreate):
+    db_formulario = db.query(FormularioTrabajo).filter(FormularioTrabajo.id_trabajo == formulario.id_trabajo).first()
+    analytics_snapshot.ingest_formulario_trabajo(db_formulario, reference_cache.trabajos.get(db, formulario.id_trabajo))
+    search_index.safe_index(search_index.index.index_formulario_trabajo, db_formulario)
+    suggest_index.safe_update(suggest_index.trabajos.set_flag, formulario.id_trabajo, "trabajo")
+    versions.safe_bump("formularios")
+
+ingest_outbox.register("formulario_coche", FormularioCocheCreate, key=lambda f: f.id_trabajo,
+                       apply=_apply_formulario_coche, after_commit=_after_formulario_coche)
+ingest_outbox.register("formulario_trabajo", FormularioTrabajoCreate, key=lambda f: f.id_trabajo,
+                       apply=_apply_formulario_trabajo, after_commit=_after_formulario_trabajo)
@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List
-from google import genai
 from datetime import datetime
-from app.schemas.schemas import FormularioCocheCreate, IncidenciaCreate, IncidenciaOut, parse_date, format_date
-from app.models.models import Incidencia, Trabajador
+from app.schemas.schemas import FormularioCocheCreate, IncidenciaCreate, IncidenciaOut, IncidenciaSimilarOut
+from app.models.models import Incidencia
 from app.database.connection import get_db
+from app.services import incident_vectors, incidencia_feed, reference_cache, search_index
+from app.utils import metrics, singleflight, versions
+from app.utils.cache import cache
+from app.utils.conditional import conditional_response
+from app.utils.diagnostics import declare_query_budget
+from app.utils.serialization import columns_for, encode_rows
+import hashlib
+import logging
 import os
 from dotenv import load_dotenv
 
@@ -17,13 +26,41 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+logger = logging.getLogger(__name__)
+
 GemmaKey = os.getenv("GEMMA_KEY")
+# Alternative Gemini endpoint (the fake server of benchmarks/fake_gemini.py in load tests)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+
+# Classifications depend only on the form's free text, which repeats a lot
+# ("Ninguno", "Limpio"...), so identical texts reuse the previous answer.
+classification_cache = cache.namespace("incidencia_llm")
+CLASSIFICATION_TTL = float(os.getenv("INCIDENCIA_CACHE_TTL", str(7 * 24 * 3600)))
+
+_gemini_client = None
+
+def _get_gemini_client():
+    """Gemini client, created on the first classification (google.genai takes ~0.4 s to import)."""
+    global _gemini_client
+    if _gemini_client is None:
+        from google import genai
+        _gemini_client = genai.Client(api_key=GemmaKey, http_options={"base_url": GEMINI_BASE_URL} if GEMINI_BASE_URL else None)
+    return _gemini_client
+
+def _classification_key(formulario: FormularioCocheCreate) -> str:
+    text = f"{(formulario.otros or '').strip()}\x1f{(formulario.estado_coche or '').strip()}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 def determine_incidencia(formulario: FormularioCocheCreate):
     """
     Determine if there's an incidence based on the car form data using Gemini AI.
     Returns a tuple of (severity_level: int, severity_name: str)
     """
+    cache_key = _classification_key(formulario)
+    cached = classification_cache.get(cache_key)
+    if cached is not None:
+        return tuple(cached)
+
     query = f"""Tenemos el coche {formulario.id_coche} y tenemos la siguiente informacion: {formulario.otros}
                 (Si no hay información, significa que el empleado no encontró nada que comentar).
                 También contamos con información sobre el estado de limpieza del coche: {formulario.estado_coche}.
@@ -42,14 +79,15 @@ def determine_incidencia(formulario: FormularioCocheCreate):
                 Debes devolver ÚNICAMENTE el nivel de incidencia. NO DEVUELVAS NADA MÁS.
     """
 
-    client = genai.Client(api_key=GemmaKey)
+    client = _get_gemini_client()
 
-    response = client.models.generate_content(
-        model="gemini-2.0-flash", contents=query
-    )
+    with metrics.llm_timer():
+        response = client.models.generate_content(
+            model="gemini-2.0-flash", contents=query
+        )
     
     severity_level = response.text.strip()
-    print(f"Severity level from AI: {severity_level}")
+    logger.debug("Severity level from AI: %s", severity_level)
     
     # Map severity level to descriptive name
     severity_names = {
@@ -64,12 +102,31 @@ def determine_incidencia(formulario: FormularioCocheCreate):
     try:
         severity_num = int(severity_level)
         severity_name = severity_names.get(str(severity_num), "Desconocida")
+        classification_cache.set(cache_key, (severity_num, severity_name), ttl=CLASSIFICATION_TTL)
         return severity_num, severity_name
     except ValueError:
         # If we can't parse it as a number, return a default
-        print(f"Could not parse severity level: {severity_level}")
+        logger.warning("Could not parse severity level: %r", severity_level)
         return 4, "Nula"  # Default to no incidence
 
+def _descripcion(formulario: FormularioCocheCreate) -> str:
+    # The description string combining car state and other comments
+    return f"Estado del Coche: {formulario.estado_coche or 'No especificado'}. Otros Comentarios: {formulario.otros or 'Ninguno'}"
+
+def incidencia_saved(db: Session, formulario: FormularioCocheCreate) -> bool:
+    """
+    Whether the incidence of this form is already stored (the ingest outbox runs a
+    form's hooks again after a crash or a failed hook). Only forms with a date can be matched.
+    """
+    fecha = formulario.parsed_date("fecha")
+    if fecha is None:
+        return False
+    return db.query(Incidencia.id_incidencia).filter(
+        Incidencia.id_coche == formulario.id_coche,
+        Incidencia.fecha == fecha,
+        Incidencia.descripcion == _descripcion(formulario),
+    ).first() is not None
+
 def save_incidencia(db: Session, formulario: FormularioCocheCreate, severity_num: int, severity_name: str):
     """
     Save an incidence in the database if severity level indicates one (0-3).
@@ -77,18 +134,10 @@ def save_incidencia(db: Session, formulario: FormularioCocheCreate, severity_num
     # Only save incidences for severity levels 0-3 (Crítica, Alta, Media, Baja)
     # Level 4 (Nula) means no incidence
     if severity_num < 4:
-        # Create the description string combining car state and other comments
-        descripcion = f"Estado del Coche: {formulario.estado_coche or 'No especificado'}. Otros Comentarios: {formulario.otros or 'Ninguno'}"
+        descripcion = _descripcion(formulario)
         
-        # Parse the date or use current date
-        current_date = datetime.now()
-        if formulario.fecha:
-            try:
-                fecha = parse_date(formulario.fecha)
-            except ValueError:
-                fecha = current_date
-        else:
-            fecha = current_date
+        # Use the form date (parsed during validation) or the current date
+        fecha = formulario.parsed_date("fecha") or datetime.now()
         
         incidencia = Incidencia(
             id_coche=formulario.id_coche,
@@ -101,6 +150,10 @@ def save_incidencia(db: Session, formulario: FormularioCocheCreate, severity_num
         db.add(incidencia)
         db.commit()
         db.refresh(incidencia)
+        search_index.safe_index(search_index.index.index_incidencia, incidencia)
+        incident_vectors.safe_add(incidencia)
+        versions.safe_bump("incidencias")
+        incidencia_feed.safe_publish(incidencia)
         return incidencia
     return None
 
@@ -134,17 +187,126 @@ def check_and_save_incidencia(formulario: FormularioCocheCreate, db: Session = D
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing incidence: {str(e)}")
 
+# Several office screens poll this list at once; identical refreshes share one query
+incidencias_flight = singleflight.group("get_all_incidencias")
+
+def _incidencias_json(db: Session) -> bytes:
+    result = db.execute(select(*columns_for(Incidencia, IncidenciaOut)))
+    return encode_rows(result, list(result.keys()))
+
 @router.get("/", response_model=List[IncidenciaOut])
-def get_all_incidencias(db: Session = Depends(get_db)):
+def get_all_incidencias(request: Request, db: Session = Depends(get_db)):
     """
-    Get all incidences from the database.
+    Get all incidences from the database (304 if the client's ETag is current).
     """
+    def build():
+        key = singleflight.make_key(version=versions.current("incidencias"))
+        body = incidencias_flight.do(key, lambda: _incidencias_json(db))
+        return Response(content=body, media_type="application/json")
+
     try:
-        incidencias = db.query(Incidencia).all()
-        return incidencias
+        return conditional_response(request, "incidencias", build, db=db, model=Incidencia)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving incidences: {str(e)}")
 
+# Comment lines keep proxies from closing an idle stream and reveal closed connections
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("INCIDENCIAS_STREAM_KEEPALIVE", "15"))
+STREAM_RETRY_MS = 3000
+
+@router.get("/stream", include_in_schema=False)
+async def stream_incidencias(request: Request):
+    """
+    Server-Sent Events: an `incidencia` event (the row, as in GET /incidencias/)
+    for every incidence created or resolved, and `reset` when the client must
+    reload the list because events were lost. Browsers resume with Last-Event-ID.
+    """
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    subscription, replay = incidencia_feed.broker.subscribe(last_event_id)
+    incidencia_feed.ensure_watcher()
+
+    async def events():
+        try:
+            yield b"retry: %d\n\n" % STREAM_RETRY_MS
+            if replay is None:
+                yield b"event: reset\ndata: {}\n\n"
+            else:
+                for event in replay:
+                    yield event.encode()
+            while True:
+                pending = await subscription.wait(STREAM_KEEPALIVE_SECONDS)
+                if pending is None:
+                    # Too far behind: its buffer was dropped, the client reloads the list
+                    yield b"event: reset\ndata: {}\n\n"
+                    continue
+                if not pending:
+                    yield b": keepalive\n\n"
+                for event in pending:
+                    yield event.encode()
+        finally:
+            incidencia_feed.broker.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",
+    })
+
+def _similar_out(db: Session, matches) -> List[IncidenciaSimilarOut]:
+    """Load the matched incidences and attach similarity and resolution time."""
+    ids = [id_incidencia for id_incidencia, _ in matches]
+    rows = {i.id_incidencia: i for i in db.query(Incidencia).filter(Incidencia.id_incidencia.in_(ids)).all()} if ids else {}
+    results = []
+    for id_incidencia, score in matches:
+        incidencia = rows.get(id_incidencia)
+        if incidencia is None:
+            continue  # deleted since it was indexed
+        horas = None
+        if incidencia.fecha and incidencia.fecha_resolucion:
+            horas = round((incidencia.fecha_resolucion - incidencia.fecha).total_seconds() / 3600, 2)
+        results.append(IncidenciaSimilarOut(
+            id_incidencia=incidencia.id_incidencia,
+            id_coche=incidencia.id_coche,
+            gravedad=incidencia.gravedad,
+            fecha=incidencia.fecha,
+            resuelta=incidencia.resuelta,
+            descripcion=incidencia.descripcion,
+            id_mecanico=incidencia.id_mecanico,
+            fecha_resolucion=incidencia.fecha_resolucion,
+            similitud=round(score, 4),
+            horas_resolucion=horas,
+        ))
+    return results
+
+@router.get("/similar", response_model=List[IncidenciaSimilarOut])
+def get_similar_to_text(
+    texto: str = Query(..., min_length=1, description="Descripción del problema"),
+    limit: int = Query(5, ge=1, le=50),
+    db: Session = Depends(get_db),
+):
+    """
+    Past incidences whose description is most similar to a free text
+    (e.g. the comments of a car form that is being filled in).
+    """
+    try:
+        incident_vectors.index.sync(db)
+        return _similar_out(db, incident_vectors.index.similar(text=texto, limit=limit))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching similar incidences: {str(e)}")
+
+@router.get("/{id_incidencia}/similar", response_model=List[IncidenciaSimilarOut])
+def get_similar_incidencias(id_incidencia: int, limit: int = Query(5, ge=1, le=50), db: Session = Depends(get_db)):
+    """
+    Past incidences (on any car) described most similarly to the given one,
+    with how long they took to resolve.
+    """
+    try:
+        incident_vectors.index.sync(db)
+        matches = incident_vectors.index.similar(id_incidencia=id_incidencia, limit=limit)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Incidencia not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching similar incidences: {str(e)}")
+    return _similar_out(db, matches)
+
 @router.get("/{id_incidencia}", response_model=IncidenciaOut)
 def get_incidencia(id_incidencia: int, db: Session = Depends(get_db)):
     """
@@ -156,6 +318,7 @@ def get_incidencia(id_incidencia: int, db: Session = Depends(get_db)):
     return incidencia
 
 @router.put("/{id_incidencia}/resolve", response_model=IncidenciaOut)
+@declare_query_budget(5)
 def resolve_incidencia(id_incidencia: int, id_mecanico: int = Query(..., description="The ID of the mechanic who resolved the issue"), db: Session = Depends(get_db)):
     """
     Mark an incidence as resolved with the mechanic ID and current date.
@@ -165,7 +328,7 @@ def resolve_incidencia(id_incidencia: int, id_mecanico: int = Query(..., descrip
         raise HTTPException(status_code=404, detail="Incidencia not found")
     
     # Verify the mechanic exists
-    mecanico = db.query(Trabajador).filter(Trabajador.dni == id_mecanico).first()
+    mecanico = reference_cache.trabajadores.get(db, id_mecanico)
     if not mecanico:
         raise HTTPException(status_code=404, detail=f"Mechanic with DNI {id_mecanico} not found")
     
@@ -175,4 +338,7 @@ def resolve_incidencia(id_incidencia: int, id_mecanico: int = Query(..., descrip
     
     db.commit()
     db.refresh(incidencia)
+    search_index.safe_index(search_index.index.index_incidencia, incidencia)
+    versions.safe_bump("incidencias")
+    incidencia_feed.safe_publish(incidencia)
     return incidencia
@@ -1,15 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, String, Date
+from sqlalchemy import func, and_, String, Date, select, literal, union_all
 from typing import List, Optional
 from datetime import datetime
-import pandas as pd
+import logging
 from io import BytesIO
 from fastapi.responses import StreamingResponse
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
+from app.database import replica
 from app.database.connection import get_db
 from app.models.models import FormularioCoche, FormularioTrabajo, Coche, Trabajador, Trabajo
+from app.utils import log, singleflight, versions
+from app.utils.serialization import dumps
 
 router = APIRouter(
     prefix="/query",
@@ -17,6 +20,170 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+logger = logging.getLogger(__name__)
+
+# Identical concurrent views (same filters) share one pair of queries
+combined_flight = singleflight.group("query_combined_data")
+
+# Tables whose version stamps key the shared results
+COMBINED_SOURCES = ("formularios", "coches", "trabajadores", "trabajos")
+# Date columns of the Excel export: kept as date cells, displayed as DD/MM/YYYY (the API's date format)
+EXPORT_DATE_COLUMNS = ("fecha_trabajo", "fecha")
+EXCEL_DATE_FORMAT = "DD/MM/YYYY"
+
+
+def _format_date_cells(sheet, columns) -> None:
+    for index, column in enumerate(columns, start=1):
+        if column in EXPORT_DATE_COLUMNS:
+            for (cell,) in sheet.iter_rows(min_row=2, min_col=index, max_col=index):
+                cell.number_format = EXCEL_DATE_FORMAT
+
+def _load_combined_data(
+    db: Session,
+    dni_trabajador: Optional[int],
+    id_trabajo: Optional[int],
+    id_coche: Optional[int],
+    fecha_inicio: Optional[str],
+    fecha_fin: Optional[str],
+) -> dict:
+    """Both form tables joined with their worker, car and job, with the given filters."""
+    # Query formularios coche
+    query_coche = db.query(
+        FormularioCoche,
+        Coche.id_coche.label("id_coche"),
+        Trabajador.nombre.label("nombre_trabajador"),
+        Trabajador.apellido.label("apellido_trabajador"),
+        Trabajo.cliente.label("cliente_trabajo"),
+        Trabajo.fecha.label("fecha_trabajo")
+    ).join(
+        Coche, FormularioCoche.id_coche == Coche.id_coche
+    ).join(
+        Trabajador, FormularioCoche.dni_trabajador == Trabajador.dni
+    ).join(
+        Trabajo, FormularioCoche.id_trabajo == Trabajo.id
+    )
+
+    # Query formularios trabajo
+    query_trabajo = db.query(
+        FormularioTrabajo,
+        Coche.id_coche.label("id_coche"),
+        Trabajador.nombre.label("nombre_trabajador"),
+        Trabajador.apellido.label("apellido_trabajador"),
+        Trabajo.cliente.label("cliente_trabajo"),
+        Trabajo.fecha.label("fecha_trabajo")
+    ).join(
+        Coche, FormularioTrabajo.id_coche == Coche.id_coche
+    ).join(
+        Trabajador, FormularioTrabajo.dni_trabajador == Trabajador.dni
+    ).join(
+        Trabajo, FormularioTrabajo.id_trabajo == Trabajo.id
+    )
+
+    # Apply filters
+    if dni_trabajador:
+        query_coche = query_coche.filter(FormularioCoche.dni_trabajador == dni_trabajador)
+        query_trabajo = query_trabajo.filter(FormularioTrabajo.dni_trabajador == dni_trabajador)
+    
+    if id_trabajo:
+        query_coche = query_coche.filter(FormularioCoche.id_trabajo == id_trabajo)
+        query_trabajo = query_trabajo.filter(FormularioTrabajo.id_trabajo == id_trabajo)
+    
+    if id_coche:
+        query_coche = query_coche.filter(FormularioCoche.id_coche == id_coche)
+        query_trabajo = query_trabajo.filter(FormularioTrabajo.id_coche == id_coche)
+    
+    logger.debug("fecha_inicio: %s, fecha_fin: %s", fecha_inicio, fecha_fin)
+
+    # Debug: dump all trabajo dates (a full table read, so only when DEBUG is on)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "All trabajo dates in database",
+            extra=log.fields(trabajos=[(t.id, t.fecha) for t in db.query(Trabajo).all()]),
+        )
+
+    if fecha_inicio and fecha_fin and fecha_inicio != "" and fecha_fin != "":
+        try:
+            # Convert input dates from YYYY-MM-DD to datetime objects
+            fecha_inicio_dt = datetime.strptime(fecha_inicio, "%Y-%m-%d")
+            fecha_fin_dt = datetime.strptime(fecha_fin, "%Y-%m-%d")
+            
+            logger.debug("Date range for comparison: %s - %s", fecha_inicio_dt, fecha_fin_dt)
+
+            # Convert to date objects for comparison
+            fecha_inicio_date_obj = fecha_inicio_dt.date()
+            fecha_fin_date_obj = fecha_fin_dt.date()
+
+            # Filter based on Trabajo.fecha being a Date or DateTime type
+            # Cast Trabajo.fecha to Date for consistent comparison
+            query_coche = query_coche.filter(
+                func.cast(Trabajo.fecha, Date).between(fecha_inicio_date_obj, fecha_fin_date_obj)
+            )
+            query_trabajo = query_trabajo.filter(
+                func.cast(Trabajo.fecha, Date).between(fecha_inicio_date_obj, fecha_fin_date_obj)
+            )
+
+            # Log the queries for debugging (compiling them is not free)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Query coche SQL: %s", query_coche.statement.compile(compile_kwargs={'literal_binds': True}))
+                logger.debug("Query trabajo SQL: %s", query_trabajo.statement.compile(compile_kwargs={'literal_binds': True}))
+
+        except ValueError as e:
+            logger.warning("Error in date conversion: %s", e)
+            raise HTTPException(status_code=400, detail=f"Invalid date format. Use YYYY-MM-DD format: {str(e)}")
+
+    # Execute queries
+    results_coche = query_coche.all()
+    results_trabajo = query_trabajo.all()
+
+    logger.debug("Found %d coche results and %d trabajo results", len(results_coche), len(results_trabajo))
+
+    # Transform results
+    data_coche = [
+        {
+            "tipo": "formulario_coche",
+            "id_coche": result.FormularioCoche.id_coche,
+            # "placa_coche": result.placa_coche,
+            "dni_trabajador": result.FormularioCoche.dni_trabajador,
+            "nombre_trabajador": result.nombre_trabajador,
+            "apellido_trabajador": result.apellido_trabajador,
+            "id_trabajo": result.FormularioCoche.id_trabajo,
+            "cliente_trabajo": result.cliente_trabajo,
+            "fecha_trabajo": result.fecha_trabajo,
+            "otros": result.FormularioCoche.otros,
+            "fecha": result.FormularioCoche.fecha,
+            "hora_partida": result.FormularioCoche.hora_partida,
+            "estado_coche": result.FormularioCoche.estado_coche
+        }
+        for result in results_coche
+    ]
+
+    data_trabajo = [
+        {
+            "tipo": "formulario_trabajo",
+            "id_coche": result.FormularioTrabajo.id_coche,
+            "dni_trabajador": result.FormularioTrabajo.dni_trabajador,
+            "nombre_trabajador": result.nombre_trabajador,
+            "apellido_trabajador": result.apellido_trabajador,
+            "id_trabajo": result.FormularioTrabajo.id_trabajo,
+            "cliente_trabajo": result.cliente_trabajo,
+            "fecha_trabajo": result.fecha_trabajo,
+            "otros": result.FormularioTrabajo.otros,
+            "fecha": result.FormularioTrabajo.fecha,
+            "hora_final": result.FormularioTrabajo.hora_final,
+            "horas_trabajadas": result.FormularioTrabajo.horas_trabajadas,
+            "lugar_trabajo": result.FormularioTrabajo.lugar_trabajo,
+            "tiempo_llegada": result.FormularioTrabajo.tiempo_llegada
+        }
+        for result in results_trabajo
+    ]
+
+    # Prepare response
+    combined_data = {
+        "formularios_coche": data_coche,
+        "formularios_trabajo": data_trabajo
+    }
+    return combined_data
+
 @router.get("/combined-data")
 def query_combined_data(
     dni_trabajador: Optional[int] = None,
@@ -27,184 +194,155 @@ def query_combined_data(
     format: str = Query("json", description="Response format: json or excel"),
     db: Session = Depends(get_db)
 ):
-    print(f"Query params: dni_trabajador={dni_trabajador}, id_trabajo={id_trabajo}, id_coche={id_coche}, fecha_inicio={fecha_inicio}, fecha_fin={fecha_fin}, format={format}")
-    
+    filters = {
+        "dni_trabajador": dni_trabajador,
+        "id_trabajo": id_trabajo,
+        "id_coche": id_coche,
+        "fecha_inicio": fecha_inicio,
+        "fecha_fin": fecha_fin,
+    }
+    logger.debug("Combined data query", extra=log.fields(format=format, **filters))
     try:
-        # Query formularios coche
-        query_coche = db.query(
-            FormularioCoche,
-            Coche.id_coche.label("id_coche"),
-            Trabajador.nombre.label("nombre_trabajador"),
-            Trabajador.apellido.label("apellido_trabajador"),
-            Trabajo.cliente.label("cliente_trabajo"),
-            Trabajo.fecha.label("fecha_trabajo")
-        ).join(
-            Coche, FormularioCoche.id_coche == Coche.id_coche
-        ).join(
-            Trabajador, FormularioCoche.dni_trabajador == Trabajador.dni
-        ).join(
-            Trabajo, FormularioCoche.id_trabajo == Trabajo.id
-        )
+        if format.lower() != "excel":
+            stamps = tuple(versions.current(r) for r in COMBINED_SOURCES)
+            replica.avoid_lag(max(stamps))  # the coalesced body is keyed by these stamps
+            key = singleflight.make_key(filters, versions=stamps)
+            body = combined_flight.do(key, lambda: dumps(_load_combined_data(db, **filters)))
+            return Response(content=body, media_type="application/json")
 
-        # Query formularios trabajo
-        query_trabajo = db.query(
-            FormularioTrabajo,
-            Coche.id_coche.label("id_coche"),
-            Trabajador.nombre.label("nombre_trabajador"),
-            Trabajador.apellido.label("apellido_trabajador"),
-            Trabajo.cliente.label("cliente_trabajo"),
-            Trabajo.fecha.label("fecha_trabajo")
-        ).join(
-            Coche, FormularioTrabajo.id_coche == Coche.id_coche
-        ).join(
-            Trabajador, FormularioTrabajo.dni_trabajador == Trabajador.dni
-        ).join(
-            Trabajo, FormularioTrabajo.id_trabajo == Trabajo.id
-        )
+        combined_data = _load_combined_data(db, **filters)
+        data_coche = combined_data["formularios_coche"]
+        data_trabajo = combined_data["formularios_trabajo"]
 
-        # Apply filters
-        if dni_trabajador:
-            query_coche = query_coche.filter(FormularioCoche.dni_trabajador == dni_trabajador)
-            query_trabajo = query_trabajo.filter(FormularioTrabajo.dni_trabajador == dni_trabajador)
-        
-        if id_trabajo:
-            query_coche = query_coche.filter(FormularioCoche.id_trabajo == id_trabajo)
-            query_trabajo = query_trabajo.filter(FormularioTrabajo.id_trabajo == id_trabajo)
-        
-        if id_coche:
-            query_coche = query_coche.filter(FormularioCoche.id_coche == id_coche)
-            query_trabajo = query_trabajo.filter(FormularioTrabajo.id_coche == id_coche)
-        
-        print(f'fecha_inicio: {fecha_inicio}')
-        print(f'fecha_fin: {fecha_fin}')
-
-        # Debug: Print all trabajo dates in the database
-        all_trabajos = db.query(Trabajo).all()
-        print("All trabajo dates in database:")
-        for trabajo in all_trabajos:
-            print(f"Trabajo ID: {trabajo.id}, Fecha: {trabajo.fecha}, Type: {type(trabajo.fecha)}")
-
-        if fecha_inicio and fecha_fin and fecha_inicio != "" and fecha_fin != "":
-            try:
-                # Convert input dates from YYYY-MM-DD to datetime objects
-                fecha_inicio_dt = datetime.strptime(fecha_inicio, "%Y-%m-%d")
-                fecha_fin_dt = datetime.strptime(fecha_fin, "%Y-%m-%d")
-                
-                print(f"Date range for comparison:")
-                print(f"fecha_inicio_dt: {fecha_inicio_dt}")
-                print(f"fecha_fin_dt: {fecha_fin_dt}")
-
-                # Convert to date objects for comparison
-                fecha_inicio_date_obj = fecha_inicio_dt.date()
-                fecha_fin_date_obj = fecha_fin_dt.date()
-
-                # Filter based on Trabajo.fecha being a Date or DateTime type
-                # Cast Trabajo.fecha to Date for consistent comparison
-                query_coche = query_coche.filter(
-                    func.cast(Trabajo.fecha, Date).between(fecha_inicio_date_obj, fecha_fin_date_obj)
-                )
-                query_trabajo = query_trabajo.filter(
-                    func.cast(Trabajo.fecha, Date).between(fecha_inicio_date_obj, fecha_fin_date_obj)
+        # Excel export (not coalesced: each download gets its own file)
+        try:
+            # pandas (+ openpyxl) costs ~0.3 s and tens of MB per worker; load it on the first export only
+            import pandas as pd
+
+            if not data_coche and not data_trabajo:
+                return JSONResponse(
+                    status_code=404,
+                    content={"detail": "No hay datos para exportar con los filtros seleccionados"}
                 )
 
-                # Print the queries for debugging
-                print(f"Query coche SQL: {query_coche.statement.compile(compile_kwargs={'literal_binds': True})}")
-                print(f"Query trabajo SQL: {query_trabajo.statement.compile(compile_kwargs={'literal_binds': True})}")
-
-            except ValueError as e:
-                print(f"Error in date conversion: {str(e)}")
-                raise HTTPException(status_code=400, detail=f"Invalid date format. Use YYYY-MM-DD format: {str(e)}")
-
-        # Execute queries
-        results_coche = query_coche.all()
-        results_trabajo = query_trabajo.all()
-
-        print(f"Found {len(results_coche)} coche results and {len(results_trabajo)} trabajo results")
-
-        # Transform results
-        data_coche = [
-            {
-                "tipo": "formulario_coche",
-                "id_coche": result.FormularioCoche.id_coche,
-                # "placa_coche": result.placa_coche,
-                "dni_trabajador": result.FormularioCoche.dni_trabajador,
-                "nombre_trabajador": result.nombre_trabajador,
-                "apellido_trabajador": result.apellido_trabajador,
-                "id_trabajo": result.FormularioCoche.id_trabajo,
-                "cliente_trabajo": result.cliente_trabajo,
-                "fecha_trabajo": result.fecha_trabajo,
-                "otros": result.FormularioCoche.otros,
-                "fecha": result.FormularioCoche.fecha,
-                "hora_partida": result.FormularioCoche.hora_partida,
-                "estado_coche": result.FormularioCoche.estado_coche
-            }
-            for result in results_coche
-        ]
-
-        data_trabajo = [
-            {
-                "tipo": "formulario_trabajo",
-                "id_coche": result.FormularioTrabajo.id_coche,
-                "dni_trabajador": result.FormularioTrabajo.dni_trabajador,
-                "nombre_trabajador": result.nombre_trabajador,
-                "apellido_trabajador": result.apellido_trabajador,
-                "id_trabajo": result.FormularioTrabajo.id_trabajo,
-                "cliente_trabajo": result.cliente_trabajo,
-                "fecha_trabajo": result.fecha_trabajo,
-                "otros": result.FormularioTrabajo.otros,
-                "fecha": result.FormularioTrabajo.fecha,
-                "hora_final": result.FormularioTrabajo.hora_final,
-                "horas_trabajadas": result.FormularioTrabajo.horas_trabajadas,
-                "lugar_trabajo": result.FormularioTrabajo.lugar_trabajo,
-                "tiempo_llegada": result.FormularioTrabajo.tiempo_llegada
-            }
-            for result in results_trabajo
-        ]
-
-        # Prepare response
-        combined_data = {
-            "formularios_coche": data_coche,
-            "formularios_trabajo": data_trabajo
-        }
+            df_coche = pd.DataFrame(data_coche) if data_coche else None
+            df_trabajo = pd.DataFrame(data_trabajo) if data_trabajo else None
 
-        # Return Excel if requested
-        if format.lower() == "excel":
-            try:
-                if not data_coche and not data_trabajo:
-                    return JSONResponse(
-                        status_code=404,
-                        content={"detail": "No hay datos para exportar con los filtros seleccionados"}
-                    )
-
-                df_coche = pd.DataFrame(data_coche) if data_coche else None
-                df_trabajo = pd.DataFrame(data_trabajo) if data_trabajo else None
-
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"datos_combinados_{timestamp}.xlsx"
-                output = BytesIO()
-
-                with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                    if df_coche is not None and not df_coche.empty:
-                        df_coche.to_excel(writer, sheet_name="Formularios Coche", index=False)
-                    if df_trabajo is not None and not df_trabajo.empty:
-                        df_trabajo.to_excel(writer, sheet_name="Formularios Trabajo", index=False)
-
-                output.seek(0)
-                return StreamingResponse(
-                    output,
-                    media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    headers={
-                        "Content-Disposition": f"attachment; filename={filename}",
-                        "Cache-Control": "no-cache, no-store, must-revalidate",
-                        "Pragma": "no-cache",
-                        "Expires": "0"
-                    }
-                )
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error generating Excel file: {str(e)}")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"datos_combinados_{timestamp}.xlsx"
+            output = BytesIO()
+
+            with pd.ExcelWriter(output, engine="openpyxl") as writer:
+                if df_coche is not None and not df_coche.empty:
+                    df_coche.to_excel(writer, sheet_name="Formularios Coche", index=False)
+                    _format_date_cells(writer.sheets["Formularios Coche"], df_coche.columns)
+                if df_trabajo is not None and not df_trabajo.empty:
+                    df_trabajo.to_excel(writer, sheet_name="Formularios Trabajo", index=False)
+                    _format_date_cells(writer.sheets["Formularios Trabajo"], df_trabajo.columns)
+
+            output.seek(0)
+            return StreamingResponse(
+                output,
+                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                headers={
+                    "Content-Disposition": f"attachment; filename={filename}",
+                    "Cache-Control": "no-cache, no-store, must-revalidate",
+                    "Pragma": "no-cache",
+                    "Expires": "0"
+                }
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error generating Excel file: {str(e)}")
+
+    except Exception as e:
+        logger.exception("Error in query_combined_data")
+        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
-        return combined_data
+def _facet_forms_subquery(dni_trabajador, id_trabajo, id_coche, fecha_inicio, fecha_fin):
+    """
+    UNION ALL of both form tables, reduced to the columns the facets group by,
+    with the same filters as query_combined_data.
+    """
+    date_range = None
+    if fecha_inicio and fecha_fin:
+        try:
+            date_range = (
+                datetime.strptime(fecha_inicio, "%Y-%m-%d").date(),
+                datetime.strptime(fecha_fin, "%Y-%m-%d").date(),
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid date format. Use YYYY-MM-DD format: {str(e)}")
 
+    selects = []
+    for model in (FormularioCoche, FormularioTrabajo):
+        lugar = model.lugar_trabajo if model is FormularioTrabajo else literal(None, String)
+        stmt = select(
+            model.id_coche.label("id_coche"),
+            model.dni_trabajador.label("dni_trabajador"),
+            model.id_trabajo.label("id_trabajo"),
+            lugar.label("lugar_trabajo"),
+        ).join(Trabajo, model.id_trabajo == Trabajo.id)
+        if dni_trabajador:
+            stmt = stmt.where(model.dni_trabajador == dni_trabajador)
+        if id_trabajo:
+            stmt = stmt.where(model.id_trabajo == id_trabajo)
+        if id_coche:
+            stmt = stmt.where(model.id_coche == id_coche)
+        if date_range:
+            stmt = stmt.where(func.cast(Trabajo.fecha, Date).between(*date_range))
+        selects.append(stmt)
+    return union_all(*selects).subquery("formularios")
+
+@router.get("/facets")
+def query_facets(
+    dni_trabajador: Optional[int] = None,
+    id_trabajo: Optional[int] = None,
+    id_coche: Optional[int] = None,
+    fecha_inicio: Optional[str] = None,
+    fecha_fin: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Distinct workers, cars, clients and locations (with form counts) for the
+    same filters as /query/combined-data, computed with GROUP BY in the database
+    so the filter UI does not need the whole dataset.
+    """
+    forms = _facet_forms_subquery(dni_trabajador, id_trabajo, id_coche, fecha_inicio, fecha_fin)
+    count = func.count().label("count")
+    try:
+        trabajadores = db.execute(
+            select(Trabajador.dni, Trabajador.nombre, Trabajador.apellido, count)
+            .join(forms, forms.c.dni_trabajador == Trabajador.dni)
+            .group_by(Trabajador.dni, Trabajador.nombre, Trabajador.apellido)
+            .order_by(Trabajador.nombre, Trabajador.apellido)
+        ).all()
+        coches = db.execute(
+            select(Coche.id_coche, Coche.placa, count)
+            .join(forms, forms.c.id_coche == Coche.id_coche)
+            .group_by(Coche.id_coche, Coche.placa)
+            .order_by(Coche.id_coche)
+        ).all()
+        clientes = db.execute(
+            select(Trabajo.cliente, count)
+            .join(forms, forms.c.id_trabajo == Trabajo.id)
+            .group_by(Trabajo.cliente)
+            .order_by(Trabajo.cliente)
+        ).all()
+        lugares = db.execute(
+            select(forms.c.lugar_trabajo, count)
+            .where(forms.c.lugar_trabajo.isnot(None))
+            .group_by(forms.c.lugar_trabajo)
+            .order_by(forms.c.lugar_trabajo)
+        ).all()
     except Exception as e:
-        print(f"Error in query_combined_data: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error processing facets: {str(e)}")
+
+    return {
+        "trabajadores": [
+            {"dni": row.dni, "nombre": row.nombre, "apellido": row.apellido, "count": row.count}
+            for row in trabajadores
+        ],
+        "coches": [{"id_coche": row.id_coche, "placa": row.placa, "count": row.count} for row in coches],
+        "clientes": [{"cliente": row.cliente, "count": row.count} for row in clientes],
+        "lugares": [{"lugar_trabajo": row.lugar_trabajo, "count": row.count} for row in lugares],
+    }
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+
+from app.services.search_index import index, TIPOS
+
+router = APIRouter(
+    prefix="/search",
+    tags=["search"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/")
+def search(
+    q: str = Query(..., min_length=1, description="Texto a buscar, p. ej. 'frenos' o 'neum*' para prefijos"),
+    tipo: Optional[str] = Query(None, description=f"Restringir a un tipo: {', '.join(TIPOS)}"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+):
+    """
+    Ranked full-text search over form comments, work locations and incidence
+    descriptions. Highlights wrap matched words in <mark> (text is HTML-escaped).
+    """
+    if tipo is not None and tipo not in TIPOS:
+        raise HTTPException(status_code=400, detail=f"Tipo no soportado: {tipo}. Opciones: {', '.join(TIPOS)}")
+    try:
+        index.ensure_fresh()
+        return index.search(q, tipo=tipo, page=page, page_size=page_size)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing search: {str(e)}")
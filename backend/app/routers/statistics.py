@@ -0,0 +1,67 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional, List, Tuple
+from datetime import datetime
+
+from app.services.analytics_snapshot import snapshot, DIMENSIONS, MEASURE_FIELDS, AGGREGATES
+
+router = APIRouter(
+    prefix="/statistics",
+    tags=["statistics"],
+    responses={404: {"description": "Not found"}},
+)
+
+def _split(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+def _parse_measures(value: str) -> List[Tuple[str, Optional[str]]]:
+    measures = []
+    for item in _split(value):
+        if ":" in item:
+            func, field = item.split(":", 1)
+            measures.append((func.strip(), field.strip()))
+        else:
+            measures.append((item, None))
+    return measures
+
+@router.get("/aggregate")
+def aggregate_formularios_trabajo(
+    group_by: Optional[str] = Query(None, description=f"Dimensiones separadas por comas: {', '.join(DIMENSIONS)}"),
+    measures: str = Query("count", description=f"Medidas 'agregacion:campo' separadas por comas. Agregaciones: {', '.join(AGGREGATES)}; campos: {', '.join(MEASURE_FIELDS)}"),
+    dni_trabajador: Optional[int] = None,
+    id_coche: Optional[int] = None,
+    id_trabajo: Optional[int] = None,
+    cliente: Optional[str] = None,
+    lugar_trabajo: Optional[str] = None,
+    fecha_inicio: Optional[str] = Query(None, description="YYYY-MM-DD (fecha del trabajo)"),
+    fecha_fin: Optional[str] = Query(None, description="YYYY-MM-DD (fecha del trabajo)"),
+):
+    """
+    Ad-hoc group-by over formularios de trabajo joined with trabajos, answered
+    from the in-memory columnar snapshot instead of the database.
+    Example: group_by=lugar_trabajo,mes&measures=sum:horas_trabajadas&dni_trabajador=...
+    """
+    filters = {
+        "dni_trabajador": dni_trabajador,
+        "id_coche": id_coche,
+        "id_trabajo": id_trabajo,
+        "cliente": cliente,
+        "lugar_trabajo": lugar_trabajo,
+    }
+    try:
+        if fecha_inicio:
+            filters["fecha_inicio"] = datetime.strptime(fecha_inicio, "%Y-%m-%d").date()
+        if fecha_fin:
+            filters["fecha_fin"] = datetime.strptime(fecha_fin, "%Y-%m-%d").date()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date format. Use YYYY-MM-DD format: {str(e)}")
+
+    try:
+        return snapshot.aggregate(_split(group_by), _parse_measures(measures), filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing aggregate: {str(e)}")
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from app.database.connection import get_db
+from app.services import sync
+from app.utils.serialization import dumps_display
+
+router = APIRouter(
+    prefix="/sync",
+    tags=["sync"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/")
+def get_changes(
+    since: Optional[str] = Query(None, description="Token de la sincronización anterior; sin él, copia completa"),
+    tables: Optional[str] = Query(None, description=f"Tablas separadas por comas (por defecto todas): {', '.join(sync.TABLES)}"),
+    db: Session = Depends(get_db),
+):
+    """
+    Rows changed and primary keys deleted since `since`, per table, as
+    {"columns", "key", "rows": [[...]], "deleted": ["k1:k2"]}, plus the token
+    for the next call. With "full": true the client replaces its copy.
+    """
+    names = [name.strip() for name in tables.split(",") if name.strip()] if tables else None
+    unknown = [name for name in names or () if name not in sync.TABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Tablas no soportadas: {', '.join(unknown)}. Opciones: {', '.join(sync.TABLES)}")
+    try:
+        body = sync.changes(db, since, names)
+    except sync.InvalidToken:
+        raise HTTPException(status_code=400, detail="Token de sincronización no válido")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al sincronizar: {str(e)}")
+    return Response(content=dumps_display(body), media_type="application/json", headers={"Cache-Control": "no-store"})
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List
 
 from app.database.connection import get_db
 from app.models.models import Trabajador
 from app.schemas.schemas import TrabajadorCreate, TrabajadorUpdate, TrabajadorOut
+from app.services import reference_cache, suggest_index
+from app.utils.conditional import conditional_response
+from app.utils.diagnostics import declare_query_budget
+from app.utils.serialization import columns_for, rows_response
 
 router = APIRouter(
     prefix="/trabajadores",
@@ -13,6 +18,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=TrabajadorOut)
+@declare_query_budget(4)
 def create_trabajador(trabajador: TrabajadorCreate, db: Session = Depends(get_db)):
     existing_trabajador = db.query(Trabajador).filter(Trabajador.dni == trabajador.dni).first()
     if existing_trabajador:
@@ -23,18 +29,21 @@ def create_trabajador(trabajador: TrabajadorCreate, db: Session = Depends(get_db
             dni=trabajador.dni,
             nombre=trabajador.nombre,
             apellido=trabajador.apellido,
-            fecha_nacimiento=trabajador.fecha_nacimiento,
-            fecha_empleo=trabajador.fecha_empleo,
+            fecha_nacimiento=trabajador.parsed_date("fecha_nacimiento"),
+            fecha_empleo=trabajador.parsed_date("fecha_empleo"),
         )
         db.add(db_trabajador)
         db.commit()
         db.refresh(db_trabajador)
+        suggest_index.safe_update(suggest_index.trabajadores.upsert, db_trabajador)
+        reference_cache.safe_put(reference_cache.trabajadores, db_trabajador)
         return db_trabajador
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=f"Error al crear trabajador: {str(e)}")
 
 @router.put("/{dni}", response_model=TrabajadorOut)
+@declare_query_budget(4)
 def update_trabajador(dni: int, trabajador_update_data: TrabajadorUpdate, db: Session = Depends(get_db)):
     try:
         db_trabajador = db.query(Trabajador).filter(Trabajador.dni == dni).first()
@@ -46,12 +55,14 @@ def update_trabajador(dni: int, trabajador_update_data: TrabajadorUpdate, db: Se
         if trabajador_update_data.apellido is not None:
             db_trabajador.apellido = trabajador_update_data.apellido
         if trabajador_update_data.fecha_nacimiento is not None:
-            db_trabajador.fecha_nacimiento = trabajador_update_data.fecha_nacimiento
+            db_trabajador.fecha_nacimiento = trabajador_update_data.parsed_date("fecha_nacimiento")
         if trabajador_update_data.fecha_empleo is not None:
-            db_trabajador.fecha_empleo = trabajador_update_data.fecha_empleo
+            db_trabajador.fecha_empleo = trabajador_update_data.parsed_date("fecha_empleo")
         
         db.commit()
         db.refresh(db_trabajador)
+        suggest_index.safe_update(suggest_index.trabajadores.upsert, db_trabajador)
+        reference_cache.safe_put(reference_cache.trabajadores, db_trabajador)
         return db_trabajador
     except HTTPException as e:
         raise e
@@ -59,6 +70,20 @@ def update_trabajador(dni: int, trabajador_update_data: TrabajadorUpdate, db: Se
         db.rollback()
         raise HTTPException(status_code=400, detail=f"Error al actualizar trabajador: {str(e)}")
 
+@router.get("/suggest", response_model=List[TrabajadorOut])
+def suggest_trabajadores(
+    q: str = Query("", description="Prefijo o fragmento del nombre, apellido o DNI"),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """
+    Typeahead over nombre, apellido and dni, answered from an in-memory index.
+    """
+    try:
+        suggest_index.trabajadores.ensure_fresh()
+        return suggest_index.trabajadores.suggest(q, limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 @router.get("/{dni}", response_model=TrabajadorOut)
 def get_trabajador(dni: int, db: Session = Depends(get_db)):
     db_trabajador = db.query(Trabajador).filter(Trabajador.dni == dni).first()
@@ -67,6 +92,8 @@ def get_trabajador(dni: int, db: Session = Depends(get_db)):
     return db_trabajador
 
 @router.get("/", response_model=List[TrabajadorOut])
-def get_all_trabajadores(db: Session = Depends(get_db)):
-    trabajadores = db.query(Trabajador).all()
-    return trabajadores 
\ No newline at end of file
+def get_all_trabajadores(request: Request, db: Session = Depends(get_db)):
+    return conditional_response(
+        request, "trabajadores", lambda: rows_response(db.execute(select(*columns_for(Trabajador, TrabajadorOut)))),
+        db=db, model=Trabajador,
+    )
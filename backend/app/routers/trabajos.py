@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from app.database.connection import get_db
 from app.models.models import Trabajo, FormularioCoche, FormularioTrabajo
 # Pydantic schemas need password removed in app.schemas.schemas.py
-from app.schemas.schemas import TrabajoCreate, TrabajoUpdate, TrabajoOut, parse_date
+from app.schemas.schemas import TrabajoCreate, TrabajoUpdate, TrabajoOut
+from app.services import reference_cache, suggest_index
+from app.utils.conditional import conditional_response
+from app.utils.diagnostics import declare_query_budget
+from app.utils.serialization import columns_for, rows_response
 
 router = APIRouter(
     prefix="/trabajos",
@@ -14,6 +19,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=TrabajoOut) # Use TrabajoOut
+@declare_query_budget(4)
 def create_trabajo(trabajo: TrabajoCreate, db: Session = Depends(get_db)):
     # Optional: Check if ID already exists
     existing_trabajo = db.query(Trabajo).filter(Trabajo.id == trabajo.id).first()
@@ -21,19 +27,16 @@ def create_trabajo(trabajo: TrabajoCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=f"Trabajo con ID {trabajo.id} ya existe.")
         
     try:
-        # Convert fecha string to datetime object if it exists
-        fecha_datetime = None
-        if trabajo.fecha:
-            fecha_datetime = parse_date(trabajo.fecha)
-        
         db_trabajo = Trabajo(
             id=trabajo.id, # Assuming ID is provided by user, as per frontend logic
             cliente=trabajo.cliente,
-            fecha=fecha_datetime
+            fecha=trabajo.parsed_date("fecha")  # parsed during validation
         )
         db.add(db_trabajo)
         db.commit()
         db.refresh(db_trabajo)
+        suggest_index.safe_update(suggest_index.trabajos.upsert, db_trabajo)
+        reference_cache.safe_put(reference_cache.trabajos, db_trabajo)
         return db_trabajo
     except Exception as e:
         db.rollback()
@@ -43,17 +46,11 @@ def create_trabajo(trabajo: TrabajoCreate, db: Session = Depends(get_db)):
 @router.get("/available-for-coche-form", response_model=List[TrabajoOut])
 def get_available_trabajos_for_coche_form(db: Session = Depends(get_db)):
     try:
-        # Get all trabajos
-        all_trabajos = db.query(Trabajo).all()
-        
-        # Get IDs of trabajos that already have a car formulary
-        used_trabajo_ids = db.query(FormularioCoche.id_trabajo).all()
-        used_ids = [id[0] for id in used_trabajo_ids]
-        
-        # Filter trabajos that don't have a car formulary
-        available_trabajos = [trabajo for trabajo in all_trabajos if trabajo.id not in used_ids]
-        
-        return available_trabajos
+        # Trabajos without a car formulary, filtered in the database
+        stmt = select(*columns_for(Trabajo, TrabajoOut)).where(
+            Trabajo.id.not_in(select(FormularioCoche.id_trabajo))
+        )
+        return rows_response(db.execute(stmt))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error al obtener trabajos disponibles: {str(e)}")
 
@@ -61,26 +58,23 @@ def get_available_trabajos_for_coche_form(db: Session = Depends(get_db)):
 @router.get("/available-for-trabajo-form", response_model=List[TrabajoOut])
 def get_available_trabajos_for_trabajo_form(db: Session = Depends(get_db)):
     try:
-        # Get all trabajos
-        all_trabajos = db.query(Trabajo).all()
-        
-        # Get IDs of trabajos that already have a trabajo formulary
-        used_trabajo_ids = db.query(FormularioTrabajo.id_trabajo).all()
-        used_ids = [id[0] for id in used_trabajo_ids]
-        
-        # Filter trabajos that don't have a trabajo formulary
-        available_trabajos = [trabajo for trabajo in all_trabajos if trabajo.id not in used_ids]
-        
-        return available_trabajos
+        # Trabajos without a trabajo formulary, filtered in the database
+        stmt = select(*columns_for(Trabajo, TrabajoOut)).where(
+            Trabajo.id.not_in(select(FormularioTrabajo.id_trabajo))
+        )
+        return rows_response(db.execute(stmt))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error al obtener trabajos disponibles: {str(e)}")
 
 @router.get("/", response_model=List[TrabajoOut]) # Use TrabajoOut
-def get_all_trabajos(db: Session = Depends(get_db)):
-    trabajos = db.query(Trabajo).all()
-    return trabajos
+def get_all_trabajos(request: Request, db: Session = Depends(get_db)):
+    return conditional_response(
+        request, "trabajos", lambda: rows_response(db.execute(select(*columns_for(Trabajo, TrabajoOut)))),
+        db=db, model=Trabajo,
+    )
 
 @router.put("/{id}", response_model=TrabajoOut) # Use TrabajoOut
+@declare_query_budget(4)
 def update_trabajo(id: int, trabajo_update_data: TrabajoUpdate, db: Session = Depends(get_db)):
     try:
         db_trabajo = db.query(Trabajo).filter(Trabajo.id == id).first()
@@ -93,10 +87,12 @@ def update_trabajo(id: int, trabajo_update_data: TrabajoUpdate, db: Session = De
         if trabajo_update_data.cliente is not None:
             db_trabajo.cliente = trabajo_update_data.cliente
         if trabajo_update_data.fecha is not None:
-            db_trabajo.fecha = trabajo_update_data.fecha
+            db_trabajo.fecha = trabajo_update_data.parsed_date("fecha")
         
         db.commit()
         db.refresh(db_trabajo)
+        suggest_index.safe_update(suggest_index.trabajos.upsert, db_trabajo)
+        reference_cache.safe_put(reference_cache.trabajos, db_trabajo)
         return db_trabajo
     except HTTPException as e:
         raise e
@@ -104,6 +100,23 @@ def update_trabajo(id: int, trabajo_update_data: TrabajoUpdate, db: Session = De
         db.rollback()
         raise HTTPException(status_code=400, detail=f"Error al actualizar trabajo: {str(e)}")
 
+@router.get("/suggest", response_model=List[TrabajoOut])
+def suggest_trabajos(
+    q: str = Query("", description="Prefijo o fragmento del cliente o del ID"),
+    limit: int = Query(10, ge=1, le=50),
+    disponible_para: Optional[str] = Query(None, description="'coche' o 'trabajo': solo trabajos sin ese formulario"),
+):
+    """
+    Typeahead over cliente and id, answered from an in-memory index.
+    """
+    if disponible_para is not None and disponible_para not in ("coche", "trabajo"):
+        raise HTTPException(status_code=400, detail="disponible_para debe ser 'coche' o 'trabajo'")
+    try:
+        suggest_index.trabajos.ensure_fresh()
+        return suggest_index.trabajos.suggest(q, limit, exclude_flag=disponible_para)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 @router.get("/{id}", response_model=TrabajoOut) # Use TrabajoOut
 def get_trabajo(id: int, db: Session = Depends(get_db)):
     db_trabajo = db.query(Trabajo).filter(Trabajo.id == id).first()
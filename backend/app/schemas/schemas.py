@@ -1,131 +1,115 @@
-from pydantic import BaseModel, Field, validator
-from typing import Optional, List
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, PrivateAttr, field_validator, model_validator
+from typing import Annotated, Any, ClassVar, Dict, Optional, List, Tuple
 from datetime import datetime
 
-# Date format constants
-DATE_FORMAT = "%d/%m/%Y"
-
-# --- Helper Functions for Date Conversion ---
-def format_date(date_obj):
-    """Convert datetime to DD/MM/YYYY format string."""
-    if not date_obj:
-        return None
-    return date_obj.strftime(DATE_FORMAT)
-
-def parse_date(date_str):
-    """Parse date string in either DD/MM/YYYY or YYYY-MM-DD format."""
-    if not date_str:
-        return None
-    
-    try:
-        # Try DD/MM/YYYY format first
-        return datetime.strptime(date_str, DATE_FORMAT)
-    except ValueError:
-        try:
-            # Try YYYY-MM-DD format (common from frontend)
-            return datetime.strptime(date_str, "%Y-%m-%d")
-        except ValueError:
-            raise ValueError(f"Date must be in DD/MM/YYYY or YYYY-MM-DD format, got {date_str}")
+# Date codec (DD/MM/YYYY or YYYY-MM-DD in, DD/MM/YYYY out), re-exported for the routers
+from app.utils.dates import DATE_FORMAT, format_date, parse_date
+
+def _display_date(v):
+    if isinstance(v, datetime):
+        return format_date(v)
+    return v
+
+# Response field holding a date: DateTime columns are rendered as DD/MM/YYYY
+DisplayDate = Annotated[str, BeforeValidator(_display_date)]
 
 # --- Base Models for Responses (Explicitly Named) ---
 class CocheOut(BaseModel):
     id_coche: int
     placa: int
 
-    class Config:
-        orm_mode = True # Or from_attributes = True for Pydantic v2
+    model_config = ConfigDict(from_attributes=True)
 
 class TrabajadorOut(BaseModel):
     dni: int
     nombre: str
     apellido: str
-    fecha_nacimiento: str
-    fecha_empleo: str
+    fecha_nacimiento: DisplayDate
+    fecha_empleo: DisplayDate
 
-    class Config:
-        orm_mode = True
-        
-    @validator('fecha_nacimiento', 'fecha_empleo', pre=True)
-    def format_dates(cls, v):
-        if isinstance(v, datetime):
-            return format_date(v)
-        return v
+    model_config = ConfigDict(from_attributes=True)
 
 class TrabajoOut(BaseModel):
     id: int
     cliente: str
-    fecha: str
+    fecha: DisplayDate
 
-    class Config:
-        orm_mode = True
-        
-    @validator('fecha', pre=True)
-    def format_date(cls, v):
-        if isinstance(v, datetime):
-            return format_date(v)
-        return v
+    model_config = ConfigDict(from_attributes=True)
 
 # --- Schemas for Creating Data (Payloads) ---
+class DatePayload(BaseModel):
+    """
+    Payload with date strings (DD/MM/YYYY or YYYY-MM-DD) in the fields listed in
+    `_date_fields`. They are parsed once during validation; handlers read the
+    datetime with `parsed_date(field)` instead of parsing the string again.
+    """
+    _date_fields: ClassVar[Tuple[str, ...]] = ()
+    _parsed_dates: Dict[str, Optional[datetime]] = PrivateAttr(default_factory=dict)
+
+    @field_validator('*')
+    @classmethod
+    def validate_dates(cls, v, info):
+        if info.field_name in cls._date_fields and v is not None:
+            parse_date(v)  # This will raise ValueError if format is incorrect
+        return v
+
+    @model_validator(mode='after')
+    def keep_parsed_dates(self):
+        for name in self._date_fields:
+            self._parsed_dates[name] = parse_date(getattr(self, name))  # memoized, no second parse
+        return self
+
+    def parsed_date(self, name: str) -> Optional[datetime]:
+        return self._parsed_dates.get(name)
+
 class CocheCreate(BaseModel):
     id_coche: int # Assuming user provides ID
     placa: int
     # marca, modelo, fechas, password removed
 
-class TrabajadorCreate(BaseModel):
+class TrabajadorCreate(DatePayload):
+    _date_fields = ('fecha_nacimiento', 'fecha_empleo')
+
     dni: int
     nombre: str
     apellido: str
     fecha_nacimiento: str
     fecha_empleo: str
     # password removed
-    
-    @validator('fecha_nacimiento', 'fecha_empleo')
-    def validate_dates(cls, v):
-        parse_date(v)  # This will raise ValueError if format is incorrect
-        return v
 
-class TrabajoCreate(BaseModel):
+class TrabajoCreate(DatePayload):
+    _date_fields = ('fecha',)
+
     id: int # Assuming user provides ID
     cliente: str
     fecha: str
     # password removed
-    
-    @validator('fecha')
-    def validate_date(cls, v):
-        parse_date(v)  # This will raise ValueError if format is incorrect
-        return v
 
 # --- Schemas for Updating Data (Payloads) ---
 class CocheUpdate(BaseModel):
     placa: Optional[int] = None
     # marca, modelo, fechas, password removed
 
-class TrabajadorUpdate(BaseModel):
+class TrabajadorUpdate(DatePayload):
+    _date_fields = ('fecha_nacimiento', 'fecha_empleo')
+
     nombre: Optional[str] = None
     apellido: Optional[str] = None
     fecha_nacimiento: Optional[str] = None
     fecha_empleo: Optional[str] = None
     # password removed
-    
-    @validator('fecha_nacimiento', 'fecha_empleo')
-    def validate_dates(cls, v):
-        if v is not None:
-            parse_date(v)  # This will raise ValueError if format is incorrect
-        return v
 
-class TrabajoUpdate(BaseModel):
+class TrabajoUpdate(DatePayload):
+    _date_fields = ('fecha',)
+
     cliente: Optional[str] = None
     fecha: Optional[str] = None
     # password removed
-    
-    @validator('fecha')
-    def validate_date(cls, v):
-        if v is not None:
-            parse_date(v)  # This will raise ValueError if format is incorrect
-        return v
 
 # --- Schemas for Formularios (remain unchanged) ---
-class FormularioCocheCreate(BaseModel):
+class FormularioCocheCreate(DatePayload):
+    _date_fields = ('fecha',)
+
     id_coche: int
     dni_trabajador: int
     id_trabajo: int
@@ -133,14 +117,10 @@ class FormularioCocheCreate(BaseModel):
     fecha: Optional[str] = None
     hora_partida: Optional[str] = None
     estado_coche: Optional[str] = None
-    
-    @validator('fecha')
-    def validate_date(cls, v):
-        if v is not None:
-            parse_date(v)  # This will raise ValueError if format is incorrect
-        return v
 
-class FormularioTrabajoCreate(BaseModel):
+class FormularioTrabajoCreate(DatePayload):
+    _date_fields = ('fecha',)
+
     id_coche: int
     dni_trabajador: int
     id_trabajo: int
@@ -150,15 +130,11 @@ class FormularioTrabajoCreate(BaseModel):
     horas_trabajadas: Optional[float] = None
     lugar_trabajo: Optional[str] = None
     tiempo_llegada: Optional[int] = None
-    
-    @validator('fecha')
-    def validate_date(cls, v):
-        if v is not None:
-            parse_date(v)  # This will raise ValueError if format is incorrect
-        return v
 
 # --- Schemas for Incidencias ---
-class IncidenciaBase(BaseModel):
+class IncidenciaBase(DatePayload):
+    _date_fields = ('fecha', 'fecha_resolucion')
+
     id_coche: int
     gravedad: str
     fecha: str # Consider using datetime if appropriate for validation/conversion
@@ -166,41 +142,32 @@ class IncidenciaBase(BaseModel):
     descripcion: Optional[str] = None
     id_mecanico: Optional[int] = None
     fecha_resolucion: Optional[str] = None
-    
-    @validator('fecha', 'fecha_resolucion')
-    def validate_dates(cls, v, values, **kwargs):
-        if v is not None:
-            parse_date(v)  # This will raise ValueError if format is incorrect
-        return v
 
 class IncidenciaCreate(IncidenciaBase):
     pass
 
 class IncidenciaOut(IncidenciaBase):
+    _date_fields = ()  # output dates are rendered, not parsed
+
     id_incidencia: int
+    fecha: DisplayDate
+    fecha_resolucion: Optional[DisplayDate] = None
 
-    class Config:
-        orm_mode = True # Or from_attributes = True for Pydantic v2
-        
-    @validator('fecha', 'fecha_resolucion', pre=True)
-    def format_dates(cls, v):
-        if isinstance(v, datetime):
-            return format_date(v)
-        return v
+    model_config = ConfigDict(from_attributes=True)
+
+class IncidenciaSimilarOut(IncidenciaOut):
+    similitud: float
+    horas_resolucion: Optional[float] = None
+
+class IncidenciaUpdate(DatePayload):
+    _date_fields = ('fecha', 'fecha_resolucion')
 
-class IncidenciaUpdate(BaseModel):
     gravedad: Optional[str] = None
     fecha: Optional[str] = None # Consider using datetime
     resuelta: Optional[bool] = None
     descripcion: Optional[str] = None
     id_mecanico: Optional[int] = None
     fecha_resolucion: Optional[str] = None
-    
-    @validator('fecha', 'fecha_resolucion')
-    def validate_dates(cls, v):
-        if v is not None:
-            parse_date(v)  # This will raise ValueError if format is incorrect
-        return v
 
 # --- Schemas for Formulario Responses ---
 class FormularioCocheOut(BaseModel):
@@ -208,35 +175,31 @@ class FormularioCocheOut(BaseModel):
     dni_trabajador: int
     id_trabajo: int
     otros: Optional[str] = None
-    fecha: Optional[str] = None
+    fecha: Optional[DisplayDate] = None
     hora_partida: Optional[str] = None
     estado_coche: Optional[str] = None
 
-    class Config:
-        orm_mode = True # Or from_attributes = True
-        
-    @validator('fecha', pre=True)
-    def format_date(cls, v):
-        if isinstance(v, datetime):
-            return format_date(v)
-        return v
+    model_config = ConfigDict(from_attributes=True)
 
 class FormularioTrabajoOut(BaseModel):
     id_coche: int
     dni_trabajador: int
     id_trabajo: int
     otros: Optional[str] = None
-    fecha: Optional[str] = None
+    fecha: Optional[DisplayDate] = None
     hora_final: Optional[str] = None
     horas_trabajadas: Optional[float] = None
     lugar_trabajo: Optional[str] = None
     tiempo_llegada: Optional[int] = None
 
-    class Config:
-        orm_mode = True # Or from_attributes = True
-        
-    @validator('fecha', pre=True)
-    def format_date(cls, v):
-        if isinstance(v, datetime):
-            return format_date(v)
-        return v 
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+ 
+
+# --- Schemas for POST /batch ---
+class BatchSubRequest(BaseModel):
+    method: str = "GET"
+    path: str = Field(..., description="Ruta completa, p. ej. /api/coches/")
+    params: Optional[Dict[str, Any]] = None  # query string; a list value repeats the parameter
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest] = Field(..., min_length=1)
@@ -0,0 +1,417 @@
+"""
+In-memory columnar snapshot of formularios_trabajo joined with trabajos.
+
+The snapshot keeps one NumPy array per column, with the free-text dimensions
+(cliente, lugar_trabajo) dictionary-encoded as int32 codes, so ad-hoc group-bys
+such as "hours by lugar_trabajo per month for worker X" are answered with
+vectorized operations instead of a database round trip.
+
+The snapshot is refreshed incrementally: only rows whose form or trabajo has
+an updated_at past the last one loaded are fetched (so forms for older jobs and
+trabajo edits are picked up as well as new ones), newly created forms are
+ingested directly by the formularios router, and a periodic full rebuild drops
+deleted rows and anything the overlap window missed.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import or_, select
+
+from app.database import connection
+from app.models.models import FormularioTrabajo, Trabajo
+from app.utils.dates import to_day_array
+
+logger = logging.getLogger(__name__)
+
+# Seconds between incremental refreshes and between full rebuilds
+REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "60"))
+FULL_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_FULL_REFRESH_SECONDS", "900"))
+# Rows stamped before the watermark but committed after it was read (commit lag, clock skew between workers)
+WATERMARK_OVERLAP_SECONDS = 10
+
+# Group-by dimensions accepted by aggregate()
+DIMENSIONS = ("lugar_trabajo", "cliente", "dni_trabajador", "id_coche", "anio", "mes", "dia", "dia_semana")
+# Numeric columns that can be aggregated, and the supported aggregate functions
+MEASURE_FIELDS = ("horas_trabajadas", "tiempo_llegada")
+AGGREGATES = ("sum", "avg", "min", "max", "count")
+
+_NAT = np.iinfo(np.int64).min
+_DIAS_SEMANA = ("Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo")
+
+
+class StringDictionary:
+    """Append-only dictionary encoding of a string column (value <-> int32 code)."""
+
+    def __init__(self):
+        self._codes: Dict[Optional[str], int] = {}
+        self.values: List[Optional[str]] = []
+
+    def encode(self, value: Optional[str]) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def encode_many(self, values: Sequence[Optional[str]]) -> np.ndarray:
+        return np.fromiter((self.encode(v) for v in values), dtype=np.int32, count=len(values))
+
+    def lookup(self, value: Optional[str]) -> Optional[int]:
+        return self._codes.get(value)
+
+    def decode(self, code: int) -> Optional[str]:
+        return self.values[code]
+
+
+def _empty_columns() -> Dict[str, np.ndarray]:
+    return {
+        "id_trabajo": np.empty(0, dtype=np.int64),
+        "id_coche": np.empty(0, dtype=np.int64),
+        "dni_trabajador": np.empty(0, dtype=np.int64),
+        "fecha": np.empty(0, dtype="datetime64[D]"),
+        "cliente": np.empty(0, dtype=np.int32),
+        "lugar_trabajo": np.empty(0, dtype=np.int32),
+        "horas_trabajadas": np.empty(0, dtype=np.float64),
+        "tiempo_llegada": np.empty(0, dtype=np.float64),
+    }
+
+
+class ColumnarSnapshot:
+    """
+    Columnar copy of formularios_trabajo ⋈ trabajos.
+
+    Column arrays are never mutated in place: every refresh builds new arrays and
+    swaps the dict reference, so readers always see a consistent snapshot without
+    taking a lock.
+    """
+
+    def __init__(self):
+        self._fetch_lock = threading.Lock()  # one refresh at a time
+        self._refresh_lock = threading.Lock()  # swaps and merges of the column arrays
+        # Rows ingested while a full refresh reads the database, merged again after its swap
+        self._pending: Optional[List[Tuple]] = None
+        self._columns: Optional[Dict[str, np.ndarray]] = None
+        self._positions: Dict[int, int] = {}
+        self.dictionaries = {"cliente": StringDictionary(), "lugar_trabajo": StringDictionary()}
+        self.watermark: Optional[datetime] = None  # latest updated_at (naive UTC) read from the database
+        self.version = 0
+        self.refreshed_at: Optional[datetime] = None
+        self._last_full_refresh = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._columns is not None
+
+    @property
+    def row_count(self) -> int:
+        return 0 if self._columns is None else len(self._columns["id_trabajo"])
+
+    # --- Loading -----------------------------------------------------------
+    def _fetch(self, since: Optional[datetime]) -> Tuple[List[Tuple], Optional[datetime]]:
+        """Rows whose form or trabajo changed after `since` (all if None), and their latest updated_at."""
+        if connection.SessionLocal is None:
+            raise RuntimeError("Database session factory (SessionLocal) is not configured.")
+        stmt = (
+            select(
+                FormularioTrabajo.id_trabajo,
+                FormularioTrabajo.id_coche,
+                FormularioTrabajo.dni_trabajador,
+                Trabajo.fecha,
+                Trabajo.cliente,
+                FormularioTrabajo.lugar_trabajo,
+                FormularioTrabajo.horas_trabajadas,
+                FormularioTrabajo.tiempo_llegada,
+                FormularioTrabajo.updated_at,
+                Trabajo.updated_at,
+            )
+            .join(Trabajo, FormularioTrabajo.id_trabajo == Trabajo.id)
+            .order_by(FormularioTrabajo.id_trabajo)
+        )
+        if since is not None:
+            cutoff = since - timedelta(seconds=WATERMARK_OVERLAP_SECONDS)
+            stmt = stmt.where(or_(FormularioTrabajo.updated_at > cutoff, Trabajo.updated_at > cutoff))
+        db = connection.SessionLocal()
+        try:
+            result = db.execute(stmt).all()
+        finally:
+            db.close()
+        rows, latest = [], None
+        for row in result:
+            rows.append(tuple(row[:8]))
+            for stamp in row[8:]:
+                if stamp is not None and (latest is None or stamp > latest):
+                    latest = stamp
+        return rows, latest
+
+    def _encode(self, rows: Sequence[Tuple]) -> Dict[str, np.ndarray]:
+        if not rows:
+            return _empty_columns()
+        ids, coches, dnis, fechas, clientes, lugares, horas, tiempos = zip(*rows)
+        n = len(rows)
+        return {
+            "id_trabajo": np.fromiter(ids, dtype=np.int64, count=n),
+            "id_coche": np.fromiter(coches, dtype=np.int64, count=n),
+            "dni_trabajador": np.fromiter(dnis, dtype=np.int64, count=n),
+            "fecha": to_day_array(fechas),
+            "cliente": self.dictionaries["cliente"].encode_many(clientes),
+            "lugar_trabajo": self.dictionaries["lugar_trabajo"].encode_many(lugares),
+            "horas_trabajadas": np.array(horas, dtype=np.float64),
+            "tiempo_llegada": np.array(tiempos, dtype=np.float64),
+        }
+
+    def _replace(self, rows: Sequence[Tuple]):
+        columns = self._encode(rows)
+        self._positions = {int(id_): pos for pos, id_ in enumerate(columns["id_trabajo"])}
+        self._publish(columns)
+
+    def _merge(self, rows: Sequence[Tuple]):
+        if not rows:
+            return
+        incoming = self._encode(rows)
+        current = self._columns if self._columns is not None else _empty_columns()
+        existing_pos, new_idx = [], []
+        for i, id_ in enumerate(incoming["id_trabajo"]):
+            pos = self._positions.get(int(id_))
+            if pos is None:
+                new_idx.append(i)
+            else:
+                existing_pos.append((pos, i))
+
+        merged = {}
+        for name, column in current.items():
+            if existing_pos:
+                column = column.copy()
+                targets, sources = zip(*existing_pos)
+                column[list(targets)] = incoming[name][list(sources)]
+            if new_idx:
+                column = np.concatenate([column, incoming[name][new_idx]])
+            merged[name] = column
+
+        base = len(current["id_trabajo"])
+        for offset, i in enumerate(new_idx):
+            self._positions[int(incoming["id_trabajo"][i])] = base + offset
+        self._publish(merged)
+
+    def _publish(self, columns: Dict[str, np.ndarray]):
+        self._columns = columns
+        self.version += 1
+        self.refreshed_at = datetime.now()
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        Bring the snapshot up to date. Returns the number of rows fetched.
+        A full rebuild is forced on first load and every FULL_REFRESH_SECONDS.
+        The database is read without holding the swap lock, so write-through
+        ingests never wait for it.
+        """
+        with self._fetch_lock:
+            with self._refresh_lock:
+                now = time.monotonic()
+                full = full or self._columns is None or now - self._last_full_refresh > FULL_REFRESH_SECONDS
+                since = None if full else self.watermark
+                if full:
+                    self._pending = []
+            try:
+                rows, latest = self._fetch(since)
+            except BaseException:
+                with self._refresh_lock:
+                    self._pending = None
+                raise
+            with self._refresh_lock:
+                if full:
+                    self._replace(rows)
+                    # Forms ingested while the rows were read may be missing from them
+                    self._merge(self._pending)
+                    self._pending = None
+                    self._last_full_refresh = now
+                else:
+                    self._merge(rows)
+                if full or (latest is not None and (self.watermark is None or latest > self.watermark)):
+                    self.watermark = latest
+            logger.debug("Analytics snapshot refreshed: %d rows fetched, %d total", len(rows), self.row_count)
+            return len(rows)
+
+    def ingest_formulario_trabajo(self, formulario: FormularioTrabajo, trabajo: Trabajo):
+        """Write-through hook for a freshly committed formulario de trabajo."""
+        if self._columns is None and self._pending is None:
+            return  # the first load will pick it up
+        row = (
+            formulario.id_trabajo,
+            formulario.id_coche,
+            formulario.dni_trabajador,
+            trabajo.fecha,
+            trabajo.cliente,
+            formulario.lugar_trabajo,
+            formulario.horas_trabajadas,
+            formulario.tiempo_llegada,
+        )
+        try:
+            with self._refresh_lock:
+                if self._pending is not None:
+                    self._pending.append(row)
+                if self._columns is not None:
+                    self._merge([row])
+        except Exception as e:
+            logger.warning("Could not ingest formulario %s into analytics snapshot: %s", formulario.id_trabajo, e)
+
+    def ensure_loaded(self):
+        if self._columns is None:
+            self.refresh(full=True)
+
+    # --- Querying ----------------------------------------------------------
+    def _filter_mask(self, columns: Dict[str, np.ndarray], filters: Dict) -> np.ndarray:
+        mask = np.ones(len(columns["id_trabajo"]), dtype=bool)
+        for field in ("dni_trabajador", "id_coche", "id_trabajo"):
+            if filters.get(field) is not None:
+                mask &= columns[field] == filters[field]
+        for field in ("cliente", "lugar_trabajo"):
+            if filters.get(field) is not None:
+                code = self.dictionaries[field].lookup(filters[field])
+                if code is None:
+                    return np.zeros_like(mask)
+                mask &= columns[field] == code
+        if filters.get("fecha_inicio") is not None:
+            mask &= columns["fecha"] >= np.datetime64(filters["fecha_inicio"], "D")
+        if filters.get("fecha_fin") is not None:
+            mask &= columns["fecha"] <= np.datetime64(filters["fecha_fin"], "D")
+        return mask
+
+    @staticmethod
+    def _dimension_keys(columns: Dict[str, np.ndarray], dimension: str) -> np.ndarray:
+        if dimension in ("lugar_trabajo", "cliente", "dni_trabajador", "id_coche"):
+            return columns[dimension].astype(np.int64)
+        fecha = columns["fecha"]
+        if dimension == "anio":
+            return fecha.astype("datetime64[Y]").astype(np.int64)
+        if dimension == "mes":
+            return fecha.astype("datetime64[M]").astype(np.int64)
+        days = fecha.astype(np.int64)
+        if dimension == "dia":
+            return days
+        # dia_semana: 1970-01-01 was a Thursday (3 with Monday=0)
+        return np.where(days == _NAT, _NAT, (days + 3) % 7)
+
+    def _decode(self, dimension: str, key: int):
+        if key == _NAT:
+            return None
+        if dimension in ("lugar_trabajo", "cliente"):
+            return self.dictionaries[dimension].decode(int(key))
+        if dimension in ("dni_trabajador", "id_coche"):
+            return int(key)
+        if dimension == "anio":
+            return 1970 + int(key)
+        if dimension == "mes":
+            return str(np.datetime64(int(key), "M"))
+        if dimension == "dia":
+            return str(np.datetime64(int(key), "D"))
+        return _DIAS_SEMANA[int(key)]
+
+    def aggregate(self, group_by: Sequence[str], measures: Sequence[Tuple[str, Optional[str]]], filters: Dict) -> Dict:
+        """
+        Group the (filtered) snapshot by `group_by` and compute `measures`,
+        given as (aggregate, field) pairs, e.g. ("avg", "tiempo_llegada") or ("count", None).
+        """
+        for dimension in group_by:
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"Dimensión no soportada: {dimension}. Opciones: {', '.join(DIMENSIONS)}")
+        for func, field in measures:
+            if func not in AGGREGATES:
+                raise ValueError(f"Agregación no soportada: {func}. Opciones: {', '.join(AGGREGATES)}")
+            if func != "count" and field not in MEASURE_FIELDS:
+                raise ValueError(f"Medida no soportada: {field}. Opciones: {', '.join(MEASURE_FIELDS)}")
+
+        self.ensure_loaded()
+        columns = self._columns
+        mask = self._filter_mask(columns, filters)
+        selected = {name: column[mask] for name, column in columns.items()}
+        n_rows = int(mask.sum())
+
+        if group_by:
+            keys = np.stack([self._dimension_keys(selected, d) for d in group_by], axis=1)
+            if n_rows:
+                unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+                inverse = inverse.reshape(-1)
+            else:
+                unique_keys, inverse = keys, np.empty(0, dtype=np.int64)
+        else:
+            unique_keys = np.empty((1 if n_rows else 0, 0), dtype=np.int64)
+            inverse = np.zeros(n_rows, dtype=np.int64)
+        n_groups = len(unique_keys)
+
+        results = {}
+        order = starts = None
+        for func, field in measures:
+            label = "count" if func == "count" and field is None else f"{func}_{field}"
+            if func == "count" and field is None:
+                results[label] = np.bincount(inverse, minlength=n_groups).astype(np.float64)
+                continue
+            values = selected[field]
+            valid = ~np.isnan(values)
+            if func == "count":
+                results[label] = np.bincount(inverse[valid], minlength=n_groups).astype(np.float64)
+            elif func in ("sum", "avg"):
+                sums = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=n_groups)
+                counts = np.bincount(inverse[valid], minlength=n_groups)
+                if func == "sum":
+                    results[label] = np.where(counts > 0, sums, np.nan)
+                else:
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        results[label] = sums / counts
+            else:
+                if order is None:
+                    order = np.argsort(inverse, kind="stable")
+                    starts = np.searchsorted(inverse[order], np.arange(n_groups))
+                reducer = np.fmin if func == "min" else np.fmax
+                results[label] = reducer.reduceat(values[order], starts) if n_groups else np.empty(0)
+
+        rows = []
+        for g in range(n_groups):
+            row = {d: self._decode(d, unique_keys[g, i]) for i, d in enumerate(group_by)}
+            for label, values in results.items():
+                value = values[g]
+                if label == "count" or label.startswith("count_"):
+                    row[label] = int(value)
+                else:
+                    row[label] = None if np.isnan(value) else round(float(value), 4)
+            rows.append(row)
+
+        return {
+            "group_by": list(group_by),
+            "measures": list(results.keys()),
+            "filas_filtradas": n_rows,
+            "rows": rows,
+            "snapshot": {
+                "rows": self.row_count,
+                "version": self.version,
+                "refreshed_at": self.refreshed_at.isoformat() if self.refreshed_at else None,
+            },
+        }
+
+
+snapshot = ColumnarSnapshot()
+
+_refresher_started = False
+
+
+def _refresh_loop():
+    while True:
+        try:
+            snapshot.refresh()
+        except Exception as e:
+            logger.warning("Analytics snapshot refresh failed: %s", e)
+        time.sleep(REFRESH_SECONDS)
+
+
+def start_background_refresh():
+    """Load the snapshot and keep it fresh from a daemon thread (first load included)."""
+    global _refresher_started
+    if _refresher_started or connection.SessionLocal is None:
+        return
+    _refresher_started = True
+    threading.Thread(target=_refresh_loop, name="analytics-snapshot", daemon=True).start()
@@ -0,0 +1,235 @@
+"""
+Change feed of incidencias for GET /api/incidencias/stream (Server-Sent Events).
+
+save_incidencia and resolve_incidencia publish the incidence they committed
+to an in-process broker; every open stream receives it as an `incidencia`
+event whose data is the row as GET /api/incidencias returns it.
+
+- Event ids are `<process epoch>-<sequence>`. The broker keeps the last
+  INCIDENCIAS_STREAM_HISTORY events, so a browser that reconnects with
+  `Last-Event-ID` gets what it missed; if that id is older than the history
+  or comes from another process (restart, other worker) it gets a `reset`
+  event instead and reloads the list.
+- Each subscriber buffers at most INCIDENCIAS_STREAM_QUEUE undelivered
+  events. A client that does not keep up loses its buffer and gets `reset`,
+  so a stuck screen never holds more than that in memory.
+- Writes made by other workers (or the ingest committer of another process)
+  bump the "incidencias" version stamp. While a worker has subscribers it
+  checks the stamp every INCIDENCIAS_STREAM_POLL_SECONDS and publishes the
+  rows whose updated_at moved, skipping those it already published.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from app.database import connection
+from app.models.models import Incidencia, utcnow
+from app.schemas.schemas import IncidenciaOut
+from app.utils import versions
+from app.utils.serialization import columns_for, dumps_display
+
+logger = logging.getLogger(__name__)
+
+INCIDENCIAS_STREAM_HISTORY = int(os.getenv("INCIDENCIAS_STREAM_HISTORY", "1000"))
+INCIDENCIAS_STREAM_QUEUE = int(os.getenv("INCIDENCIAS_STREAM_QUEUE", "256"))
+INCIDENCIAS_STREAM_POLL_SECONDS = float(os.getenv("INCIDENCIAS_STREAM_POLL_SECONDS", "1"))
+# Rows committed by another worker shortly before its stamp bump
+WATCH_OVERLAP_SECONDS = 5
+
+
+class Event:
+    __slots__ = ("seq", "id", "name", "data")
+
+    def __init__(self, seq: int, id: str, name: str, data: bytes):
+        self.seq = seq
+        self.id = id
+        self.name = name
+        self.data = data
+
+    def encode(self) -> bytes:
+        return b"id: %s\nevent: %s\ndata: %s\n\n" % (self.id.encode(), self.name.encode(), self.data)
+
+
+class Subscription:
+    """Events published for one stream and not yet sent. Filled from any thread, read from the event loop."""
+    __slots__ = ("_loop", "_wakeup", "_events", "_limit", "overflowed")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, limit: int):
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._events: deque = deque()
+        self._limit = limit
+        self.overflowed = False
+
+    def _push(self, event: Event):
+        # Called with the broker lock held
+        if self.overflowed:
+            return
+        if len(self._events) >= self._limit:
+            self._events.clear()
+            self.overflowed = True
+        else:
+            self._events.append(event)
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:  # loop closed: the stream is gone
+            pass
+
+    async def wait(self, timeout: float) -> Optional[List[Event]]:
+        """
+        Pending events (empty after `timeout` seconds without any), or None if
+        some were dropped since the last call and the client must reload.
+        """
+        if not self._events and not self.overflowed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self._wakeup.clear()
+        if self.overflowed:
+            self.overflowed = False
+            return None
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        return events
+
+
+class Broker:
+    """In-process publish/subscribe with a bounded history for resuming streams."""
+
+    def __init__(self, history: int, queue_size: int):
+        self.epoch = format(time.time_ns() // 1_000_000, "x")
+        self._queue_size = queue_size
+        self._history: deque = deque(maxlen=history)
+        self._subscribers: Set[Subscription] = set()
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def publish(self, name: str, data: bytes) -> Event:
+        with self._lock:
+            self._seq += 1
+            event = Event(self._seq, f"{self.epoch}-{self._seq}", name, data)
+            self._history.append(event)
+            for subscription in self._subscribers:
+                subscription._push(event)
+        return event
+
+    def subscribe(self, last_event_id: Optional[str]) -> Tuple[Subscription, Optional[List[Event]]]:
+        """
+        A new subscription and the events after `last_event_id` to send first,
+        or None if they are no longer known (the client must reload).
+        """
+        subscription = Subscription(asyncio.get_running_loop(), self._queue_size)
+        with self._lock:
+            replay: Optional[List[Event]] = []
+            if last_event_id:
+                replay = self._since(last_event_id)
+            self._subscribers.add(subscription)
+        return subscription, replay
+
+    def _since(self, last_event_id: str) -> Optional[List[Event]]:
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > self._seq:
+            return None
+        oldest = self._history[0].seq if self._history else self._seq + 1
+        if seq < oldest - 1:
+            return None
+        return [event for event in self._history if event.seq > seq]
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+broker = Broker(INCIDENCIAS_STREAM_HISTORY, INCIDENCIAS_STREAM_QUEUE)
+
+_COLUMNS = columns_for(Incidencia, IncidenciaOut)
+_FIELDS = [column.key for column in _COLUMNS]
+
+# id_incidencia -> updated_at of the version already published (bounded)
+_published: "OrderedDict[int, object]" = OrderedDict()
+_published_lock = threading.Lock()
+
+
+def _claim(id_incidencia: int, updated_at) -> bool:
+    """True the first time a given version of a row is seen."""
+    with _published_lock:
+        if updated_at is not None and _published.get(id_incidencia) == updated_at:
+            return False
+        _published[id_incidencia] = updated_at
+        _published.move_to_end(id_incidencia)
+        while len(_published) > INCIDENCIAS_STREAM_HISTORY:
+            _published.popitem(last=False)
+        return True
+
+
+def _publish_row(values: Dict, updated_at):
+    if _claim(values["id_incidencia"], updated_at):
+        broker.publish("incidencia", dumps_display(values))
+
+
+def safe_publish(incidencia: Incidencia):
+    """Write-path hook after a committed insert/update: the feed must never fail the request."""
+    try:
+        _publish_row({field: getattr(incidencia, field) for field in _FIELDS}, incidencia.updated_at)
+    except Exception as e:
+        logger.warning("Incidencias feed publish failed: %s", e)
+
+
+# --- Writes from other processes ---------------------------------------------
+_watcher_started = False
+_watcher_lock = threading.Lock()
+
+
+def _watch_loop():
+    version = versions.current("incidencias")
+    watermark = utcnow()
+    while True:
+        time.sleep(INCIDENCIAS_STREAM_POLL_SECONDS)
+        if not broker.subscriber_count():
+            continue
+        current = versions.current("incidencias")
+        if current == version:
+            continue
+        version = current
+        db = connection.SessionLocal()
+        try:
+            rows = db.execute(
+                select(*_COLUMNS, Incidencia.updated_at)
+                .where(Incidencia.updated_at > watermark - timedelta(seconds=WATCH_OVERLAP_SECONDS))
+                .order_by(Incidencia.updated_at)
+            ).all()
+            for row in rows:
+                values = dict(zip(_FIELDS, row))
+                _publish_row(values, row.updated_at)
+                watermark = max(watermark, row.updated_at)
+        except Exception as e:
+            logger.warning("Incidencias feed watcher failed: %s", e)
+        finally:
+            db.close()
+
+
+def ensure_watcher():
+    """Start the cross-process watcher on the first subscription (idempotent)."""
+    global _watcher_started
+    if _watcher_started or connection.SessionLocal is None:
+        return
+    with _watcher_lock:
+        if _watcher_started:
+            return
+        _watcher_started = True
+    threading.Thread(target=_watch_loop, name="incidencias-feed", daemon=True).start()
@@ -0,0 +1,336 @@
+"""
+Local "similar past incidents" index over Incidencia.descripcion.
+
+Descriptions are embedded without any network call: word stems (bigrams
+included) and character n-grams of the accent-folded text are hashed into a
+fixed number of dimensions with a sign bit, weighted with sublinear TF and
+L2-normalized. Document frequencies are tracked per dimension, and the IDF
+weighting is applied at query time, so inserts never require re-embedding.
+
+Vectors, ids and document frequencies live in memory-mapped files under
+SEPCAN_DATA_DIR/incident_vectors, so a restarted worker maps them instantly
+and only embeds incidences created since the last sync. Appends are
+serialized across workers with a file lock, and readers pick up rows appended
+by other workers by re-reading the small JSON header.
+
+The header also records which database the index was built from: its URL
+(without the password) and a hash of its first incidences. A different
+DATABASE_URL, a reset or a restored backup (the highest id went back) makes
+the next sync rebuild the index from scratch instead of answering with
+vectors of rows that no longer exist.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app.database import connection
+from app.models.models import Incidencia
+from app.services.search_index import analyze, fold
+from app.utils.storage import data_path
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DIM = int(os.getenv("INCIDENT_VECTOR_DIM", "1024"))
+CHAR_NGRAMS = (3, 4, 5)
+INITIAL_CAPACITY = 1024
+FILES = ("vectors.f32", "ids.i64", "df.f64", "header.json")
+# Incidences hashed into the database fingerprint, and how often sync() checks it
+FINGERPRINT_ROWS = 32
+FINGERPRINT_CHECK_SECONDS = 60.0
+
+
+def embed(text: Optional[str], dim: int = VECTOR_DIM) -> np.ndarray:
+    """Hashed n-gram embedding of `text` (L2-normalized, float32)."""
+    features = Counter()
+    stems = [term for term, _, _ in analyze(text)]
+    features.update(f"w:{s}" for s in stems)
+    features.update(f"b:{a}_{b}" for a, b in zip(stems, stems[1:]))
+    for word in fold(text or "").split():
+        padded = f"<{word}>"
+        for n in CHAR_NGRAMS:
+            features.update(f"c:{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, tf in features.items():
+        h = zlib.crc32(feature.encode("utf-8"))
+        sign = 1.0 if h & 0x80000000 else -1.0
+        vector[h % dim] += sign * (1.0 + math.log(tf))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class IncidentVectorIndex:
+    """Append-only cosine index persisted as memory-mapped arrays."""
+
+    def __init__(self, directory: Optional[str] = None, dim: int = VECTOR_DIM):
+        self._directory = directory
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._vectors: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+        self._df: Optional[np.memmap] = None
+        self._positions: Dict[int, int] = {}
+        self.count = 0
+        self.capacity = 0
+        self.synced_id: Optional[int] = None  # highest id_incidencia read by sync()
+        self.database: Optional[str] = None  # fingerprint of the database the index was built from
+        self.generation: Optional[str] = None  # changes on every rebuild, so other workers remap
+        self._checked_at = 0.0
+        self._header_mtime = None
+        self._norm_cache: Optional[Tuple[int, np.ndarray, np.ndarray]] = None
+
+    # --- Files -------------------------------------------------------------
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            self._directory = os.path.dirname(data_path("incident_vectors", "header.json"))
+        return self._directory
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _map(self, capacity: int):
+        os.makedirs(self.directory, exist_ok=True)
+        for name, itemsize, rows in (("vectors.f32", 4 * self.dim, capacity), ("ids.i64", 8, capacity), ("df.f64", 8 * self.dim, 1)):
+            path = self._path(name)
+            size = itemsize * rows
+            if not os.path.exists(path) or os.path.getsize(path) < size:
+                with open(path, "ab") as f:
+                    f.truncate(size)
+        self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._ids = np.memmap(self._path("ids.i64"), dtype=np.int64, mode="r+", shape=(capacity,))
+        self._df = np.memmap(self._path("df.f64"), dtype=np.float64, mode="r+", shape=(self.dim,))
+        self.capacity = capacity
+
+    def _read_header(self) -> Dict:
+        try:
+            with open(self._path("header.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"dim": self.dim, "count": 0, "capacity": INITIAL_CAPACITY}
+
+    def _write_header(self):
+        tmp = self._path("header.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity, "synced_id": self.synced_id,
+                       "database": self.database, "generation": self.generation}, f)
+        os.replace(tmp, self._path("header.json"))
+        self._header_mtime = os.stat(self._path("header.json")).st_mtime_ns
+
+    def _reload_if_changed(self):
+        """Map the files on first use and pick up rows appended by other workers."""
+        try:
+            mtime = os.stat(self._path("header.json")).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._vectors is not None and mtime == self._header_mtime:
+            return
+        header = self._read_header()
+        if header.get("dim", self.dim) != self.dim:
+            logger.warning("Incident vector files use dim=%s, expected %s; rebuilding", header.get("dim"), self.dim)
+            self._remove_files()
+            header = {"count": 0, "capacity": INITIAL_CAPACITY}
+        if header.get("generation") != self.generation:
+            # Rebuilt (by this or another worker): the mapped files are gone
+            self._vectors = None
+            self._positions = {}
+            self.count = 0
+            self.generation = header.get("generation")
+        if self._vectors is None or header["capacity"] != self.capacity:
+            self._map(header["capacity"])
+        for pos in range(min(self.count, header["count"]), header["count"]):
+            self._positions[int(self._ids[pos])] = pos
+        self.count = header["count"]
+        self.synced_id = header.get("synced_id")
+        self.database = header.get("database")
+        self._header_mtime = mtime
+        self._norm_cache = None
+
+    def _remove_files(self):
+        for name in FILES:
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+
+    def _file_lock(self):
+        index = self
+
+        class _Lock:
+            def __enter__(self):
+                self.handle = open(index._path("lock"), "a")
+                if fcntl is not None:
+                    fcntl.flock(self.handle, fcntl.LOCK_EX)
+                return self
+
+            def __exit__(self, *exc):
+                if fcntl is not None:
+                    fcntl.flock(self.handle, fcntl.LOCK_UN)
+                self.handle.close()
+
+        os.makedirs(self.directory, exist_ok=True)
+        return _Lock()
+
+    # --- Writes ------------------------------------------------------------
+    def add_many(self, rows: List[Tuple[int, Optional[str]]]) -> int:
+        """Embed and append (id_incidencia, descripcion) pairs not yet stored. Returns rows added."""
+        if not rows:
+            return 0
+        with self._lock, self._file_lock():
+            self._reload_if_changed()
+            new_rows = [(i, text) for i, text in rows if i not in self._positions]
+            if not new_rows:
+                return 0
+            needed = self.count + len(new_rows)
+            if needed > self.capacity:
+                capacity = max(self.capacity * 2, needed, INITIAL_CAPACITY)
+                self._vectors.flush()
+                self._map(capacity)
+            for id_incidencia, text in new_rows:
+                vector = embed(text, self.dim)
+                self._vectors[self.count] = vector
+                self._ids[self.count] = id_incidencia
+                self._df += vector != 0
+                self._positions[id_incidencia] = self.count
+                self.count += 1
+            self._vectors.flush()
+            self._ids.flush()
+            self._df.flush()
+            self._write_header()
+            self._norm_cache = None
+            return len(new_rows)
+
+    def add(self, id_incidencia: int, descripcion: Optional[str]):
+        self.add_many([(id_incidencia, descripcion)])
+
+    def _fingerprint(self, db) -> Tuple[str, Optional[int]]:
+        """
+        Fingerprint of the database (URL and first incidences) and its highest
+        id, read from the primary: a lagging replica must not look like a reset.
+        """
+        primary = connection.SessionLocal() if connection.SessionLocal is not None else None
+        session = primary or db
+        try:
+            url = session.get_bind().url.render_as_string(hide_password=True)
+            head = session.execute(
+                select(Incidencia.id_incidencia, Incidencia.descripcion)
+                .order_by(Incidencia.id_incidencia).limit(FINGERPRINT_ROWS)
+            ).all()
+            max_id = session.execute(select(func.max(Incidencia.id_incidencia))).scalar()
+        finally:
+            if primary is not None:
+                primary.close()
+        digest = hashlib.sha256(url.encode("utf-8"))
+        for id_incidencia, descripcion in head:
+            digest.update(f"{id_incidencia}\x00{descripcion or ''}\x00".encode("utf-8"))
+        return digest.hexdigest(), max_id
+
+    def _check_database(self, db):
+        """Rebuild the index if it was built from another database (or an older state of this one)."""
+        now = time.monotonic()
+        if self._checked_at and now - self._checked_at < FINGERPRINT_CHECK_SECONDS:
+            return
+        fingerprint, max_id = self._fingerprint(db)
+        with self._lock, self._file_lock():
+            self._reload_if_changed()
+            self._checked_at = now
+            went_back = self.synced_id is not None and (max_id is None or max_id < self.synced_id)
+            if self.database == fingerprint and not went_back:
+                return
+            if self.database is not None or self.count:
+                logger.warning("Incident vector index was built from another database state; rebuilding")
+            self._remove_files()
+            self.generation = os.urandom(8).hex()
+            self._vectors = None
+            self._positions = {}
+            self.count = 0
+            self.synced_id = None
+            self.database = fingerprint
+            self._map(INITIAL_CAPACITY)
+            self._write_header()
+            self._norm_cache = None
+
+    def sync(self, db) -> int:
+        """
+        Embed incidences created since the last sync. The watermark is kept
+        apart from the stored ids: add() may have appended newer incidences
+        (write path) before the older ones were ever synced.
+        """
+        self._check_database(db)
+        with self._lock:
+            self._reload_if_changed()
+            last_id = self.synced_id
+        stmt = select(Incidencia.id_incidencia, Incidencia.descripcion).order_by(Incidencia.id_incidencia)
+        if last_id is not None:
+            stmt = stmt.where(Incidencia.id_incidencia > last_id)
+        rows = [tuple(row) for row in db.execute(stmt)]
+        added = self.add_many(rows)
+        if rows:
+            with self._lock, self._file_lock():
+                self._reload_if_changed()
+                self.synced_id = max(self.synced_id or 0, rows[-1][0])
+                self._write_header()
+        if added:
+            logger.info("Incident vector index: embedded %d new incidences", added)
+        return added
+
+    # --- Queries -----------------------------------------------------------
+    def _weights(self) -> Tuple[np.ndarray, np.ndarray]:
+        """IDF² weights per dimension and the IDF-weighted norm of every stored vector."""
+        if self._norm_cache is None or self._norm_cache[0] != self.count:
+            idf = np.log((1.0 + self.count) / (1.0 + np.asarray(self._df))) + 1.0
+            weights = (idf * idf).astype(np.float32)
+            vectors = self._vectors[:self.count]
+            norms = np.sqrt(np.square(vectors) @ weights)
+            self._norm_cache = (self.count, weights, norms)
+        return self._norm_cache[1], self._norm_cache[2]
+
+    def similar(self, text: Optional[str] = None, id_incidencia: Optional[int] = None, limit: int = 5) -> List[Tuple[int, float]]:
+        """Top `limit` (id_incidencia, cosine similarity) pairs for a stored incidence or a free text."""
+        with self._lock:
+            self._reload_if_changed()
+            if self.count == 0:
+                return []
+            if id_incidencia is not None:
+                pos = self._positions.get(id_incidencia)
+                if pos is None:
+                    raise KeyError(id_incidencia)
+                query = np.array(self._vectors[pos])
+            else:
+                query = embed(text, self.dim)
+            weights, norms = self._weights()
+            weighted = query * weights
+            query_norm = math.sqrt(float(query @ weighted))
+            if query_norm == 0:
+                return []
+            scores = (self._vectors[:self.count] @ weighted) / (norms * query_norm + 1e-12)
+            if id_incidencia is not None:
+                scores[self._positions[id_incidencia]] = -np.inf
+            k = min(limit, self.count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(self._ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i]) and scores[i] > 0]
+
+
+index = IncidentVectorIndex()
+
+
+def safe_add(incidencia):
+    """Write-path hook: embedding problems must never fail the request that triggered them."""
+    try:
+        index.add(incidencia.id_incidencia, incidencia.descripcion)
+    except Exception as e:
+        logger.warning("Incident vector index update failed: %s", e)
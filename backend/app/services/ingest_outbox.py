@@ -0,0 +1,426 @@
+"""
+Durable local outbox for form submissions.
+
+When the database is slow or failing over, the form endpoints append the
+validated submission to a local SQLite queue and answer 202 at once; a
+background committer drains the queue into the database. The queue runs in
+WAL mode with synchronous=FULL, so an acknowledged submission survives a
+crash of the worker or the host.
+
+INGEST_MODE:
+    direct    every submission is written to the database in the request
+    fallback  (default) written in the request, but queued when the database
+              is unreachable, and while older submissions are still queued
+              (they keep their order and new ones do not wait on a failing
+              database)
+    queue     every submission is queued
+
+The committer (one per host: a file lock picks the worker that drains):
+
+- applies pending entries in arrival order, INGEST_BATCH_SIZE per
+  transaction (group commit), each inside a SAVEPOINT so that one bad entry
+  does not fail its group;
+- dedup: an entry has a key (kind and id_trabajo for the forms). A repeated
+  submission with the same payload gets the first one's receipt, a different
+  one is refused. A form already stored in the database (a crash between
+  the database commit and the queue update, or a resubmission of a form
+  saved directly) is not stored again, but its hooks run, so they must be
+  idempotent;
+- poison messages: an entry its handler rejects (missing coche, another form
+  for the job...) or that fails INGEST_MAX_ATTEMPTS times is set aside as
+  'dead' with its error (GET /api/admin/ingest, replay with POST
+  /api/admin/ingest/{seq}/retry);
+- a database that cannot be reached fails the whole group, which is retried
+  with exponential backoff;
+- after a group commits, each entry's after_commit hook runs (search index,
+  version stamps, incidence classification). Entries are marked 'committed'
+  in between, so hooks interrupted by a crash run again on restart. A hook
+  that fails (the classifier is down...) keeps its entry 'committed' and is
+  retried with backoff from INGEST_HOOK_RETRY_SECONDS; after
+  INGEST_MAX_ATTEMPTS failures the entry is set aside as 'dead', and a
+  replay finds the form stored and runs the hooks again.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import exc as sa_exc
+
+from app.database import connection
+from app.utils.storage import data_path
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INGEST_MODE = os.getenv("INGEST_MODE", "fallback").lower()
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "100"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+INGEST_RETENTION_DAYS = float(os.getenv("INGEST_RETENTION_DAYS", "7"))
+INGEST_HOOK_RETRY_SECONDS = float(os.getenv("INGEST_HOOK_RETRY_SECONDS", "30"))
+POLL_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 30.0
+
+if INGEST_MODE not in ("direct", "fallback", "queue"):
+    raise ValueError(f"Unknown INGEST_MODE '{INGEST_MODE}'. Use direct, fallback or queue.")
+
+
+class Rejected(Exception):
+    """Raised by a handler for an entry that can never be applied (it becomes 'dead')."""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+class Conflict(Exception):
+    """A different submission with the same dedup key is already queued or stored."""
+
+
+class Receipt:
+    __slots__ = ("seq", "duplicate")
+
+    def __init__(self, seq: int, duplicate: bool):
+        self.seq = seq
+        self.duplicate = duplicate
+
+
+class Handler:
+    """
+    How to apply one kind of entry. `apply(db, item)` adds the rows inside the
+    committer's transaction and returns False if the item was already stored;
+    `after_commit(db, item)` runs the side effects once it is committed, and
+    again for an item found already stored or after a failure, so it must be
+    idempotent.
+    """
+    __slots__ = ("kind", "schema", "key", "apply", "after_commit")
+
+    def __init__(self, kind: str, schema, key: Callable, apply: Callable, after_commit: Optional[Callable]):
+        self.kind = kind
+        self.schema = schema
+        self.key = key
+        self.apply = apply
+        self.after_commit = after_commit
+
+
+_handlers: Dict[str, Handler] = {}
+
+
+def register(kind: str, schema, key: Callable, apply: Callable, after_commit: Optional[Callable] = None):
+    _handlers[kind] = Handler(kind, schema, key, apply, after_commit)
+
+
+def unavailable(error: BaseException) -> bool:
+    """True for errors that mean the database cannot be reached (not that the data is wrong)."""
+    if isinstance(error, (sa_exc.OperationalError, sa_exc.TimeoutError, sa_exc.DisconnectionError)):
+        return True
+    return isinstance(error, sa_exc.DBAPIError) and error.connection_invalidated
+
+
+class Outbox:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or data_path("ingest", "outbox.sqlite3")
+        self._local = threading.local()
+        # seq -> time before which a failed hook is not retried (in memory: a restart retries at once)
+        self._hook_retry_at: Dict[int, float] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")  # the 202 promises the entry is on disk
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, dedup_key TEXT NOT NULL,"
+                " payload TEXT NOT NULL, payload_hash TEXT NOT NULL, received_at REAL NOT NULL,"
+                " state TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,"
+                " last_error TEXT, committed_at REAL)"
+            )
+            # Dead entries do not block a corrected resubmission
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS outbox_dedup ON outbox (dedup_key) WHERE state != 'dead'")
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state, seq)")
+            self._local.conn = conn
+        return conn
+
+    # --- Ingest ------------------------------------------------------------
+    def enqueue(self, kind: str, item: BaseModel) -> Receipt:
+        """Store a validated submission. Raises Conflict if another one holds its dedup key."""
+        payload = item.model_dump_json()
+        payload_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        dedup_key = f"{kind}:{_handlers[kind].key(item)}"
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT seq, payload_hash FROM outbox WHERE dedup_key = ? AND state != 'dead'", (dedup_key,),
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                if row[1] != payload_hash:
+                    raise Conflict(dedup_key)
+                return Receipt(row[0], duplicate=True)
+            seq = conn.execute(
+                "INSERT INTO outbox (kind, dedup_key, payload, payload_hash, received_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, dedup_key, payload, payload_hash, time.time()),
+            ).lastrowid
+            conn.execute("COMMIT")
+        except Conflict:
+            raise
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return Receipt(seq, duplicate=False)
+
+    def backlog(self) -> int:
+        """Entries not yet committed to the database."""
+        return self._connection().execute("SELECT COUNT(*) FROM outbox WHERE state = 'pending'").fetchone()[0]
+
+    # --- Committer ---------------------------------------------------------
+    def drain_once(self) -> int:
+        """Commit one group of pending entries (and finish interrupted hooks). Returns entries handled."""
+        conn = self._connection()
+        now = time.time()
+        self._run_hooks([
+            entry for entry in conn.execute(
+                "SELECT seq, kind, payload, attempts FROM outbox WHERE state = 'committed' ORDER BY seq",
+            ).fetchall()
+            if self._hook_retry_at.get(entry[0], 0.0) <= now
+        ])
+        entries = conn.execute(
+            "SELECT seq, kind, payload, attempts FROM outbox WHERE state = 'pending' ORDER BY seq LIMIT ?",
+            (INGEST_BATCH_SIZE,),
+        ).fetchall()
+        if not entries:
+            return 0
+
+        applied, stored_before, dead, failed = [], [], [], []
+        db = connection.SessionLocal()
+        try:
+            for seq, kind, payload, attempts in entries:
+                handler = _handlers.get(kind)
+                if handler is None:
+                    dead.append((seq, f"Unknown entry kind '{kind}'"))
+                    continue
+                try:
+                    item = handler.schema.model_validate_json(payload)
+                except ValueError as e:
+                    dead.append((seq, f"Invalid payload: {e}"))
+                    continue
+                savepoint = db.begin_nested()
+                try:
+                    stored = handler.apply(db, item)
+                    savepoint.commit()
+                except Rejected as e:
+                    savepoint.rollback()
+                    dead.append((seq, e.detail))
+                    continue
+                except Exception as e:
+                    savepoint.rollback()
+                    if unavailable(e):
+                        raise
+                    failed.append((seq, attempts + 1, repr(e)))
+                    continue
+                applied.append((seq, kind, payload, 0))
+                if not stored:
+                    stored_before.append(seq)
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "UPDATE outbox SET state = 'committed', committed_at = ?, attempts = 0, last_error = NULL WHERE seq = ?",
+                [(now, seq) for seq, _, _, _ in applied],
+            )
+            conn.executemany("UPDATE outbox SET state = 'dead', last_error = ? WHERE seq = ?",
+                             [(error, seq) for seq, error in dead])
+            conn.executemany(
+                "UPDATE outbox SET attempts = ?, last_error = ?,"
+                " state = CASE WHEN ? >= ? THEN 'dead' ELSE state END WHERE seq = ?",
+                [(attempts, error, attempts, INGEST_MAX_ATTEMPTS, seq) for seq, attempts, error in failed],
+            )
+        for seq, error in dead:
+            logger.error("Ingest entry %s rejected: %s", seq, error)
+        for seq, attempts, error in failed:
+            logger.warning("Ingest entry %s failed (attempt %d/%d): %s", seq, attempts, INGEST_MAX_ATTEMPTS, error)
+        if stored_before:
+            logger.info("Ingest entries %s were already stored; running their hooks", stored_before)
+        self._run_hooks(applied)
+        return len(entries)
+
+    def _run_hooks(self, entries):
+        if not entries:
+            return
+        conn = self._connection()
+        db = connection.SessionLocal()
+        try:
+            for seq, kind, payload, attempts in entries:
+                handler = _handlers.get(kind)
+                if handler is not None and handler.after_commit is not None:
+                    try:
+                        handler.after_commit(db, handler.schema.model_validate_json(payload))
+                    except Exception as e:
+                        db.rollback()
+                        self._hook_failed(conn, seq, attempts + 1, e)
+                        continue
+                self._hook_retry_at.pop(seq, None)
+                with conn:
+                    conn.execute("UPDATE outbox SET state = 'done' WHERE seq = ?", (seq,))
+        finally:
+            db.close()
+
+    def _hook_failed(self, conn: sqlite3.Connection, seq: int, attempts: int, error: Exception):
+        """Keep the entry 'committed' for a later retry, or set it aside once it has used its attempts."""
+        dead = attempts >= INGEST_MAX_ATTEMPTS
+        with conn:
+            conn.execute(
+                "UPDATE outbox SET attempts = ?, last_error = ?, state = ? WHERE seq = ?",
+                (attempts, f"Post-commit hook failed: {error!r}", "dead" if dead else "committed", seq),
+            )
+        if dead:
+            self._hook_retry_at.pop(seq, None)
+            logger.error("Ingest entry %s: post-commit hook failed %d times, set aside: %s", seq, attempts, error)
+        else:
+            self._hook_retry_at[seq] = time.time() + INGEST_HOOK_RETRY_SECONDS * 2 ** (attempts - 1)
+            logger.warning("Ingest entry %s: post-commit hook failed (attempt %d/%d): %s",
+                           seq, attempts, INGEST_MAX_ATTEMPTS, error)
+
+    def prune(self):
+        cutoff = time.time() - INGEST_RETENTION_DAYS * 86400
+        with self._connection() as conn:
+            conn.execute("DELETE FROM outbox WHERE state = 'done' AND committed_at < ?", (cutoff,))
+
+    # --- Operations --------------------------------------------------------
+    def status(self) -> dict:
+        conn = self._connection()
+        counts = dict(conn.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
+        oldest = conn.execute("SELECT MIN(received_at) FROM outbox WHERE state = 'pending'").fetchone()[0]
+        last_commit = conn.execute("SELECT MAX(committed_at) FROM outbox").fetchone()[0]
+        now = time.time()
+        return {
+            "mode": INGEST_MODE,
+            "depth": counts.get("pending", 0),
+            "lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+            "committing_hooks": counts.get("committed", 0),
+            "dead": counts.get("dead", 0),
+            "done_retained": counts.get("done", 0),
+            "last_commit_seconds_ago": round(now - last_commit, 3) if last_commit is not None else None,
+            "committer": _committer.status(),
+        }
+
+    def dead_entries(self, limit: int = 100) -> List[dict]:
+        rows = self._connection().execute(
+            "SELECT seq, kind, dedup_key, payload, received_at, attempts, last_error FROM outbox"
+            " WHERE state = 'dead' ORDER BY seq DESC LIMIT ?", (limit,),
+        ).fetchall()
+        return [
+            {"seq": seq, "kind": kind, "key": key, "payload": payload, "received_at": received_at,
+             "attempts": attempts, "error": error}
+            for seq, kind, key, payload, received_at, attempts, error in rows
+        ]
+
+    def retry(self, seq: int) -> bool:
+        """Put a dead entry back in the queue (fails if a newer entry holds its dedup key)."""
+        with self._connection() as conn:
+            return conn.execute(
+                "UPDATE outbox SET state = 'pending', attempts = 0, last_error = NULL"
+                " WHERE seq = ? AND state = 'dead'", (seq,),
+            ).rowcount == 1
+
+
+outbox = Outbox()
+
+
+def should_queue() -> bool:
+    """Whether a new submission goes straight to the outbox instead of the database."""
+    if INGEST_MODE == "queue":
+        return True
+    if INGEST_MODE == "direct":
+        return False
+    try:
+        return outbox.backlog() > 0
+    except sqlite3.Error as e:
+        logger.warning("Ingest outbox not readable: %s", e)
+        return False
+
+
+def can_fall_back(error: BaseException) -> bool:
+    """Whether a submission that failed with `error` should be queued instead."""
+    return INGEST_MODE != "direct" and unavailable(error)
+
+
+class Committer:
+    def __init__(self):
+        self.started = False
+        self.leader = False
+        self.backoff = 0.0
+        self.last_error: Optional[str] = None
+        self._lock_handle = None
+
+    def _acquire_leadership(self) -> bool:
+        if fcntl is None:
+            return True
+        if self._lock_handle is None:
+            self._lock_handle = open(data_path("ingest", "committer.lock"), "a")
+        try:
+            fcntl.flock(self._lock_handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _loop(self):
+        last_prune = 0.0
+        while True:
+            if not self.leader:
+                # Another worker of this host drains; take over if it exits
+                self.leader = self._acquire_leadership()
+                if not self.leader:
+                    time.sleep(5.0)
+                    continue
+                logger.info("Ingest committer running in process %s", os.getpid())
+            try:
+                handled = outbox.drain_once()
+                self.backoff = 0.0
+                self.last_error = None
+                if time.time() - last_prune > 3600:
+                    outbox.prune()
+                    last_prune = time.time()
+                if handled:
+                    continue
+                time.sleep(POLL_SECONDS)
+            except Exception as e:
+                self.backoff = min(MAX_BACKOFF_SECONDS, max(POLL_SECONDS, self.backoff * 2))
+                self.last_error = str(e)
+                logger.warning("Ingest committer: %s (retrying in %.1f s)", e, self.backoff)
+                time.sleep(self.backoff)
+
+    def start(self):
+        if self.started or INGEST_MODE == "direct" or connection.SessionLocal is None:
+            return
+        self.started = True
+        threading.Thread(target=self._loop, name="ingest-committer", daemon=True).start()
+
+    def status(self) -> dict:
+        return {"pid": os.getpid(), "running_here": self.leader, "backoff_seconds": self.backoff,
+                "last_error": self.last_error}
+
+
+_committer = Committer()
+
+
+def start_committer():
+    """Drain the outbox from a daemon thread (in one worker per host)."""
+    _committer.start()
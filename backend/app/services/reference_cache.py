@@ -0,0 +1,139 @@
+"""
+In-process copy of the reference tables (coches, trabajadores, trabajos).
+
+The formularios and incidencias write paths only need to know that a car,
+worker or job exists (plus a couple of attributes), and these tables change a
+few times a day. Each table is held as a dict of small __slots__ records,
+loaded at startup and updated write-through by the coches, trabajadores and
+trabajos routers, which also bump the table's version stamp. Another worker
+that sees a newer stamp reloads the table before answering; a key that is
+still missing falls back to a primary-key query, so a miss is never wrong.
+"""
+import logging
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import select
+
+from app.database import connection, replica
+from app.models.models import Coche, Trabajador, Trabajo
+from app.utils import versions
+
+logger = logging.getLogger(__name__)
+
+
+class CocheRecord:
+    __slots__ = ("id_coche", "placa")
+
+    def __init__(self, id_coche, placa):
+        self.id_coche = id_coche
+        self.placa = placa
+
+
+class TrabajadorRecord:
+    __slots__ = ("dni", "nombre", "apellido")
+
+    def __init__(self, dni, nombre, apellido):
+        self.dni = dni
+        self.nombre = nombre
+        self.apellido = apellido
+
+
+class TrabajoRecord:
+    __slots__ = ("id", "cliente", "fecha")
+
+    def __init__(self, id, cliente, fecha):
+        self.id = id
+        self.cliente = cliente
+        self.fecha = fecha
+
+
+class ReferenceTable:
+    """Primary key -> record map for one table, guarded by the table's version stamp."""
+
+    def __init__(self, name: str, record_cls, columns, key_column):
+        self.name = name
+        self._record_cls = record_cls
+        self._columns = columns
+        self._key_column = key_column
+        self._records: Optional[Dict[int, object]] = None
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _record(self, row):
+        return self._record_cls(*(getattr(row, field) for field in self._record_cls.__slots__))
+
+    def load(self, db=None):
+        """(Re)read the whole table. Uses `db` if given, otherwise a session of its own."""
+        if db is None and connection.SessionLocal is None:
+            raise RuntimeError("Database session factory (SessionLocal) is not configured.")
+        session = db if db is not None else connection.SessionLocal()
+        # Cached under the version stamp: a lagging replica would pin stale rows to it
+        replica.use_primary()
+        try:
+            version = versions.current(self.name)
+            rows = session.execute(select(*self._columns)).all()
+        finally:
+            if db is None:
+                session.close()
+        records = {}
+        for row in rows:
+            record = self._record(row)
+            records[getattr(record, self._record_cls.__slots__[0])] = record
+        with self._lock:
+            self._records = records
+            self._version = version
+        logger.debug("Reference cache '%s' loaded with %d rows", self.name, len(records))
+
+    def get(self, db, key: int):
+        """Record for `key`, or None if the row does not exist."""
+        if self._records is None or versions.current(self.name) != self._version:
+            self.load(db)
+        record = self._records.get(key)
+        if record is not None:
+            self.hits += 1
+            return record
+        # Not cached: written by another worker since our last load, or really missing
+        self.misses += 1
+        row = db.execute(select(*self._columns).where(self._key_column == key)).first()
+        if row is None:
+            return None
+        record = self._record(row)
+        self._records[key] = record
+        return record
+
+    def put(self, row):
+        """Write-through after a committed create/update of `row` (an ORM object)."""
+        record = self._record(row)  # before the bump: a bad row must not invalidate other workers for nothing
+        with self._lock:
+            was_current = self._version == versions.current(self.name)
+            version = versions.bump(self.name)  # other workers reload on their next lookup
+            if self._records is not None:
+                self._records[getattr(record, self._record_cls.__slots__[0])] = record
+                # Our own write needs no reload, unless another worker's was already pending
+                if was_current:
+                    self._version = version
+
+
+coches = ReferenceTable("coches", CocheRecord, (Coche.id_coche, Coche.placa), Coche.id_coche)
+trabajadores = ReferenceTable(
+    "trabajadores", TrabajadorRecord, (Trabajador.dni, Trabajador.nombre, Trabajador.apellido), Trabajador.dni,
+)
+trabajos = ReferenceTable("trabajos", TrabajoRecord, (Trabajo.id, Trabajo.cliente, Trabajo.fecha), Trabajo.id)
+
+TABLES = (coches, trabajadores, trabajos)
+
+
+def load_all():
+    for table in TABLES:
+        table.load()
+
+
+def safe_put(table: ReferenceTable, row):
+    """Write-path hook: cache problems must never fail the request that triggered them."""
+    try:
+        table.put(row)
+    except Exception as e:
+        logger.warning("Reference cache update failed: %s", e)
@@ -0,0 +1,338 @@
+"""
+In-process full-text search over the free-text fields of forms and incidences.
+
+Indexed fields: FormularioCoche.otros / estado_coche, FormularioTrabajo.otros /
+lugar_trabajo and Incidencia.descripcion. Text is tokenized with Spanish-aware
+rules (lower-casing, accent folding, stopwords and a light suffix stemmer) into
+an inverted index ranked with BM25.
+
+The index is built from the database on first use, kept current by the
+formularios and incidencias routers on every write, and rebuilt in the
+background every SEARCH_REBUILD_SECONDS to pick up writes made by other workers.
+"""
+import html
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.database import connection
+from app.models.models import FormularioCoche, FormularioTrabajo, Incidencia
+from app.schemas.schemas import format_date
+
+logger = logging.getLogger(__name__)
+
+SEARCH_REBUILD_SECONDS = float(os.getenv("SEARCH_REBUILD_SECONDS", "300"))
+
+# Document types and the fields indexed for each
+TIPOS = {
+    "formulario_coche": ("otros", "estado_coche"),
+    "formulario_trabajo": ("otros", "lugar_trabajo"),
+    "incidencia": ("descripcion",),
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+SNIPPET_CONTEXT = 60
+
+STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante e el ella ellas
+ellos en entre era es esta estaba estan estas este esto estos fue ha hay la las le les lo los mas me mi muy
+nada ni no nos o os otra otro para pero poco por porque que se sea segun ser si sin sobre son su sus tambien
+te tiene todo todos tu un una unas uno unos y ya
+""".split())
+
+# Longest suffixes first; a suffix is only removed if at least 3 characters remain
+_SUFFIXES = (
+    "amientos", "imientos", "aciones", "uciones", "amiento", "imiento", "idades", "adoras", "adores",
+    "ancias", "encias", "mente", "acion", "ucion", "adora", "ador", "ancia", "encia", "idad", "ables",
+    "ibles", "istas", "able", "ible", "ista", "osas", "osos", "ados", "idos", "adas", "idas", "ando",
+    "iendo", "osa", "oso", "ado", "ido", "ada", "ida", "ces", "es", "os", "as", "ar", "er", "ir",
+    "s", "a", "o", "e",
+)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fold(text: str) -> str:
+    """Lower-case and strip accents (neumáticos -> neumaticos, año -> ano)."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def stem(token: str) -> str:
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            if suffix == "ces":
+                return token[:-3] + "z"  # luces -> luz
+            return token[: -len(suffix)]
+    return token
+
+
+def analyze(text: Optional[str]) -> List[Tuple[str, int, int]]:
+    """Return (term, start, end) for every indexable token, offsets into the original text."""
+    if not text:
+        return []
+    terms = []
+    for match in _TOKEN_RE.finditer(text):
+        token = fold(match.group())
+        if token in STOPWORDS or token.isdigit() and len(token) < 2:
+            continue
+        terms.append((stem(token), match.start(), match.end()))
+    return terms
+
+
+DocKey = Tuple[str, int]
+
+
+class SearchIndex:
+    """Inverted index term -> {document: term frequency} with BM25 ranking."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[DocKey, int]] = {}
+        self._doc_terms: Dict[DocKey, Counter] = {}
+        self._doc_len: Dict[DocKey, int] = {}
+        self._documents: Dict[DocKey, Dict] = {}
+        self._total_len = 0
+        self._vocabulary: Optional[List[str]] = None
+        self.built_at: Optional[float] = None
+        self._rebuilding = False
+        # Upserts seen while rebuilds read the database, replayed onto the new index before the swap
+        self._pending: List[Tuple] = []
+        self._rebuilds_running = 0
+
+    # --- Maintenance -------------------------------------------------------
+    def _remove(self, key: DocKey):
+        terms = self._doc_terms.pop(key, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+                    self._vocabulary = None
+        self._total_len -= self._doc_len.pop(key, 0)
+        self._documents.pop(key, None)
+
+    def upsert(self, tipo: str, doc_id: int, fields: Dict[str, Optional[str]], meta: Optional[Dict] = None):
+        key = (tipo, doc_id)
+        terms = Counter(term for text in fields.values() for term, _, _ in analyze(text))
+        with self._lock:
+            if self._rebuilds_running:
+                self._pending.append((tipo, doc_id, fields, meta))
+            self._remove(key)
+            if not terms:
+                return
+            for term, tf in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    self._vocabulary = None
+                postings[key] = tf
+            self._doc_terms[key] = terms
+            length = sum(terms.values())
+            self._doc_len[key] = length
+            self._total_len += length
+            self._documents[key] = {"fields": fields, "meta": meta or {}}
+
+    def index_formulario_coche(self, formulario):
+        self.upsert(
+            "formulario_coche",
+            formulario.id_trabajo,
+            {"otros": formulario.otros, "estado_coche": formulario.estado_coche},
+            {"id_coche": formulario.id_coche, "dni_trabajador": formulario.dni_trabajador,
+             "id_trabajo": formulario.id_trabajo, "fecha": format_date(formulario.fecha)},
+        )
+
+    def index_formulario_trabajo(self, formulario):
+        self.upsert(
+            "formulario_trabajo",
+            formulario.id_trabajo,
+            {"otros": formulario.otros, "lugar_trabajo": formulario.lugar_trabajo},
+            {"id_coche": formulario.id_coche, "dni_trabajador": formulario.dni_trabajador,
+             "id_trabajo": formulario.id_trabajo, "fecha": format_date(formulario.fecha)},
+        )
+
+    def index_incidencia(self, incidencia):
+        self.upsert(
+            "incidencia",
+            incidencia.id_incidencia,
+            {"descripcion": incidencia.descripcion},
+            {"id_incidencia": incidencia.id_incidencia, "id_coche": incidencia.id_coche,
+             "gravedad": incidencia.gravedad, "resuelta": incidencia.resuelta, "fecha": format_date(incidencia.fecha)},
+        )
+
+    def rebuild(self):
+        """Re-read every indexed row from the database and swap in a fresh index."""
+        if connection.SessionLocal is None:
+            raise RuntimeError("Database session factory (SessionLocal) is not configured.")
+        fresh = SearchIndex()
+        with self._lock:
+            self._rebuilds_running += 1
+        try:
+            self._load(fresh)
+            with self._lock:
+                # The load may predate writes made meanwhile: apply them again
+                for change in self._pending:
+                    fresh.upsert(*change)
+                self._postings = fresh._postings
+                self._doc_terms = fresh._doc_terms
+                self._doc_len = fresh._doc_len
+                self._documents = fresh._documents
+                self._total_len = fresh._total_len
+                self._vocabulary = None
+                self.built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._rebuilds_running -= 1
+                if not self._rebuilds_running:
+                    self._pending = []
+        logger.info("Search index rebuilt: %d documents, %d terms", len(self._documents), len(self._postings))
+
+    @staticmethod
+    def _load(fresh: "SearchIndex"):
+        db = connection.SessionLocal()
+        try:
+            for row in db.execute(select(
+                FormularioCoche.id_coche, FormularioCoche.dni_trabajador, FormularioCoche.id_trabajo,
+                FormularioCoche.fecha, FormularioCoche.otros, FormularioCoche.estado_coche,
+            )):
+                fresh.index_formulario_coche(row)
+            for row in db.execute(select(
+                FormularioTrabajo.id_coche, FormularioTrabajo.dni_trabajador, FormularioTrabajo.id_trabajo,
+                FormularioTrabajo.fecha, FormularioTrabajo.otros, FormularioTrabajo.lugar_trabajo,
+            )):
+                fresh.index_formulario_trabajo(row)
+            for row in db.execute(select(
+                Incidencia.id_incidencia, Incidencia.id_coche, Incidencia.gravedad,
+                Incidencia.resuelta, Incidencia.fecha, Incidencia.descripcion,
+            )):
+                fresh.index_incidencia(row)
+        finally:
+            db.close()
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.warning("Search index rebuild failed: %s", e)
+        finally:
+            self._rebuilding = False
+
+    def ensure_fresh(self):
+        """Build synchronously on first use; afterwards rebuild stale indexes in the background."""
+        if self.built_at is None:
+            self.rebuild()
+        elif time.monotonic() - self.built_at > SEARCH_REBUILD_SECONDS and not self._rebuilding:
+            self._rebuilding = True
+            threading.Thread(target=self._rebuild_in_background, name="search-index", daemon=True).start()
+
+    # --- Querying ----------------------------------------------------------
+    def _expand(self, term: str) -> List[str]:
+        """Terms of the vocabulary starting with `term` (for prefix queries like neum*)."""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        start = bisect_left(self._vocabulary, term)
+        matches = []
+        for candidate in self._vocabulary[start:]:
+            if not candidate.startswith(term):
+                break
+            matches.append(candidate)
+        return matches
+
+    def _query_terms(self, query: str) -> List[str]:
+        terms = []
+        for match in _TOKEN_RE.finditer(query):
+            token = fold(match.group())
+            if token in STOPWORDS:
+                continue
+            if query[match.end():match.end() + 1] == "*":
+                terms.extend(self._expand(token))
+            else:
+                terms.append(stem(token))
+        return list(dict.fromkeys(terms))
+
+    @staticmethod
+    def _highlight(text: str, terms: set) -> Optional[str]:
+        spans = [(start, end) for term, start, end in analyze(text) if term in terms]
+        if not spans:
+            return None
+        begin = max(0, spans[0][0] - SNIPPET_CONTEXT)
+        finish = min(len(text), spans[-1][1] + SNIPPET_CONTEXT)
+        parts = ["…" if begin > 0 else ""]
+        cursor = begin
+        for start, end in spans:
+            if end > finish:
+                break
+            parts.append(html.escape(text[cursor:start]))
+            parts.append("<mark>" + html.escape(text[start:end]) + "</mark>")
+            cursor = end
+        parts.append(html.escape(text[cursor:finish]))
+        parts.append("…" if finish < len(text) else "")
+        return "".join(parts)
+
+    def search(self, query: str, tipo: Optional[str] = None, page: int = 1, page_size: int = 20) -> Dict:
+        with self._lock:
+            terms = self._query_terms(query)
+            n_docs = len(self._doc_len)
+            avg_len = self._total_len / n_docs if n_docs else 0.0
+            scores: Dict[DocKey, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, tf in postings.items():
+                    if tipo and key[0] != tipo:
+                        continue
+                    norm = K1 * (1 - B + B * self._doc_len[key] / avg_len)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            offset = (page - 1) * page_size
+            term_set = set(terms)
+            hits = []
+            for (doc_tipo, doc_id), score in ranked[offset:offset + page_size]:
+                document = self._documents[(doc_tipo, doc_id)]
+                highlights = {}
+                for field, text in document["fields"].items():
+                    if text:
+                        snippet = self._highlight(text, term_set)
+                        if snippet:
+                            highlights[field] = snippet
+                hits.append({"tipo": doc_tipo, "id": doc_id, "score": round(score, 4),
+                             **document["meta"], "highlights": highlights})
+
+        return {
+            "query": query,
+            "terms": terms,
+            "total": len(ranked),
+            "page": page,
+            "page_size": page_size,
+            "hits": hits,
+        }
+
+
+index = SearchIndex()
+
+
+def safe_index(method, *args):
+    """Write-path hook: indexing problems must never fail the request that triggered them."""
+    try:
+        if index.built_at is not None:
+            method(*args)
+    except Exception as e:
+        logger.warning("Search index update failed: %s", e)
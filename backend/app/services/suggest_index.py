@@ -0,0 +1,242 @@
+"""
+In-memory typeahead indexes for trabajos, trabajadores and coches.
+
+Each entity contributes a few short search strings (ids, names, plate numbers).
+They are kept in a sorted list for prefix lookups with bisect, plus a trigram
+index that catches infix matches and small typos when the prefix lookup does
+not fill the requested number of suggestions. A keystroke is answered entirely
+from memory; the indexes are loaded from the database on first use, updated by
+the create/update endpoints, and rebuilt in the background every
+SUGGEST_REBUILD_SECONDS to pick up writes made by other workers.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from app.database import connection
+from app.models.models import Coche, Trabajador, Trabajo, FormularioCoche, FormularioTrabajo
+from app.schemas.schemas import format_date
+from app.services.search_index import fold
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_REBUILD_SECONDS = float(os.getenv("SUGGEST_REBUILD_SECONDS", "300"))
+
+# Minimum share of the query's trigrams a candidate must contain
+TRIGRAM_THRESHOLD = 0.5
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestIndex:
+    """Prefix (sorted list + bisect) and trigram index over the search strings of one entity."""
+
+    def __init__(self, name: str, loader: Callable, describe: Callable):
+        self.name = name
+        self._loader = loader          # loader(db) -> iterable of ORM rows / Core rows
+        self._describe = describe      # describe(row) -> (key, payload, search strings)
+        self._lock = threading.RLock()
+        self._payloads: Dict[int, Dict] = {}
+        self._terms: Dict[int, Tuple[str, ...]] = {}
+        self._sorted: List[Tuple[str, int]] = []
+        self._trigrams: Dict[str, Set[int]] = {}
+        self._flags: Dict[int, Set[str]] = {}
+        self.built_at: Optional[float] = None
+        self._rebuilding = False
+        # Writes seen while a rebuild loads the database, replayed onto the new index before the swap
+        self._pending: Optional[List[Tuple]] = None
+
+    # --- Maintenance -------------------------------------------------------
+    def _remove(self, key: int):
+        for term in self._terms.pop(key, ()):
+            pos = bisect_left(self._sorted, (term, key))
+            if pos < len(self._sorted) and self._sorted[pos] == (term, key):
+                del self._sorted[pos]
+            for gram in trigrams(term):
+                keys = self._trigrams.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._trigrams[gram]
+        self._payloads.pop(key, None)
+
+    def _add(self, key: int, payload: Dict, strings: Iterable[str]):
+        terms = tuple(dict.fromkeys(fold(s) for s in strings if s))
+        self._payloads[key] = payload
+        self._terms[key] = terms
+        for term in terms:
+            insort(self._sorted, (term, key))
+            for gram in trigrams(term):
+                self._trigrams.setdefault(gram, set()).add(key)
+
+    def upsert(self, row):
+        key, payload, strings = self._describe(row)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("row", key, payload, strings))
+            if self.built_at is None:
+                return  # the first load (or the replay above) will pick it up
+            self._remove(key)
+            self._add(key, payload, strings)
+
+    def set_flag(self, key: int, flag: str):
+        """Attach a flag to an entry (e.g. trabajo -> 'coche' once it has a car form)."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("flag", key, flag))
+            self._flags.setdefault(key, set()).add(flag)
+
+    def rebuild(self):
+        if connection.SessionLocal is None:
+            raise RuntimeError("Database session factory (SessionLocal) is not configured.")
+        fresh = SuggestIndex(self.name, self._loader, self._describe)
+        with self._lock:
+            self._pending = []
+        try:
+            db = connection.SessionLocal()
+            try:
+                rows, flags = self._loader(db)
+                for row in rows:
+                    fresh._add(*self._describe(row))
+            finally:
+                db.close()
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            # The load may predate writes made meanwhile: apply them again
+            for change in self._pending:
+                if change[0] == "row":
+                    fresh._remove(change[1])
+                    fresh._add(*change[1:])
+                else:
+                    flags.setdefault(change[1], set()).add(change[2])
+            self._pending = None
+            self._payloads = fresh._payloads
+            self._terms = fresh._terms
+            self._sorted = fresh._sorted
+            self._trigrams = fresh._trigrams
+            self._flags = flags
+            self.built_at = time.monotonic()
+        logger.debug("Suggest index '%s' rebuilt with %d entries", self.name, len(self._payloads))
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.warning("Suggest index '%s' rebuild failed: %s", self.name, e)
+        finally:
+            self._rebuilding = False
+
+    def ensure_fresh(self):
+        if self.built_at is None:
+            with self._lock:
+                if self.built_at is None:
+                    self.rebuild()
+        elif time.monotonic() - self.built_at > SUGGEST_REBUILD_SECONDS and not self._rebuilding:
+            self._rebuilding = True
+            threading.Thread(target=self._rebuild_in_background, name=f"suggest-{self.name}", daemon=True).start()
+
+    # --- Querying ----------------------------------------------------------
+    def suggest(self, query: str, limit: int = 10, exclude_flag: Optional[str] = None) -> List[Dict]:
+        q = fold(query.strip())
+        with self._lock:
+            def allowed(key):
+                return exclude_flag is None or exclude_flag not in self._flags.get(key, ())
+
+            if not q:
+                keys = [k for k in sorted(self._payloads) if allowed(k)][:limit]
+                return [self._payloads[k] for k in keys]
+
+            # Prefix matches: exact term first, then shorter terms
+            ranked: Dict[int, Tuple] = {}
+            pos = bisect_left(self._sorted, (q, -1 << 62))
+            while pos < len(self._sorted):
+                term, key = self._sorted[pos]
+                if not term.startswith(q):
+                    break
+                pos += 1
+                if key in ranked or not allowed(key):
+                    continue
+                ranked[key] = (0 if term == q else 1, len(term), term)
+            results = sorted(ranked, key=lambda k: ranked[k])[:limit]
+
+            # Trigram matches fill the remaining slots
+            if len(results) < limit and len(q) >= 3:
+                grams = trigrams(q)
+                counts: Dict[int, int] = {}
+                for gram in grams:
+                    for key in self._trigrams.get(gram, ()):
+                        counts[key] = counts.get(key, 0) + 1
+                needed = TRIGRAM_THRESHOLD * len(grams)
+                seen = set(results)
+                fuzzy = sorted(
+                    (k for k, c in counts.items() if c >= needed and k not in seen and allowed(k)),
+                    key=lambda k: (-counts[k], k),
+                )
+                results.extend(fuzzy[:limit - len(results)])
+
+            return [self._payloads[k] for k in results]
+
+
+# --- Entity definitions -----------------------------------------------------
+def _load_trabajos(db):
+    rows = db.execute(select(Trabajo.id, Trabajo.cliente, Trabajo.fecha)).all()
+    flags: Dict[int, Set[str]] = {}
+    for (id_trabajo,) in db.execute(select(FormularioCoche.id_trabajo)):
+        flags.setdefault(id_trabajo, set()).add("coche")
+    for (id_trabajo,) in db.execute(select(FormularioTrabajo.id_trabajo)):
+        flags.setdefault(id_trabajo, set()).add("trabajo")
+    return rows, flags
+
+
+def _describe_trabajo(row):
+    payload = {"id": row.id, "cliente": row.cliente, "fecha": format_date(row.fecha)}
+    return row.id, payload, [str(row.id), row.cliente] + row.cliente.split()
+
+
+def _load_trabajadores(db):
+    return db.execute(select(
+        Trabajador.dni, Trabajador.nombre, Trabajador.apellido, Trabajador.fecha_nacimiento, Trabajador.fecha_empleo,
+    )).all(), {}
+
+
+def _describe_trabajador(row):
+    payload = {
+        "dni": row.dni,
+        "nombre": row.nombre,
+        "apellido": row.apellido,
+        "fecha_nacimiento": format_date(row.fecha_nacimiento),
+        "fecha_empleo": format_date(row.fecha_empleo),
+    }
+    return row.dni, payload, [str(row.dni), row.nombre, row.apellido, f"{row.nombre} {row.apellido}"]
+
+
+def _load_coches(db):
+    return db.execute(select(Coche.id_coche, Coche.placa)).all(), {}
+
+
+def _describe_coche(row):
+    return row.id_coche, {"id_coche": row.id_coche, "placa": row.placa}, [str(row.placa), str(row.id_coche)]
+
+
+trabajos = SuggestIndex("trabajos", _load_trabajos, _describe_trabajo)
+trabajadores = SuggestIndex("trabajadores", _load_trabajadores, _describe_trabajador)
+coches = SuggestIndex("coches", _load_coches, _describe_coche)
+
+
+def safe_update(method, *args):
+    """Write-path hook: index problems must never fail the request that triggered them."""
+    try:
+        method(*args)
+    except Exception as e:
+        logger.warning("Suggest index update failed: %s", e)
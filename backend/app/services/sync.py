@@ -0,0 +1,173 @@
+"""
+Delta sync for client-side mirrors of the six tables (GET /api/sync).
+
+Every tracked row carries an updated_at stamp (UTC, set on each ORM insert
+and update; see models.Tracked) and deletions are logged in sync_deletions
+by delete triggers (app/database/sync_triggers.py, created by create_all();
+database_management/migrate_sync_tracking.py adds them to existing
+databases). A sync token is the server time, in milliseconds, at which a
+sync started: the next sync with that token returns only the rows changed
+and the keys deleted since then, as compact column/row arrays.
+
+A row stamped just before a sync but committed just after it, or stamped by
+a host whose clock runs slightly behind, would be missed, so every delta
+reaches back SYNC_OVERLAP_SECONDS before the token (plus the replica lag
+when the request reads from a replica). Clients upsert by primary key, so
+the overlap only re-sends a few recent rows.
+
+A missing token, one older than SYNC_DELETION_RETENTION_DAYS (deletions are
+pruned after that) or one from the future gets a full snapshot
+("full": true) that replaces the mirror.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.database import connection, replica
+from app.models.models import (
+    Coche, FormularioCoche, FormularioTrabajo, Incidencia, SyncDeletion, Trabajador, Trabajo, utcnow,
+)
+from app.schemas.schemas import (
+    CocheOut, FormularioCocheOut, FormularioTrabajoOut, IncidenciaOut, TrabajadorOut, TrabajoOut,
+)
+from app.utils import metrics
+from app.utils.serialization import columns_for
+
+logger = logging.getLogger(__name__)
+
+SYNC_OVERLAP_SECONDS = float(os.getenv("SYNC_OVERLAP_SECONDS", "10"))
+SYNC_DELETION_RETENTION_DAYS = float(os.getenv("SYNC_DELETION_RETENTION_DAYS", "30"))
+PRUNE_INTERVAL_SECONDS = 3600
+CLOCK_TOLERANCE_MS = 60_000
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class SyncTable:
+    """One mirrored table: its rows as the list endpoint's schema, and the fields of its primary key."""
+    __slots__ = ("name", "model", "columns", "key")
+
+    def __init__(self, name: str, model, schema, key: Sequence[str]):
+        self.name = name
+        self.model = model
+        self.columns = columns_for(model, schema)
+        self.key = list(key)
+
+    def select(self, cutoff: Optional[datetime]):
+        statement = select(*self.columns)
+        if cutoff is not None:
+            statement = statement.where(self.model.updated_at > cutoff)
+        return statement
+
+
+# Order matters to clients that apply a delta table by table: referenced tables first
+TABLES: Dict[str, SyncTable] = {
+    table.name: table for table in (
+        SyncTable("coches", Coche, CocheOut, ["id_coche"]),
+        SyncTable("trabajadores", Trabajador, TrabajadorOut, ["dni"]),
+        SyncTable("trabajos", Trabajo, TrabajoOut, ["id"]),
+        SyncTable("formularios_coche", FormularioCoche, FormularioCocheOut, ["id_coche", "dni_trabajador", "id_trabajo"]),
+        SyncTable("formularios_trabajo", FormularioTrabajo, FormularioTrabajoOut,
+                  ["id_coche", "dni_trabajador", "id_trabajo"]),
+        SyncTable("incidencias", Incidencia, IncidenciaOut, ["id_incidencia"]),
+    )
+}
+
+
+def _now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def parse_token(token: Optional[str]) -> Optional[int]:
+    """Milliseconds of a token, or None when the client must take a full snapshot."""
+    if not token:
+        return None
+    try:
+        since_ms = int(token)
+    except ValueError:
+        raise InvalidToken(token)
+    now_ms = _now_ms()
+    if since_ms > now_ms + CLOCK_TOLERANCE_MS or since_ms < now_ms - SYNC_DELETION_RETENTION_DAYS * 86_400_000:
+        return None
+    return since_ms
+
+
+def changes(db: Session, since: Optional[str], names: Optional[List[str]] = None) -> dict:
+    """Rows changed and keys deleted since the token `since` (everything if None) in the tables `names`."""
+    tables = [TABLES[name] for name in (names or TABLES)]
+    since_ms = parse_token(since)
+    token = _now_ms()  # taken before reading: changes committed while we read are in the next delta
+
+    cutoff = None
+    if since_ms is not None:
+        overlap = SYNC_OVERLAP_SECONDS + (replica.READ_REPLICA_MAX_LAG if replica.replica_allowed() else 0)
+        # updated_at is naive UTC
+        cutoff = datetime.fromtimestamp(since_ms / 1000, timezone.utc).replace(tzinfo=None) - timedelta(seconds=overlap)
+
+    deleted: Dict[str, List[str]] = {table.name: [] for table in tables}
+    if cutoff is not None:
+        # Read before the rows: a key deleted and inserted again within the window ends up present
+        result = db.execute(
+            select(SyncDeletion.table_name, SyncDeletion.row_key)
+            .where(SyncDeletion.deleted_at > cutoff, SyncDeletion.table_name.in_(list(deleted)))
+            .order_by(SyncDeletion.id)
+        )
+        for table_name, row_key in result:
+            deleted[table_name].append(row_key)
+
+    payload = {}
+    row_count = 0
+    for table in tables:
+        result = db.execute(table.select(cutoff))
+        rows = [tuple(row) for row in result]
+        row_count += len(rows)
+        payload[table.name] = {
+            "columns": list(result.keys()),
+            "key": table.key,
+            "rows": rows,
+            "deleted": deleted[table.name],
+        }
+    metrics.add_rows(row_count)
+    return {"token": str(token), "full": since_ms is None, "tables": payload}
+
+
+def prune_deletions(db: Session) -> int:
+    """Drop deletion log entries older than SYNC_DELETION_RETENTION_DAYS (older tokens get full snapshots)."""
+    cutoff = utcnow() - timedelta(days=SYNC_DELETION_RETENTION_DAYS)
+    removed = db.execute(delete(SyncDeletion).where(SyncDeletion.deleted_at < cutoff)).rowcount
+    db.commit()
+    return removed
+
+
+_pruner_started = False
+
+
+def _prune_loop():
+    while True:
+        db = connection.SessionLocal()
+        try:
+            removed = prune_deletions(db)
+            if removed:
+                logger.info("Pruned %d sync deletion log entries", removed)
+        except Exception as e:
+            logger.warning("Sync deletion log prune failed: %s", e)
+        finally:
+            db.close()
+        time.sleep(PRUNE_INTERVAL_SECONDS)
+
+
+def start_background_prune():
+    """Prune the deletion log from a daemon thread, once an hour."""
+    global _pruner_started
+    if _pruner_started or connection.SessionLocal is None:
+        return
+    _pruner_started = True
+    threading.Thread(target=_prune_loop, name="sync-prune", daemon=True).start()
@@ -0,0 +1,531 @@
+"""
+Cache abstraction shared by the app's caches, with interchangeable backends.
+
+    CACHE_BACKEND=memory     in-process LRU (default; per worker)
+    CACHE_BACKEND=sqlite     on-disk SQLite store (WAL, memory-mapped) in
+                             SEPCAN_DATA_DIR, shared by the workers of a host
+    CACHE_BACKEND=redis      Redis (or any RESP-speaking server) at CACHE_URL
+    CACHE_BACKEND=broadcast  in-process LRU whose deletes/clears reach every
+                             worker through an invalidation channel: Redis
+                             pub/sub if CACHE_URL is set, else version stamps
+                             in SEPCAN_DATA_DIR
+
+Callers work with namespaces:
+
+    llm_cache = cache.namespace("incidencia_llm")
+    severity = llm_cache.get_or_set(key, compute, ttl=86400)
+
+Backend failures are logged and treated as misses; a cache must never fail a
+request. Hits, misses, sets, evictions and errors are counted per namespace
+(see stats()).
+"""
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+from app.utils import versions
+from app.utils.storage import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+MISS = object()
+
+
+# --- Backends -------------------------------------------------------------------
+class CacheBackend:
+    """Storage interface. `on_evict(namespace)` is called for every entry dropped for space."""
+
+    on_evict: Callable[[str], None] = staticmethod(lambda namespace: None)
+
+    def get(self, namespace: str, key: str) -> Any:
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def add(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Set `key` only if it is absent (or expired). Returns whether it was set."""
+        if self.get(namespace, key) is not MISS:
+            return False
+        self.set(namespace, key, value, ttl)
+        return True
+
+    def delete(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    def release(self, namespace: str, key: str):
+        """Drop `key` as set by this process, without invalidating other workers' copies."""
+        self.delete(namespace, key)
+
+    def clear(self, namespace: str):
+        raise NotImplementedError
+
+
+class LRUBackend(CacheBackend):
+    """Bounded in-process LRU with optional per-entry TTL. Values are stored as-is."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return MISS
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[(namespace, key)]
+                return MISS
+            self._entries.move_to_end((namespace, key))
+            return value
+
+    def set(self, namespace, key, value, ttl=None):
+        with self._lock:
+            evicted = self._store(namespace, key, value, ttl)
+        for evicted_namespace in evicted:
+            self.on_evict(evicted_namespace)
+
+    def add(self, namespace, key, value, ttl=None):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and (entry[1] is None or entry[1] >= time.monotonic()):
+                return False
+            evicted = self._store(namespace, key, value, ttl)
+        for evicted_namespace in evicted:
+            self.on_evict(evicted_namespace)
+        return True
+
+    def _store(self, namespace, key, value, ttl):
+        """Insert under self._lock; returns the namespaces of the entries evicted for space."""
+        expires_at = time.monotonic() + ttl if ttl else None
+        evicted = []
+        self._entries[(namespace, key)] = (value, expires_at)
+        self._entries.move_to_end((namespace, key))
+        while len(self._entries) > self.max_entries:
+            (evicted_namespace, _), _ = self._entries.popitem(last=False)
+            evicted.append(evicted_namespace)
+        return evicted
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def clear(self, namespace):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[entry_key]
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Shared on-disk store. SQLite in WAL mode lets every worker read concurrently
+    while one writes, and mmap keeps hot pages in the page cache. Entries past
+    `max_entries` are evicted least-recently-used first.
+    """
+
+    ACCESS_RESOLUTION = 30.0  # seconds; avoids a write on every hit
+    EVICT_EVERY = 100         # sets between size checks
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path or os.path.join(DATA_DIR, "cache.sqlite3")
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._sets = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA mmap_size=268435456")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+                " expires_at REAL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key),
+        ).fetchone()
+        if row is None:
+            return MISS
+        value, expires_at, accessed_at = row
+        now = time.time()
+        if expires_at is not None and expires_at < now:
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            return MISS
+        if now - accessed_at > self.ACCESS_RESOLUTION:
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+        return pickle.loads(value)
+
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now + ttl if ttl else None, now),
+        )
+        self._sets += 1
+        if self._sets % self.EVICT_EVERY == 0:
+            self._evict(conn)
+
+    def add(self, namespace, key, value, ttl=None):
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key = ? AND expires_at < ?", (namespace, key, now),
+            )
+            added = conn.execute(
+                "INSERT OR IGNORE INTO entries (namespace, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now + ttl if ttl else None, now),
+            ).rowcount == 1
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def _evict(self, conn):
+        (count,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        victims = conn.execute(
+            "SELECT namespace, key FROM entries ORDER BY accessed_at LIMIT ?", (excess,),
+        ).fetchall()
+        conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+        for namespace, _ in victims:
+            self.on_evict(namespace)
+
+    def delete(self, namespace, key):
+        self._connection().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace):
+        self._connection().execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    """Minimal RESP2 client (one connection per thread) for Redis-compatible servers."""
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile("rb")
+        if self.password:
+            self.execute("AUTH", self.password)
+        if self.db:
+            self.execute("SELECT", self.db)
+
+    @staticmethod
+    def encode(*args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def read_reply(self, reader=None):
+        reader = reader or self._local.reader
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the cache server")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode()
+        if prefix == b"-":
+            raise RespError(payload.decode())
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self.read_reply(reader) for _ in range(length)]
+        raise RespError(f"Unexpected reply: {line!r}")
+
+    def execute(self, *args):
+        if getattr(self._local, "sock", None) is None:
+            self._connect()
+        try:
+            self._local.sock.sendall(self.encode(*args))
+            return self.read_reply()
+        except (OSError, ConnectionError):
+            self._local.sock = None  # reconnect on next use
+            raise
+
+
+class RedisBackend(CacheBackend):
+    """Entries live in Redis as pickled values under `<prefix><namespace>:<key>`."""
+
+    def __init__(self, url: str, prefix: str = "sepcan:"):
+        self.client = RespClient(url)
+        self.prefix = prefix
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}{namespace}:{key}"
+
+    def get(self, namespace, key):
+        data = self.client.execute("GET", self._key(namespace, key))
+        return MISS if data is None else pickle.loads(data)
+
+    def set(self, namespace, key, value, ttl=None):
+        args = ["SET", self._key(namespace, key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        self.client.execute(*args)
+
+    def add(self, namespace, key, value, ttl=None):
+        args = ["SET", self._key(namespace, key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), "NX"]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        return self.client.execute(*args) is not None
+
+    def delete(self, namespace, key):
+        self.client.execute("DEL", self._key(namespace, key))
+
+    def clear(self, namespace):
+        cursor = "0"
+        while True:
+            cursor, keys = self.client.execute("SCAN", cursor, "MATCH", f"{self.prefix}{namespace}:*", "COUNT", 500)
+            if keys:
+                self.client.execute("DEL", *keys)
+            cursor = cursor.decode() if isinstance(cursor, bytes) else cursor
+            if cursor == "0":
+                break
+
+
+class BroadcastBackend(LRUBackend):
+    """
+    Per-worker LRU kept coherent across workers: deletes and clears are
+    broadcast (as whole-namespace invalidations) on an invalidation channel.
+    With a Redis URL the channel is pub/sub; otherwise each namespace has a
+    version stamp that readers check with a stat() before serving a hit.
+    """
+
+    CHANNEL = "sepcan:cache-invalidate"
+
+    def __init__(self, url: Optional[str] = None, max_entries: int = CACHE_MAX_ENTRIES):
+        super().__init__(max_entries)
+        self.url = url
+        self._seen: Dict[str, int] = {}
+        if url:
+            self._publisher = RespClient(url)
+            self._subscribed = threading.Event()
+            threading.Thread(target=self._listen, name="cache-invalidation", daemon=True).start()
+            self._subscribed.wait(timeout=2.0)
+
+    def _listen(self):
+        while True:
+            try:
+                client = RespClient(self.url, timeout=None)
+                client._connect()
+                client._local.sock.sendall(client.encode("SUBSCRIBE", self.CHANNEL))
+                reader = client._local.reader
+                client.read_reply(reader)  # subscription confirmation
+                self._subscribed.set()
+                while True:
+                    message = client.read_reply(reader)
+                    if isinstance(message, list) and message[0] == b"message":
+                        LRUBackend.clear(self, message[2].decode())
+            except Exception as e:
+                logger.warning("Cache invalidation channel disconnected: %s; retrying", e)
+                time.sleep(1.0)
+
+    def _stamp(self, namespace):
+        return f"cache-{namespace}"
+
+    def get(self, namespace, key):
+        if not self.url:
+            version = versions.current(self._stamp(namespace))
+            if self._seen.get(namespace, version) != version:
+                LRUBackend.clear(self, namespace)
+            self._seen[namespace] = version
+        return super().get(namespace, key)
+
+    def _broadcast(self, namespace):
+        if self.url:
+            self._publisher.execute("PUBLISH", self.CHANNEL, namespace)
+        else:
+            self._seen[namespace] = versions.bump(self._stamp(namespace))
+
+    def delete(self, namespace, key):
+        super().delete(namespace, key)
+        self._broadcast(namespace)
+
+    def release(self, namespace, key):
+        # Per-key and local: a broadcast would wipe the whole namespace on every worker
+        LRUBackend.delete(self, namespace, key)
+
+    def clear(self, namespace):
+        super().clear(namespace)
+        self._broadcast(namespace)
+
+
+# --- Front end ------------------------------------------------------------------
+class NamespaceStats:
+    __slots__ = ("hits", "misses", "sets", "evictions", "invalidations", "errors")
+
+    def __init__(self):
+        self.hits = self.misses = self.sets = self.evictions = self.invalidations = self.errors = 0
+
+    def as_dict(self) -> Dict:
+        lookups = self.hits + self.misses
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["hit_ratio"] = round(self.hits / lookups, 4) if lookups else None
+        return data
+
+
+class Namespace:
+    def __init__(self, cache: "Cache", name: str):
+        self._cache = cache
+        self.name = name
+        self.stats = cache._stats_for(name)
+
+    def get(self, key, default=None):
+        try:
+            value = self._cache.backend.get(self.name, str(key))
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning("Cache get failed (%s): %s", self.name, e)
+            value = MISS
+        if value is MISS:
+            self.stats.misses += 1
+            return default
+        self.stats.hits += 1
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        try:
+            self._cache.backend.set(self.name, str(key), value, ttl)
+            self.stats.sets += 1
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning("Cache set failed (%s): %s", self.name, e)
+
+    def add(self, key, value, ttl: Optional[float] = None) -> bool:
+        """Set `key` only if absent; True if set. On a backend failure, True (proceed as if uncached)."""
+        try:
+            added = self._cache.backend.add(self.name, str(key), value, ttl)
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning("Cache add failed (%s): %s", self.name, e)
+            return True
+        if added:
+            self.stats.sets += 1
+        return added
+
+    def get_or_set(self, key, factory: Callable[[], Any], ttl: Optional[float] = None):
+        value = self.get(key, MISS)
+        if value is MISS:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        try:
+            self._cache.backend.delete(self.name, str(key))
+            self.stats.invalidations += 1
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning("Cache delete failed (%s): %s", self.name, e)
+
+    def release(self, key):
+        """Drop an entry this process set (e.g. a claim) without a cross-worker invalidation."""
+        try:
+            self._cache.backend.release(self.name, str(key))
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning("Cache release failed (%s): %s", self.name, e)
+
+    def clear(self):
+        try:
+            self._cache.backend.clear(self.name)
+            self.stats.invalidations += 1
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning("Cache clear failed (%s): %s", self.name, e)
+
+
+class Cache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self._stats: Dict[str, NamespaceStats] = {}
+        self._lock = threading.Lock()
+        backend.on_evict = self._record_eviction
+
+    def _stats_for(self, name: str) -> NamespaceStats:
+        with self._lock:
+            return self._stats.setdefault(name, NamespaceStats())
+
+    def _record_eviction(self, namespace: str):
+        self._stats_for(namespace).evictions += 1
+
+    def namespace(self, name: str) -> Namespace:
+        return Namespace(self, name)
+
+    def stats(self) -> Dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "namespaces": {name: stats.as_dict() for name, stats in sorted(self._stats.items())},
+        }
+
+
+def create_backend(kind: str = CACHE_BACKEND, url: Optional[str] = CACHE_URL) -> CacheBackend:
+    if kind == "memory":
+        return LRUBackend()
+    if kind == "sqlite":
+        return SQLiteBackend()
+    if kind == "redis":
+        if not url:
+            raise ValueError("CACHE_BACKEND=redis requires CACHE_URL (redis://host:port/db)")
+        return RedisBackend(url)
+    if kind == "broadcast":
+        return BroadcastBackend(url)
+    raise ValueError(f"Unknown CACHE_BACKEND '{kind}'. Use memory, sqlite, redis or broadcast.")
+
+
+cache = Cache(create_backend())
@@ -0,0 +1,107 @@
+"""
+HTTP conditional GET for whole-table list endpoints.
+
+A list's validators come from its version stamp (app/utils/versions.py),
+bumped by every write in the owning router (coches, trabajadores and trabajos
+through reference_cache.safe_put, incidencias through versions.safe_bump),
+and from the table itself: its row count and highest updated_at, read with one
+aggregate query. The stamps live in SEPCAN_DATA_DIR, so they only see the
+writes made by the API processes of this host; the table part makes a write
+from another host (or from the database_management scripts) change the ETag
+too.
+
+When every API process shares one SEPCAN_DATA_DIR and the tables are only
+written through the API, CONDITIONAL_SHARED_STAMPS=true drops the table part:
+a request whose If-None-Match still matches is then answered 304 after one
+stat() call, without opening a database connection.
+
+With a read replica, a list whose stamp is younger than the replica's lag is
+read from the primary, so the body always matches its ETag.
+"""
+import os
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.database import replica
+from app.utils import versions
+
+CONDITIONAL_SHARED_STAMPS = os.getenv("CONDITIONAL_SHARED_STAMPS", "false").lower() in ("1", "true", "yes")
+
+# Clients may keep the body but must revalidate before every reuse
+CACHE_CONTROL = "private, no-cache"
+
+
+def _table_state(db: Session, model):
+    """Row count and highest updated_at (as epoch nanoseconds) of `model`'s table."""
+    rows, changed_at = db.execute(select(func.count(), func.max(model.updated_at)).select_from(model)).one()
+    changed_ns = int(changed_at.replace(tzinfo=timezone.utc).timestamp() * 1e9) if changed_at is not None else 0
+    return rows, changed_ns
+
+
+def validators(resource: str, db: Optional[Session] = None, model=None) -> Dict[str, str]:
+    """
+    ETag, Last-Modified and Cache-Control headers for the current version of
+    `resource`, including the state of `model`'s table when `db` is given.
+    """
+    version = versions.current(resource) or versions.bump(resource)
+    etag = f"{resource}-{version:x}"
+    modified = version
+    if db is not None and model is not None and not CONDITIONAL_SHARED_STAMPS:
+        rows, changed_ns = _table_state(db, model)
+        etag += f"-{rows:x}-{changed_ns:x}"
+        modified = max(modified, changed_ns)
+    return {
+        "ETag": f'"{etag}"',
+        "Last-Modified": formatdate(modified / 1e9, usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+    }
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _not_modified_since(header: str, last_modified: str) -> bool:
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+
+
+def is_fresh(request: Request, headers: Dict[str, str]) -> bool:
+    """True if the client's cached copy is still current (If-None-Match wins over If-Modified-Since)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, headers["ETag"])
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        return _not_modified_since(if_modified_since, headers["Last-Modified"])
+    return False
+
+
+def conditional_response(request: Request, resource: str, build: Callable[[], Response],
+                         db: Optional[Session] = None, model=None) -> Response:
+    """
+    304 if the client already has the current version of `resource` (and of
+    `model`'s table in `db`), otherwise `build()` with the validators attached.
+    The version is read before the query, so a write racing with it can only
+    make the next request re-fetch.
+    """
+    # Before the table query: it must see the rows the stamp stands for
+    replica.avoid_lag(versions.current(resource) or versions.bump(resource))
+    headers = validators(resource, db, model)
+    if is_fresh(request, headers):
+        return Response(status_code=304, headers=headers)
+    response = build()
+    response.headers.update(headers)
+    return response
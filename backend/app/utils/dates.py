@@ -0,0 +1,117 @@
+"""
+Date codec shared by the API and the database_management scripts.
+
+Dates travel as DD/MM/YYYY (what the API returns) or YYYY-MM-DD (what HTML
+date inputs send). The format is sniffed from the separators instead of
+trying strptime formats in turn, so well-formed input never raises and
+catches internally, and parsed values are memoized because forms repeat the
+same few days over and over. The *_column helpers convert whole columns at
+once: to_day_array for the analytics snapshot, format_date_column for text
+output of a whole column.
+
+This module must stay free of app imports: database_management loads it by
+path without importing the app package.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+DATE_FORMAT = "%d/%m/%Y"
+ISO_FORMAT = "%Y-%m-%d"
+
+
+def sniff_format(value: str) -> Optional[str]:
+    """DATE_FORMAT, ISO_FORMAT, or None if `value` has neither shape."""
+    if value.count("/") == 2:
+        return DATE_FORMAT
+    if value.count("-") == 2:
+        return ISO_FORMAT
+    return None
+
+
+def _split_date(value: str):
+    fmt = sniff_format(value)
+    if fmt is DATE_FORMAT:
+        day, month, year = value.split("/")
+    elif fmt is ISO_FORMAT:
+        year, month, day = value.split("-")
+    else:
+        return None
+    if not (day.isdigit() and month.isdigit() and year.isdigit()):
+        return None
+    if len(year) != 4 or not 1 <= len(month) <= 2 or not 1 <= len(day) <= 2:
+        return None
+    return int(year), int(month), int(day)
+
+
+@lru_cache(maxsize=8192)
+def _parse(value: str) -> Optional[datetime]:
+    parts = _split_date(value)
+    if parts is None:
+        return None
+    try:
+        return datetime(*parts)
+    except ValueError:  # 31/02/2025 and friends
+        return None
+
+
+def try_parse_date(value: Optional[str]) -> Optional[datetime]:
+    """Parse DD/MM/YYYY or YYYY-MM-DD; None for empty or invalid input."""
+    if not value:
+        return None
+    return _parse(value.strip())
+
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    """Parse DD/MM/YYYY or YYYY-MM-DD; None for empty input, ValueError for invalid input."""
+    if not value:
+        return None
+    parsed = _parse(value.strip())
+    if parsed is None:
+        raise ValueError(f"Date must be in DD/MM/YYYY or YYYY-MM-DD format, got {value}")
+    return parsed
+
+
+def format_date(value) -> Optional[str]:
+    """Render a date/datetime as DD/MM/YYYY."""
+    if not value:
+        return None
+    return f"{value.day:02d}/{value.month:02d}/{value.year:04d}"
+
+
+# --- Column conversion --------------------------------------------------------
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _day_number(value) -> Optional[int]:
+    if isinstance(value, str):
+        value = try_parse_date(value)
+    if value is None:
+        return None
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def to_day_array(values: Iterable):
+    """
+    NumPy datetime64[D] array from datetimes, dates, date strings or None (-> NaT).
+    Invalid strings become NaT.
+    """
+    import numpy as np
+
+    nat = np.iinfo(np.int64).min
+    days = np.fromiter(
+        (nat if n is None else n for n in map(_day_number, values)),
+        dtype=np.int64,
+    )
+    return days.view("datetime64[D]")
+
+
+def format_date_column(values: Iterable) -> List[Optional[str]]:
+    """DD/MM/YYYY strings for a column of dates/datetimes/date strings (None -> None)."""
+    import numpy as np
+
+    days = to_day_array(values)
+    uniques, inverse = np.unique(days.view(np.int64), return_inverse=True)
+    nat = np.iinfo(np.int64).min
+    rendered = [None if n == nat else format_date(date.fromordinal(int(n) + _EPOCH_ORDINAL)) for n in uniques]
+    return [rendered[i] for i in inverse.tolist()]
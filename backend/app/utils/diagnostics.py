@@ -0,0 +1,276 @@
+"""
+Query diagnostics: slow-query log, N+1 detection and per-endpoint query budgets.
+
+- Statements slower than SLOW_QUERY_MS are logged with their execution plan
+  (SHOWPLAN_TEXT on SQL Server, EXPLAIN QUERY PLAN on SQLite, EXPLAIN
+  elsewhere). The plan is fetched on a separate connection from a background
+  thread, at most once per statement shape every EXPLAIN_INTERVAL seconds.
+- Within one request, a statement shape (the SQL with its parameter lists
+  collapsed) repeated N_PLUS_ONE_THRESHOLD times is reported as a likely N+1,
+  typically a lazy relationship loaded inside a loop.
+- Endpoints declare how many statements they are expected to run with
+  @declare_query_budget(n). Overruns are logged at runtime; in tests,
+  `query_budget()` turns them into assertion failures:
+
+      with diagnostics.query_budget():
+          client.put("/api/incidencias/1/resolve?id_mecanico=42871236")
+
+The recent reports are kept in memory for GET /api/admin/queries.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+EXPLAIN_INTERVAL = float(os.getenv("EXPLAIN_INTERVAL", "600"))
+
+slow_queries: deque = deque(maxlen=50)
+n_plus_one_reports: deque = deque(maxlen=50)
+budget_violations: deque = deque(maxlen=50)
+_violation_count = 0
+
+
+class RequestQueries:
+    """Statements seen while serving one request."""
+    __slots__ = ("method", "path", "count", "shapes", "statements", "flagged")
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.count = 0
+        self.shapes: Counter = Counter()
+        self.statements: List[str] = []
+        self.flagged = set()
+
+
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("sepcan_request_queries", default=None)
+_explaining = threading.local()
+_last_explained: Dict[str, float] = {}
+_recorders: List[List[str]] = []  # open query_budget() blocks
+_lock = threading.Lock()
+
+_PARAM_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def statement_shape(statement: str) -> str:
+    """SQL with whitespace normalized and expanded IN (...) parameter lists collapsed."""
+    return _WHITESPACE.sub(" ", _PARAM_LIST.sub("(?...)", statement)).strip()
+
+
+# --- Database events ----------------------------------------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sepcan_diag_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["sepcan_diag_start"].pop()) * 1000
+    if getattr(_explaining, "active", False):
+        return
+
+    request = _current.get()
+    if request is not None:
+        request.count += 1
+        request.statements.append(statement)
+        shape = statement_shape(statement)
+        request.shapes[shape] += 1
+        if request.shapes[shape] >= N_PLUS_ONE_THRESHOLD and shape not in request.flagged:
+            request.flagged.add(shape)
+            _report_n_plus_one(request, shape)
+    for recorder in _recorders:
+        recorder.append(statement)
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        _report_slow(conn.engine, statement, parameters, elapsed_ms, request, executemany)
+
+
+def _report_n_plus_one(request: RequestQueries, shape: str):
+    n_plus_one_reports.append({
+        "at": time.time(), "method": request.method, "path": request.path, "statement": shape,
+    })
+    logger.warning(
+        "Possible N+1 in %s %s: statement repeated %d times: %s",
+        request.method, request.path, N_PLUS_ONE_THRESHOLD, shape,
+    )
+
+
+def _report_slow(engine, statement, parameters, elapsed_ms, request, executemany):
+    shape = statement_shape(statement)
+    entry = {
+        "at": time.time(),
+        "ms": round(elapsed_ms, 1),
+        "method": request.method if request else None,
+        "path": request.path if request else None,
+        "statement": shape,
+        "plan": None,
+    }
+    slow_queries.append(entry)
+
+    now = time.monotonic()
+    with _lock:
+        explain = (
+            not executemany
+            and shape.split(" ", 1)[0].upper() in ("SELECT", "WITH")
+            and now - _last_explained.get(shape, -EXPLAIN_INTERVAL) >= EXPLAIN_INTERVAL
+        )
+        if explain:
+            _last_explained[shape] = now
+    if not explain:
+        logger.warning("Slow query (%.0f ms) in %s %s: %s", elapsed_ms, entry["method"], entry["path"], shape)
+        return
+    threading.Thread(
+        target=_explain_and_log, args=(engine, statement, parameters, entry), daemon=True,
+        name="slow-query-explain",
+    ).start()
+
+
+def explain(engine, statement: str, parameters=()) -> List[str]:
+    """Execution plan of `statement` as text lines, without running it (where the backend allows)."""
+    _explaining.active = True
+    try:
+        with engine.connect() as conn:
+            dialect = engine.dialect.name
+            if dialect == "mssql":
+                conn.exec_driver_sql("SET SHOWPLAN_TEXT ON")
+                try:
+                    result = conn.exec_driver_sql(statement, parameters)
+                    lines = []
+                    while True:  # one result set per statement of the batch
+                        lines.extend(str(row[0]) for row in result.fetchall())
+                        if not result.cursor or not result.cursor.nextset():
+                            break
+                finally:
+                    conn.exec_driver_sql("SET SHOWPLAN_TEXT OFF")
+                return lines
+            prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+            rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+            return [" | ".join(str(value) for value in row) for row in rows]
+    finally:
+        _explaining.active = False
+
+
+def _explain_and_log(engine, statement, parameters, entry):
+    try:
+        entry["plan"] = explain(engine, statement, parameters)
+        plan = "\n  ".join(entry["plan"])
+    except Exception as e:
+        plan = f"(plan unavailable: {e})"
+    logger.warning(
+        "Slow query (%.0f ms) in %s %s: %s\n  %s",
+        entry["ms"], entry["method"], entry["path"], entry["statement"], plan,
+    )
+
+
+_installed = False
+
+
+def install():
+    """Attach the cursor events to every SQLAlchemy engine (idempotent)."""
+    global _installed
+    if not _installed:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _installed = True
+
+
+# --- Query budgets -------------------------------------------------------------
+def declare_query_budget(max_statements: int) -> Callable:
+    """Decorator for endpoints: the number of SQL statements one call is expected to need."""
+    def decorator(endpoint):
+        endpoint.query_budget = max_statements
+        return endpoint
+    return decorator
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_statements: Optional[int] = None):
+    """
+    Test helper. Fails if a request served inside the block ran more statements
+    than its endpoint declared, or (with `max_statements`) if the block as a
+    whole ran more than that. Yields the list of statements executed.
+    """
+    statements: List[str] = []
+    violations_before = _violation_count
+    with _lock:
+        _recorders.append(statements)
+    try:
+        yield statements
+    finally:
+        with _lock:
+            _recorders.remove(statements)
+    new = min(_violation_count - violations_before, len(budget_violations))
+    if new:
+        v = budget_violations[-new]
+        raise QueryBudgetExceeded(
+            f"{v['method']} {v['path']} ran {v['count']} statements, budget is {v['budget']}:\n  "
+            + "\n  ".join(v["statements"])
+        )
+    if max_statements is not None and len(statements) > max_statements:
+        raise QueryBudgetExceeded(
+            f"{len(statements)} statements, budget is {max_statements}:\n  " + "\n  ".join(statements)
+        )
+
+
+def _check_budget(request: RequestQueries, endpoint):
+    global _violation_count
+    budget = getattr(endpoint, "query_budget", None)
+    if budget is None or request.count <= budget:
+        return
+    violation = {
+        "at": time.time(), "method": request.method, "path": request.path,
+        "count": request.count, "budget": budget,
+        "statements": [statement_shape(s) for s in request.statements],
+    }
+    with _lock:
+        budget_violations.append(violation)
+        _violation_count += 1
+    logger.warning(
+        "%s %s ran %d SQL statements (budget %d)", request.method, request.path, request.count, budget,
+    )
+
+
+# --- ASGI middleware ----------------------------------------------------------
+class DiagnosticsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = RequestQueries(scope["method"], scope["path"])
+        token = _current.set(request)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            _check_budget(request, scope.get("endpoint"))
+
+
+def report() -> Dict:
+    """Recent slow queries, N+1 suspects and budget overruns (this worker)."""
+    return {
+        "slow_query_ms": SLOW_QUERY_MS,
+        "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+        "slow_queries": list(slow_queries),
+        "n_plus_one": list(n_plus_one_reports),
+        "budget_violations": list(budget_violations),
+    }
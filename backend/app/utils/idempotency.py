@@ -0,0 +1,174 @@
+"""
+Idempotency-Key support for POST/PUT/PATCH/DELETE requests.
+
+Phones on a poor connection retry submissions whose answer they never got.
+A client sends the same `Idempotency-Key` header (any unique string, e.g. a
+UUID) on every retry of one logical operation:
+
+- the first request claims the key and runs; a 2xx/3xx response (status,
+  content headers and body) is kept for IDEMPOTENCY_TTL seconds;
+- a retry with the key gets that response again, with an
+  `Idempotent-Replayed: true` header, without running the endpoint (no
+  database work, no Gemini call);
+- a retry that arrives while the first request is still running waits for
+  it (up to IDEMPOTENCY_WAIT_SECONDS, then 409) and gets its response;
+- the same key on a different request (method, path, query or body) is
+  refused with 422;
+- 4xx/5xx responses and failures release the key, so a retry runs again.
+
+Keys live in the app cache (namespace "idempotency"): per worker with the
+default memory backend (and with broadcast, whose invalidations this module
+never triggers: a failed claim is released for its key only), shared by the
+workers of a host with CACHE_BACKEND=sqlite and across hosts with redis. An
+in-flight claim expires after IDEMPOTENCY_LOCK_SECONDS in case its worker
+died.
+
+The memory, broadcast and sqlite backends share CACHE_MAX_ENTRIES with every
+other namespace: heavy unrelated cache traffic can evict claims and stored
+responses before their TTL, and a retry after that runs again. Size
+CACHE_MAX_ENTRIES for it, or use redis, where entries only expire.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+from app.utils.cache import cache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "120"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+POLL_SECONDS = 0.05
+
+KEY_HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+# Response headers worth replaying (not Set-Cookie, request ids or timing)
+STORED_HEADERS = frozenset({b"content-type", b"content-encoding", b"location", b"etag", b"cache-control"})
+
+store = cache.namespace("idempotency")
+
+
+class _Pending:
+    __slots__ = ("fingerprint",)
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+
+
+class _Stored:
+    __slots__ = ("fingerprint", "status", "headers", "body")
+
+    def __init__(self, fingerprint: str, status: int, headers: list, body: bytes):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+async def _send_json(send, status: int, body: bytes, extra_headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    *extra_headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _replay(send, stored: _Stored):
+    headers = [*stored.headers, (b"content-length", str(len(stored.body)).encode()),
+               (b"idempotent-replayed", b"true")]
+    await send({"type": "http.response.start", "status": stored.status, "headers": headers})
+    await send({"type": "http.response.body", "body": stored.body})
+
+
+class IdempotencyMiddleware:
+    """Replays the stored response of a repeated Idempotency-Key (see the module docstring)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in METHODS:
+            await self.app(scope, receive, send)
+            return
+        key = None
+        for name, value in scope["headers"]:
+            if name == KEY_HEADER:
+                key = value.decode("latin-1").strip()
+                break
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, b'{"detail":"Idempotency-Key demasiado larga"}')
+            return
+
+        # The body is part of the fingerprint: read it all, then hand it to the app unchanged
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        fingerprint = hashlib.sha256(
+            b"\n".join((scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body))
+        ).hexdigest()
+        store_key = hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while not store.add(store_key, _Pending(fingerprint), ttl=IDEMPOTENCY_LOCK_SECONDS):
+            entry = store.get(store_key)
+            if entry is None:  # released or expired in between: try to claim it again
+                continue
+            if entry.fingerprint != fingerprint:
+                await _send_json(send, 422, b'{"detail":"Idempotency-Key ya usada con otra peticion"}')
+                return
+            if isinstance(entry, _Stored):
+                logger.info("Replaying stored response for Idempotency-Key %s", key)
+                await _replay(send, entry)
+                return
+            if time.monotonic() > deadline:
+                await _send_json(send, 409, b'{"detail":"La peticion original con esta Idempotency-Key sigue en curso"}',
+                                 [(b"retry-after", b"5")])
+                return
+            await asyncio.sleep(POLL_SECONDS)
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        response = {"status": None, "headers": [], "body": []}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [(name, value) for name, value in message.get("headers", [])
+                                       if name.lower() in STORED_HEADERS]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        completed = False
+        try:
+            await self.app(scope, replay_receive, send_wrapper)
+            completed = True
+        finally:
+            status = response["status"]
+            if completed and status is not None and status < 400:
+                store.set(store_key, _Stored(fingerprint, status, response["headers"], b"".join(response["body"])),
+                          ttl=IDEMPOTENCY_TTL)
+            else:
+                store.release(store_key)
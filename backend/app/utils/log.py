@@ -0,0 +1,196 @@
+"""
+Logging for the API: non-blocking, structured, with request correlation ids.
+
+configure() routes every record through a QueueHandler; a QueueListener
+thread does the formatting and the stdout writes, so a request thread only
+pays for creating the record and putting it on a queue. Messages use lazy
+%-style arguments and structured data goes in `fields`, which is also only
+rendered on the listener thread:
+
+    logger.debug("FormularioCoche received", extra=log.fields(formulario=formulario))
+
+Records are JSON lines by default (LOG_FORMAT=text for a human-readable
+format), stamped with the id of the request that produced them: the
+X-Request-ID header if the client sent one, otherwise a generated id, which
+RequestIdMiddleware also returns in the response.
+
+DEBUG events are sampled per request (LOG_DEBUG_SAMPLE_RATE, default 1 =
+keep all), so a sampled request keeps its whole debug trail. INFO and above
+are never sampled.
+
+This module must not import the rest of the app: it is configured before the
+routers (and the database connection) are imported.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1"))
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+request_id: ContextVar[Optional[str]] = ContextVar("sepcan_request_id", default=None)
+_debug_sampled: ContextVar[bool] = ContextVar("sepcan_debug_sampled", default=True)
+
+_listener: Optional[QueueListener] = None
+
+
+def fields(**values) -> Dict:
+    """`extra=` argument carrying structured fields; they are serialized on the listener thread."""
+    return {"fields": values}
+
+
+# --- Producer side (request threads) --------------------------------------------
+class SamplingLogger(logging.Logger):
+    """Logger that reports DEBUG as disabled for unsampled requests, before any record is built."""
+
+    def isEnabledFor(self, level: int) -> bool:
+        if level <= logging.DEBUG and not _debug_sampled.get():
+            return False
+        return super().isEnabledFor(level)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps the request id and drops DEBUG records of requests not sampled (from loggers created before configure())."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and not _debug_sampled.get():
+            return False
+        record.request_id = request_id.get()
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare() formats the message here, on the request thread.
+        # Records stay in this process, so arguments can travel unformatted.
+        return record
+
+
+# --- Consumer side (listener thread) ----------------------------------------------
+def _json_default(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            data["request_id"] = record.request_id
+        if getattr(record, "fields", None):
+            data["fields"] = record.fields
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        if orjson is not None:
+            return orjson.dumps(data, default=_json_default, option=orjson.OPT_NON_STR_KEYS).decode()
+        return json.dumps(data, default=_json_default, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        if getattr(record, "request_id", None):
+            text = f"[{record.request_id}] {text}"
+        if getattr(record, "fields", None):
+            text += " " + json.dumps(record.fields, default=_json_default, ensure_ascii=False)
+        return text
+
+
+def configure(stream=None):
+    """Install the queue-based root handler (idempotent). Called once from app.main."""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JSONFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    logging.setLoggerClass(SamplingLogger)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Flush the queue and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# --- Correlation ids ------------------------------------------------------------------
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    """Binds a request id (and the DEBUG sampling decision) to everything the request logs."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rid = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                candidate = value.decode("latin-1")
+                rid = candidate if _VALID_REQUEST_ID.match(candidate) else None
+                break
+        rid = rid or uuid.uuid4().hex[:16]
+        header = (REQUEST_ID_HEADER, rid.encode())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        rid_token = request_id.set(rid)
+        sampled_token = _debug_sampled.set(DEBUG_SAMPLE_RATE >= 1 or random.random() < DEBUG_SAMPLE_RATE)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id.reset(rid_token)
+            _debug_sampled.reset(sampled_token)
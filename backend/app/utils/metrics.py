@@ -0,0 +1,332 @@
+"""
+Per-request performance metrics in Prometheus text format.
+
+`MetricsMiddleware` (pure ASGI, so it adds no extra task or body copy) times
+every request and counts its response bytes; SQLAlchemy cursor events add the
+number and duration of the statements it ran, `llm_timer()` the time spent
+waiting for Gemini, and `TimedQueuePool` the time spent waiting for a pooled
+database connection. Everything is aggregated per (method, route template,
+status) and rendered by `render()` for GET /metrics, together with the cache
+and request-coalescing counters.
+
+Rows returned are counted where the app materializes them in bulk (the
+`encode_rows` fast path) plus the rowcount of INSERT/UPDATE/DELETE; DBAPI
+drivers do not report a row count for SELECTs at execute time.
+
+Metrics are per worker process (`sepcan_process_id` tells them apart): scrape
+each worker, or sum in Prometheus.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 30.0)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Requests to these paths are not recorded (scrapes would dominate the numbers,
+# long-lived event streams the latency histograms)
+EXCLUDED_PATHS = frozenset({"/metrics", "/api/incidencias/stream"})
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class RequestStats:
+    """What one request did; filled in by the DB events and timers while it runs."""
+    __slots__ = ("db_statements", "db_seconds", "rows", "llm_seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.db_statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.llm_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+
+class RouteStats:
+    __slots__ = ("latency", "response_bytes", "db_statements", "db_seconds", "rows", "llm_seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.response_bytes = 0
+        self.db_statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.llm_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("sepcan_request_stats", default=None)
+_routes: Dict[Tuple[str, str, str], RouteStats] = {}
+_llm = Histogram(LLM_BUCKETS)
+_pool_wait = Histogram(POOL_WAIT_BUCKETS)
+_pool_timeouts = 0
+_totals = RequestStats()  # includes work done outside requests (background refreshes)
+_lock = threading.Lock()
+
+
+def current() -> Optional[RequestStats]:
+    """Stats of the request being served, None outside a request."""
+    return _current.get()
+
+
+def add_rows(count: int):
+    _totals.rows += count
+    stats = _current.get()
+    if stats is not None:
+        stats.rows += count
+
+
+@contextmanager
+def llm_timer():
+    """Time an LLM call, both for the current request and for the global LLM histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _llm.observe(elapsed)
+        _totals.llm_seconds += elapsed
+        stats = _current.get()
+        if stats is not None:
+            stats.llm_seconds += elapsed
+
+
+# --- Connection pool ------------------------------------------------------------
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits (for a free connection, or to open one)."""
+
+    def _do_get(self):
+        global _pool_timeouts
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with _lock:
+                _pool_timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with _lock:
+                _pool_wait.observe(elapsed)
+            stats = _current.get()
+            if stats is not None:
+                stats.pool_wait_seconds += elapsed
+
+
+# --- Database events ----------------------------------------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sepcan_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["sepcan_query_start"].pop()
+    rows = 0
+    if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        rows = max(cursor.rowcount or 0, 0)
+    _totals.db_statements += 1
+    _totals.db_seconds += elapsed
+    _totals.rows += rows
+    stats = _current.get()
+    if stats is not None:
+        stats.db_statements += 1
+        stats.db_seconds += elapsed
+        stats.rows += rows
+
+
+_installed = False
+
+
+def install():
+    """Attach the cursor events to every SQLAlchemy engine (idempotent)."""
+    global _installed
+    if not _installed:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _installed = True
+
+
+# --- ASGI middleware ----------------------------------------------------------
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXCLUDED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        response_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            _record((scope["method"], _route_template(scope), str(status)), elapsed, response_bytes, stats)
+
+
+def _route_template(scope) -> str:
+    """Path template of the matched route ("/api/coches/{id_coche}"), "unmatched" for 404s."""
+    template = getattr(scope.get("route"), "path", None)
+    if template is None:
+        return "unmatched"
+    # Depending on the FastAPI version the route may not carry the include_router
+    # prefix; take it from the request path, which has as many segments.
+    extra = scope["path"].count("/") - template.count("/")
+    if extra > 0:
+        template = "/".join(scope["path"].split("/")[:extra + 1]) + template
+    return template
+
+
+def _record(key: Tuple[str, str, str], elapsed: float, response_bytes: int, stats: RequestStats):
+    with _lock:
+        route = _routes.get(key)
+        if route is None:
+            route = _routes[key] = RouteStats()
+        route.latency.observe(elapsed)
+        route.response_bytes += response_bytes
+        route.db_statements += stats.db_statements
+        route.db_seconds += stats.db_seconds
+        route.rows += stats.rows
+        route.llm_seconds += stats.llm_seconds
+        route.pool_wait_seconds += stats.pool_wait_seconds
+
+
+# --- Prometheus exposition ----------------------------------------------------
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, histogram: Histogram, labels: Dict[str, str]) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        lines.append(f"{name}_bucket{_labels(**labels, le=le)} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+    return lines
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    from app.database.connection import engine
+    from app.utils import singleflight
+    from app.utils.cache import cache
+
+    with _lock:
+        routes = sorted(_routes.items())
+        lines = [
+            "# HELP sepcan_http_request_duration_seconds Request latency by route template and status.",
+            "# TYPE sepcan_http_request_duration_seconds histogram",
+        ]
+        per_route = []
+        for (method, template, status), route in routes:
+            labels = {"method": method, "route": template, "status": status}
+            lines.extend(_histogram_lines("sepcan_http_request_duration_seconds", route.latency, labels))
+            per_route.append((labels, route))
+
+        counters = (
+            ("sepcan_http_response_bytes_total", "Response body bytes.", "response_bytes"),
+            ("sepcan_db_statements_total", "SQL statements executed while serving the route.", "db_statements"),
+            ("sepcan_db_seconds_total", "Time spent executing SQL statements.", "db_seconds"),
+            ("sepcan_db_rows_total", "Rows serialized in bulk or affected by DML.", "rows"),
+            ("sepcan_llm_seconds_total", "Time spent waiting for the LLM.", "llm_seconds"),
+            ("sepcan_db_pool_wait_seconds_total", "Time spent waiting for a pooled DB connection.", "pool_wait_seconds"),
+        )
+        for name, help_text, attr in counters:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, route in per_route:
+                lines.append(f"{name}{_labels(**labels)} {getattr(route, attr)}")
+
+        lines.append("# HELP sepcan_llm_call_duration_seconds Duration of LLM calls.")
+        lines.append("# TYPE sepcan_llm_call_duration_seconds histogram")
+        lines.extend(_histogram_lines("sepcan_llm_call_duration_seconds", _llm, {}))
+
+        lines.append("# HELP sepcan_process_db_statements_total SQL statements executed by this process.")
+        lines.append("# TYPE sepcan_process_db_statements_total counter")
+        lines.append(f"sepcan_process_db_statements_total {_totals.db_statements}")
+        lines.append("# HELP sepcan_process_db_seconds_total Time spent executing SQL in this process.")
+        lines.append("# TYPE sepcan_process_db_seconds_total counter")
+        lines.append(f"sepcan_process_db_seconds_total {_totals.db_seconds}")
+
+        lines.append("# HELP sepcan_db_pool_checkout_wait_seconds Time each connection checkout waited.")
+        lines.append("# TYPE sepcan_db_pool_checkout_wait_seconds histogram")
+        lines.extend(_histogram_lines("sepcan_db_pool_checkout_wait_seconds", _pool_wait, {}))
+        lines.append("# HELP sepcan_db_pool_timeouts_total Checkouts that gave up after pool_timeout.")
+        lines.append("# TYPE sepcan_db_pool_timeouts_total counter")
+        lines.append(f"sepcan_db_pool_timeouts_total {_pool_timeouts}")
+
+    pool = getattr(engine, "pool", None)
+    if isinstance(pool, QueuePool):
+        for name, help_text, value in (
+            ("sepcan_db_pool_size", "Configured pool size.", pool.size()),
+            ("sepcan_db_pool_checked_out", "Connections currently in use.", pool.checkedout()),
+            ("sepcan_db_pool_overflow", "Connections open beyond the pool size (negative: not yet opened).", pool.overflow()),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    lines.append("# TYPE sepcan_process_id gauge")
+    lines.append(f"sepcan_process_id {os.getpid()}")
+
+    cache_stats = cache.stats()["namespaces"]
+    for field in ("hits", "misses", "sets", "evictions", "invalidations", "errors"):
+        name = f"sepcan_cache_{field}_total"
+        lines.append(f"# TYPE {name} counter")
+        for namespace, values in sorted(cache_stats.items()):
+            lines.append(f"{name}{_labels(namespace=namespace)} {values[field]}")
+
+    coalescing = singleflight.stats()
+    for field in ("requests", "executions", "coalesced", "ttl_hits", "errors"):
+        name = f"sepcan_coalescing_{field}_total"
+        lines.append(f"# TYPE {name} counter")
+        for group, values in sorted(coalescing.items()):
+            lines.append(f"{name}{_labels(group=group)} {values[field]}")
+
+    return "\n".join(lines) + "\n"
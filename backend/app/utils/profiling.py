@@ -0,0 +1,309 @@
+"""
+On-demand profiling of a single request.
+
+A request that carries the admin token in an `X-Profile` header (or in a
+`_profile` query parameter, for downloads opened by the browser) is profiled:
+
+- a sampling profiler records the stack of the thread running the endpoint
+  (and of the event loop thread while it is busy) every PROFILE_INTERVAL_MS;
+- tracemalloc traces allocations for the duration of the request.
+
+Results go to SEPCAN_DATA_DIR/profiles as <id>.speedscope.json (open in
+https://www.speedscope.app), <id>.pstats (python -m pstats, snakeviz),
+<id>.tracemalloc (tracemalloc.Snapshot.load) and a <id>.json summary; the
+response carries the id in an X-Profile-Id header. They are listed and served
+by /api/admin/profiles.
+
+Without ADMIN_TOKEN the middleware is a no-op, and without the flag a request
+only pays for a scan of its headers and query string. Allocations and loop
+samples of concurrent requests are included, so profile on a quiet worker.
+Allocation tracing makes allocation-heavy requests (Excel exports) several
+times slower while profiled; PROFILE_TRACEMALLOC=0 keeps only the CPU samples.
+"""
+import hmac
+import json
+import logging
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, parse_qsl, urlencode
+
+from app.utils.storage import data_path
+
+logger = logging.getLogger(__name__)
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "2")) / 1000
+MAX_PROFILES = int(os.getenv("MAX_PROFILES", "50"))
+TRACE_ALLOCATIONS = os.getenv("PROFILE_TRACEMALLOC", "1") != "0"
+PROFILE_HEADER = b"x-profile"
+PROFILE_PARAM = "_profile"
+
+# Frames where an idle event loop thread waits; such samples are dropped
+_IDLE_FUNCTIONS = frozenset({"select", "poll", "epoll", "_run_once", "run_forever"})
+
+Frame = Tuple[str, int, str]  # (filename, first line, function name), as pstats keys them
+
+
+def profiles_dir() -> str:
+    return os.path.dirname(data_path("profiles", "x"))
+
+
+class Sampler(threading.Thread):
+    """Samples the stacks of the threads that run one request."""
+
+    def __init__(self, scope, loop_thread: int, interval: float = PROFILE_INTERVAL):
+        super().__init__(daemon=True, name="request-profiler")
+        self.scope = scope
+        self.loop_thread = loop_thread
+        self.interval = interval
+        self.samples: Counter = Counter()  # root->leaf stack -> count
+        self._done = threading.Event()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._done.wait(self.interval):
+            endpoint = self.scope.get("endpoint")
+            code = getattr(endpoint, "__code__", None)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                if thread_id == self.loop_thread:
+                    if frame.f_code.co_name not in _IDLE_FUNCTIONS:
+                        self.samples[_stack(frame)] += 1
+                elif code is not None and _runs(frame, code):
+                    self.samples[_stack(frame)] += 1
+
+
+def _stack(frame) -> Tuple[Frame, ...]:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    frames.reverse()
+    return tuple(frames)
+
+
+def _runs(frame, code) -> bool:
+    while frame is not None:
+        if frame.f_code is code:
+            return True
+        frame = frame.f_back
+    return False
+
+
+# --- Output formats -----------------------------------------------------------
+def to_speedscope(samples: Counter, interval: float, name: str) -> Dict:
+    frame_index: Dict[Frame, int] = {}
+    frames = []
+    stacks = []
+    weights = []
+    for stack, count in samples.items():
+        indices = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                frames.append({"name": frame[2], "file": frame[0], "line": frame[1]})
+            indices.append(frame_index[frame])
+        stacks.append(indices)
+        weights.append(count * interval)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": stacks,
+            "weights": weights,
+        }],
+        "exporter": "sepcan profiling",
+    }
+
+
+def to_pstats(samples: Counter, interval: float) -> Dict:
+    """
+    Samples as the dict pstats.Stats loads: {func: (cc, nc, tt, ct, callers)}.
+    Call counts are sample counts; tt/ct are self/inclusive time estimates.
+    """
+    self_time: Counter = Counter()
+    total_time: Counter = Counter()
+    hits: Counter = Counter()
+    edges: Dict[Frame, Counter] = {}
+    for stack, count in samples.items():
+        self_time[stack[-1]] += count
+        for func in set(stack):
+            total_time[func] += count
+        for func in stack:
+            hits[func] += count
+        for caller, callee in set(zip(stack, stack[1:])):
+            edges.setdefault(callee, Counter())[caller] += count
+    stats = {}
+    for func in total_time:
+        callers = {
+            caller: (n, n, 0.0, n * interval) for caller, n in edges.get(func, {}).items()
+        }
+        stats[func] = (hits[func], hits[func], self_time[func] * interval, total_time[func] * interval, callers)
+    return stats
+
+
+def _top_allocations(snapshot, limit: int = 20) -> List[Dict]:
+    return [
+        {"where": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+# --- Middleware -----------------------------------------------------------------
+def _requested(scope) -> bool:
+    token = None
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            token = value.decode("latin-1")
+            break
+    if token is None and PROFILE_PARAM.encode() in scope["query_string"]:
+        token = parse_qs(scope["query_string"].decode("latin-1")).get(PROFILE_PARAM, [None])[0]
+    return token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+_SLUG = re.compile(r"[^A-Za-z0-9]+")
+_profile_lock = threading.Lock()  # one profiled request at a time per worker
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ADMIN_TOKEN or scope["type"] != "http" or not _requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if not _profile_lock.acquire(blocking=False):
+            logger.warning("Profile of %s skipped: another request is being profiled", scope["path"])
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self._profile(scope, receive, send)
+        finally:
+            _profile_lock.release()
+
+    async def _profile(self, scope, receive, send):
+        now = time.time()
+        profile_id = (
+            f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}"
+            f"-{scope['method']}{_SLUG.sub('-', scope['path']).rstrip('-')}"
+        )
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        started_tracing = TRACE_ALLOCATIONS and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(int(os.getenv("PROFILE_TRACEBACK_DEPTH", "1")))
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        sampler = Sampler(scope, threading.get_ident())
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            elapsed = time.perf_counter() - start
+            snapshot, peak = None, None
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot().filter_traces((
+                    tracemalloc.Filter(False, __file__),
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                ))
+                peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            try:
+                _save(profile_id, scope, status, elapsed, sampler, snapshot, peak)
+            except Exception as e:
+                logger.warning("Could not save profile %s: %s", profile_id, e)
+
+
+def _save(profile_id, scope, status, elapsed, sampler: Sampler, snapshot, peak):
+    base = data_path("profiles", profile_id)
+    with open(base + ".speedscope.json", "w") as f:
+        json.dump(to_speedscope(sampler.samples, sampler.interval, f"{scope['method']} {scope['path']}"), f)
+    with open(base + ".pstats", "wb") as f:
+        marshal.dump(to_pstats(sampler.samples, sampler.interval), f)
+    files = [profile_id + ".speedscope.json", profile_id + ".pstats"]
+    if snapshot is not None:
+        snapshot.dump(base + ".tracemalloc")
+        files.append(profile_id + ".tracemalloc")
+    query = [
+        (name, value) for name, value in parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+        if name != PROFILE_PARAM
+    ]
+    summary = {
+        "id": profile_id,
+        "method": scope["method"],
+        "path": scope["path"],
+        "query": urlencode(query),
+        "status": status,
+        "seconds": round(elapsed, 4),
+        "samples": sum(sampler.samples.values()),
+        "interval_ms": sampler.interval * 1000,
+        "peak_traced_kb": round(peak / 1024, 1) if peak is not None else None,
+        "top_allocations": _top_allocations(snapshot) if snapshot is not None else [],
+        "files": files,
+    }
+    with open(base + ".json", "w") as f:
+        json.dump(summary, f, indent=1)
+    _prune()
+    logger.info("Saved profile %s (%.0f ms, %d samples)", profile_id, elapsed * 1000, summary["samples"])
+
+
+def _prune():
+    summaries = sorted(name for name in os.listdir(profiles_dir()) if name.endswith(".json") and ".speedscope" not in name)
+    for name in summaries[:-MAX_PROFILES] if len(summaries) > MAX_PROFILES else []:
+        stem = name[:-len(".json")]
+        for ext in (".json", ".speedscope.json", ".pstats", ".tracemalloc"):
+            try:
+                os.remove(os.path.join(profiles_dir(), stem + ext))
+            except FileNotFoundError:
+                pass
+
+
+# --- Listing ----------------------------------------------------------------------
+def list_profiles() -> List[Dict]:
+    """Summaries of the stored profiles, newest first."""
+    profiles = []
+    for name in sorted(os.listdir(profiles_dir()), reverse=True):
+        if name.endswith(".json") and not name.endswith(".speedscope.json"):
+            with open(os.path.join(profiles_dir(), name)) as f:
+                profiles.append(json.load(f))
+    return profiles
+
+
+_FILE_NAME = re.compile(r"^[A-Za-z0-9-]+\.(speedscope\.json|pstats|tracemalloc|json)$")
+
+
+def profile_file(name: str) -> Optional[str]:
+    """Path of a stored profile file, None if `name` is not one."""
+    if not _FILE_NAME.match(name):
+        return None
+    path = os.path.join(profiles_dir(), name)
+    return path if os.path.isfile(path) else None
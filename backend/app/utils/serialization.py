@@ -0,0 +1,71 @@
+"""
+JSON serialization for API responses.
+
+`ORJSONResponse` is the application's default response class. List endpoints
+that return whole tables skip both ORM object construction and per-row
+Pydantic validation: they select plain columns named after the response
+schema's fields and `rows_response` hands the rows straight to orjson, which
+produces the same JSON the response model would (dates as DD/MM/YYYY).
+"""
+from datetime import date
+from functools import lru_cache
+from typing import Iterable, List, Type
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from app.schemas.schemas import format_date
+from app.utils import metrics
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value):
+    # Only reached for types orjson does not handle natively (or passes through)
+    if isinstance(value, date):
+        return format_date(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def columns_for(model, schema: Type[BaseModel]) -> tuple:
+    """Columns of `model` labelled with the field names of `schema` (e.g. Coche.id_coche -> "id_coche")."""
+    return tuple(getattr(model, name).label(name) for name in schema.model_fields)
+
+
+def encode_rows(rows: Iterable, keys: List[str]) -> bytes:
+    """Serialize Core rows to a JSON array of objects; datetimes are rendered as DD/MM/YYYY."""
+    objects = [dict(zip(keys, row)) for row in rows]
+    metrics.add_rows(len(objects))
+    return orjson.dumps(
+        objects,
+        default=_default,
+        option=orjson.OPT_PASSTHROUGH_DATETIME,
+    )
+
+
+def dumps_display(content) -> bytes:
+    """Like dumps(), but datetimes (also inside row tuples) are rendered as DD/MM/YYYY, as in encode_rows."""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def rows_response(result) -> Response:
+    """Response for the result of `db.execute(select(*columns_for(Model, SchemaOut)))`."""
+    keys = list(result.keys())
+    return Response(content=encode_rows(result, keys), media_type="application/json")
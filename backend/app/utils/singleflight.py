@@ -0,0 +1,132 @@
+"""
+Request coalescing ("single flight") for expensive identical reads.
+
+When several screens refresh the same view at once, each request would run
+the same query and serialize the same result. A Group lets the first caller
+for a key do the work while concurrent callers with the same key wait for it
+and share the result (typically the serialized response body). Optionally the
+result is kept for a short micro-TTL so requests arriving just after it
+finished reuse it too.
+
+Keys must capture everything the result depends on: the normalized request
+parameters and the version stamps (app/utils/versions.py) of the tables read,
+so a write never lets a stale result be shared.
+
+    combined = singleflight.group("query_combined_data", ttl=0.5)
+    body = combined.do(singleflight.make_key(filters, versions=...), compute)
+
+Coalescing is per worker process; stats() reports how many database round
+trips it saved.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# Default micro-TTL (seconds) for groups that do not set their own; 0 = share in-flight work only
+DEFAULT_TTL = float(os.getenv("COALESCE_TTL", "0"))
+
+
+def make_key(params: Optional[Dict[str, Any]] = None, **parts) -> Tuple:
+    """
+    Normalized, hashable key: parameters sorted by name with unset values
+    (None / "") dropped, so `?a=1&b=` and `?b=&a=1` coalesce.
+    """
+    items = {**(params or {}), **parts}
+    return tuple(sorted((name, value) for name, value in items.items() if value is not None and value != ""))
+
+
+class _Call:
+    __slots__ = ("done", "value", "error", "expires")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+        self.expires = 0.0
+
+
+class GroupStats:
+    __slots__ = ("requests", "executions", "coalesced", "ttl_hits", "errors")
+
+    def __init__(self):
+        self.requests = self.executions = self.coalesced = self.ttl_hits = self.errors = 0
+
+    def as_dict(self) -> Dict:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        # Share of requests that did not need their own database round trip
+        data["coalescing_ratio"] = round(1 - self.executions / self.requests, 4) if self.requests else None
+        return data
+
+
+class Group:
+    """Coalesces concurrent calls of `do()` that share a key."""
+
+    def __init__(self, name: str, ttl: Optional[float] = None):
+        self.name = name
+        self.ttl = DEFAULT_TTL if ttl is None else ttl
+        self.stats = GroupStats()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]):
+        """Result of `fn()`, shared with every concurrent (or micro-TTL) caller of the same key."""
+        with self._lock:
+            self.stats.requests += 1
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set() and call.expires <= time.monotonic():
+                del self._calls[key]
+                call = None
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.stats.executions += 1
+            else:
+                leader = False
+                if call.done.is_set():
+                    self.stats.ttl_hits += 1
+                else:
+                    self.stats.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.stats.errors += 1
+            raise
+        finally:
+            call.expires = time.monotonic() + self.ttl if call.error is None else 0.0
+            with self._lock:
+                if call.expires <= time.monotonic() and self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.value
+
+    def forget(self):
+        """Drop finished (micro-TTL) results; in-flight calls are left alone."""
+        with self._lock:
+            for key in [key for key, call in self._calls.items() if call.done.is_set()]:
+                del self._calls[key]
+
+
+_groups: Dict[str, Group] = {}
+_groups_lock = threading.Lock()
+
+
+def group(name: str, ttl: Optional[float] = None) -> Group:
+    """The process-wide Group called `name` (created on first use)."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = Group(name, ttl)
+        return _groups[name]
+
+
+def stats() -> Dict:
+    return {name: g.stats.as_dict() for name, g in _groups.items()}
@@ -0,0 +1,14 @@
+import os
+
+# Local directory for files the app maintains itself (indexes, caches, queues...).
+# On Azure App Service point SEPCAN_DATA_DIR at /home/... so it survives restarts.
+DATA_DIR = os.getenv(
+    "SEPCAN_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "var"),
+)
+
+def data_path(*parts: str) -> str:
+    """Path inside DATA_DIR; the parent directory is created if needed."""
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,51 @@
+"""
+Per-resource version stamps shared by every worker on the host.
+
+Each resource ("coches", "trabajos", ...) has a stamp file under
+SEPCAN_DATA_DIR/versions whose mtime (in nanoseconds) is the resource's
+version. Writers call bump() after committing; readers compare current()
+with the version they loaded, which costs a single stat() call.
+"""
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+
+from app.utils.storage import data_path
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _path(resource: str) -> str:
+    return data_path("versions", resource)
+
+
+def current(resource: str) -> int:
+    """Version of `resource`, 0 if it has never been bumped."""
+    try:
+        return os.stat(_path(resource)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def bump(resource: str) -> int:
+    """Mark `resource` as changed and return its new version (strictly increasing)."""
+    path = _path(resource)
+    with _lock:
+        version = max(time.time_ns(), current(resource) + 1)
+        with open(path, "a"):
+            pass
+        os.utime(path, ns=(version, version))
+    return current(resource)
+
+
+def safe_bump(resource: str):
+    """Write-path hook: a failed bump must never fail the request that triggered it."""
+    try:
+        bump(resource)
+    except Exception as e:
+        logger.warning("Version bump for '%s' failed: %s", resource, e)
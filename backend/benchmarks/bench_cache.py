@@ -0,0 +1,90 @@
+"""
+Exercise and time every cache backend in app/utils/cache.py.
+
+For each backend: set/get latency (us/op), hit/miss/eviction counters, and for
+the shared backends whether a write or clear made through one "worker"
+(a second backend instance) is seen by the other.
+
+The redis and broadcast-over-redis cases need a RESP server; start the
+stand-in first (or pass --redis-url for a real Redis):
+    python benchmarks/resp_server.py --port 6399 &
+
+Usage (from backend/):
+    python benchmarks/bench_cache.py [--ops 20000] [--redis-url redis://127.0.0.1:6399/0]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SEPCAN_DATA_DIR", tempfile.mkdtemp(prefix="sepcan-cache-bench-"))
+
+from app.utils.cache import (  # noqa: E402
+    BroadcastBackend, Cache, LRUBackend, RedisBackend, SQLiteBackend, MISS,
+)
+
+VALUE = {"severity": 3, "name": "Baja", "descripcion": "Estado del Coche: Sucio. Otros Comentarios: Ninguno"}
+
+
+def time_ops(ns, ops, max_entries):
+    start = time.perf_counter()
+    for i in range(ops):
+        ns.set(f"k{i}", VALUE, ttl=600)
+    set_us = (time.perf_counter() - start) / ops * 1e6
+    start = time.perf_counter()
+    for i in range(ops):
+        # The newest max_entries keys are still cached; older ones were evicted by the size bound
+        ns.get(f"k{ops - 1 - i % (2 * max_entries)}")
+    get_us = (time.perf_counter() - start) / ops * 1e6
+    return set_us, get_us
+
+
+def coherent(make_backend):
+    """Write/clear through worker A, read through worker B."""
+    a, b = make_backend(), make_backend()
+    b.get("coherence", "x")                      # B starts watching the namespace
+    a.set("coherence", "x", 1)
+    b.set("coherence", "x", 1)                  # B has its own (possibly local) copy
+    a.clear("coherence")
+    time.sleep(0.05)                            # pub/sub delivery
+    return b.get("coherence", "x") is MISS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=20_000)
+    parser.add_argument("--max-entries", type=int, default=5_000)
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:6399/0")
+    args = parser.parse_args()
+    data_dir = os.environ["SEPCAN_DATA_DIR"]
+
+    backends = {
+        "memory": lambda: LRUBackend(args.max_entries),
+        "sqlite": lambda: SQLiteBackend(os.path.join(data_dir, "bench.sqlite3"), args.max_entries),
+        "broadcast(stamps)": lambda: BroadcastBackend(None, args.max_entries),
+        "redis": lambda: RedisBackend(args.redis_url),
+        "broadcast(pubsub)": lambda: BroadcastBackend(args.redis_url, args.max_entries),
+    }
+    print(f"{'backend':<20}{'set us':>9}{'get us':>9}{'hits':>8}{'misses':>8}{'evict':>8}{'errors':>8}  cross-worker clear")
+    for name, make in backends.items():
+        try:
+            cache = Cache(make())
+        except Exception as e:
+            print(f"{name:<20} unavailable: {e}")
+            continue
+        ns = cache.namespace("bench")
+        ns.clear()
+        set_us, get_us = time_ops(ns, args.ops, args.max_entries)
+        stats = cache.stats()["namespaces"]["bench"]
+        if stats["errors"]:
+            print(f"{name:<20} failed ({stats['errors']} errors) - is the RESP server running at {args.redis_url}?")
+            continue
+        seen = "n/a (per worker)" if name == "memory" else ("ok" if coherent(make) else "STALE")
+        print(f"{name:<20}{set_us:>9.1f}{get_us:>9.1f}{stats['hits']:>8}{stats['misses']:>8}"
+              f"{stats['evictions']:>8}{stats['errors']:>8}  {seen}")
+
+
+if __name__ == "__main__":
+    main()
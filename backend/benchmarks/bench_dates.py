@@ -0,0 +1,91 @@
+"""
+Date codec throughput: app.utils.dates against the previous try/except parser.
+
+  parse    strings -> datetime, DD/MM/YYYY and YYYY-MM-DD inputs
+           (legacy pays a caught ValueError on every ISO string)
+  format   datetime -> DD/MM/YYYY
+  column   whole-column conversion (bulk imports / exports / analytics snapshot)
+
+Inputs mimic form data: N values drawn from ~2 years of distinct days.
+
+Usage (from backend/):
+    python benchmarks/bench_dates.py [--n 100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.utils import dates
+
+
+def legacy_parse_date(date_str):
+    if not date_str:
+        return None
+    try:
+        return datetime.strptime(date_str, "%d/%m/%Y")
+    except ValueError:
+        try:
+            return datetime.strptime(date_str, "%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"Date must be in DD/MM/YYYY or YYYY-MM-DD format, got {date_str}")
+
+
+def legacy_format_date(date_obj):
+    if not date_obj:
+        return None
+    return date_obj.strftime("%d/%m/%Y")
+
+
+def best_of(repeat, fn, setup=None):
+    best = float("inf")
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    days = [datetime(2024, 1, 1) + timedelta(days=rng.randrange(730)) for _ in range(args.n)]
+    dmy = [d.strftime("%d/%m/%Y") for d in days]
+    iso = [d.strftime("%Y-%m-%d") for d in days]
+    cold = dates._parse.cache_clear
+
+    cases = [
+        ("parse DD/MM/YYYY", lambda: [legacy_parse_date(s) for s in dmy], lambda: [dates.parse_date(s) for s in dmy], cold),
+        ("parse YYYY-MM-DD", lambda: [legacy_parse_date(s) for s in iso], lambda: [dates.parse_date(s) for s in iso], cold),
+        ("parse (warm cache)", lambda: [legacy_parse_date(s) for s in iso], lambda: [dates.parse_date(s) for s in iso], None),
+        ("format", lambda: [legacy_format_date(d) for d in days], lambda: [dates.format_date(d) for d in days], None),
+        ("column datetime->day", lambda: np.array([d.date() for d in days], dtype="datetime64[D]"), lambda: dates.to_day_array(days), None),
+        ("column str->day", lambda: np.array([legacy_parse_date(s).date() for s in dmy], dtype="datetime64[D]"), lambda: dates.to_day_array(dmy), cold),
+        ("column day->str", lambda: [legacy_format_date(d) for d in days], lambda: dates.format_date_column(days), None),
+    ]
+
+    assert [dates.parse_date(s) for s in dmy[:1000]] == [legacy_parse_date(s) for s in dmy[:1000]]
+    assert [dates.parse_date(s) for s in iso[:1000]] == [legacy_parse_date(s) for s in iso[:1000]]
+    assert dates.format_date_column(days[:1000]) == [legacy_format_date(d) for d in days[:1000]]
+
+    print(f"{'case':<24}{'legacy ns/val':>15}{'codec ns/val':>14}{'speedup':>9}")
+    for name, legacy, codec, setup in cases:
+        t_legacy = best_of(args.repeat, legacy)
+        t_codec = best_of(args.repeat, codec, setup)
+        print(f"{name:<24}{t_legacy / args.n * 1e9:>15.0f}{t_codec / args.n * 1e9:>14.0f}{t_legacy / t_codec:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
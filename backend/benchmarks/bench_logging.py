@@ -0,0 +1,134 @@
+"""
+Per-request logging overhead: the old setup against app/utils/log.py.
+
+A "request" replays the logging of POST /api/formulario-trabajo/ (2 INFO and
+~20 DEBUG events):
+
+- old: "sepcan_marina" at DEBUG with a synchronous StreamHandler, f-string
+  messages (formatted on the request thread whatever the level);
+- new: the queue handler from log.configure(), lazy %-style messages and the
+  payload as structured fields, at LOG_LEVEL=INFO, at DEBUG, and at DEBUG
+  sampled (LOG_DEBUG_SAMPLE_RATE=0.1).
+
+Output goes to a temporary file so the terminal does not skew the numbers.
+The figure is the time the request thread spends logging; for the queue
+cases the listener thread's formatting and writing happen in parallel (the
+queue is drained before the next case starts).
+
+Usage (from backend/):
+    python benchmarks/bench_logging.py [--requests 5000]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import log  # noqa: E402
+
+FORMULARIO = SimpleNamespace(
+    id_coche="1234ABC", dni_trabajador=42871236, id_trabajo=17, fecha="2024-05-02",
+    hora_final="14:30", horas_trabajadas=3.5, lugar_trabajo="Puerto de Las Palmas",
+    tiempo_llegada=1.25, otros="Sin incidencias",
+)
+
+
+def old_request(logger, f=FORMULARIO):
+    logger.info("Received FormularioTrabajo request")
+    logger.debug(f"id_coche: {f.id_coche}")
+    logger.debug(f"dni_trabajador: {f.dni_trabajador}")
+    logger.debug(f"id_trabajo: {f.id_trabajo}")
+    logger.debug(f"fecha: {f.fecha}")
+    logger.debug(f"hora_final: {f.hora_final}")
+    logger.debug(f"horas_trabajadas: {f.horas_trabajadas} (type: {type(f.horas_trabajadas)})")
+    logger.debug(f"lugar_trabajo: {f.lugar_trabajo}")
+    logger.debug(f"tiempo_llegada: {f.tiempo_llegada} (type: {type(f.tiempo_llegada)})")
+    logger.debug(f"otros: {f.otros}")
+    logger.debug(f"Checking if coche with id_coche={f.id_coche} exists")
+    logger.debug(f"Coche found: {f.id_coche}")
+    logger.debug(f"Checking if trabajador with dni={f.dni_trabajador} exists")
+    logger.debug(f"Trabajador found: {f.dni_trabajador}")
+    logger.debug(f"Checking if trabajo with id={f.id_trabajo} exists")
+    logger.debug(f"Trabajo found: {f.id_trabajo}")
+    logger.debug(f"No existing formulario found for trabajo id={f.id_trabajo}")
+    logger.debug(f"Parsed fecha: {f.fecha}")
+    logger.debug(f"FormularioTrabajo object created successfully")
+    logger.debug(f"Committing transaction")
+    logger.debug(f"FormularioTrabajo successfully added to database")
+    logger.info(f"FormularioTrabajo created successfully for trabajo_id={f.id_trabajo}")
+
+
+def new_request(logger, f=FORMULARIO):
+    logger.info("Received FormularioTrabajo request")
+    logger.debug("FormularioTrabajo payload", extra=log.fields(formulario=vars(f)))
+    logger.debug("Checking if coche with id_coche=%s exists", f.id_coche)
+    logger.debug("Coche found: %s", f.id_coche)
+    logger.debug("Checking if trabajador with dni=%s exists", f.dni_trabajador)
+    logger.debug("Trabajador found: %s", f.dni_trabajador)
+    logger.debug("Checking if trabajo with id=%s exists", f.id_trabajo)
+    logger.debug("Trabajo found: %s", f.id_trabajo)
+    logger.debug("No existing formulario found for trabajo id=%s", f.id_trabajo)
+    logger.debug("Parsed fecha: %s", f.fecha)
+    logger.debug("FormularioTrabajo object created successfully")
+    logger.debug("Committing transaction")
+    logger.debug("FormularioTrabajo successfully added to database")
+    logger.info("FormularioTrabajo created successfully for trabajo_id=%s", f.id_trabajo)
+
+
+def run(requests, body, logger, sample_rate=1.0):
+    start = time.perf_counter()
+    for i in range(requests):
+        rid = log.request_id.set(f"{i:016x}")
+        sampled = log._debug_sampled.set(sample_rate >= 1 or (i % round(1 / sample_rate)) == 0)
+        body(logger)
+        log._debug_sampled.reset(sampled)
+        log.request_id.reset(rid)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    out = tempfile.TemporaryFile("w")
+    results = []
+
+    # Old: logger-local synchronous handler, as formularios.py had it
+    old = logging.getLogger("bench_old")
+    old.propagate = False
+    old.setLevel(logging.DEBUG)
+    handler = logging.StreamHandler(out)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    old.addHandler(handler)
+    results.append(("old: sync StreamHandler, f-strings, DEBUG", run(args.requests, old_request, old)))
+    old.setLevel(logging.INFO)
+    results.append(("old: sync StreamHandler, f-strings, INFO", run(args.requests, old_request, old)))
+
+    # New: root queue handler + listener thread (importing app already configured it on stdout)
+    log.shutdown()
+    log.configure(stream=out)
+    new = logging.getLogger("bench_new")
+    for label, level, rate in (
+        ("new: queue, lazy + fields, INFO", logging.INFO, 1.0),
+        ("new: queue, lazy + fields, DEBUG", logging.DEBUG, 1.0),
+        ("new: queue, lazy + fields, DEBUG sampled 10%", logging.DEBUG, 0.1),
+    ):
+        logging.getLogger().setLevel(level)
+        results.append((label, run(args.requests, new_request, new, rate)))
+        log.shutdown()  # drain the queue so the listener's backlog does not leak into the next case
+        log.configure(stream=out)
+    log.shutdown()
+
+    print(f"{args.requests} requests, time on the request thread")
+    width = max(len(label) for label, _ in results)
+    for label, us in results:
+        print(f"  {label:<{width}}  {us:8.1f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Per-row serialization cost of the list endpoints.
+
+Compares, for TrabajoOut, IncidenciaOut and FormularioTrabajoOut:
+  generic   ORM objects -> model_validate -> jsonable_encoder -> json.dumps
+            (what FastAPI does for a response_model with its default JSONResponse)
+  compiled  ORM objects -> TypeAdapter(List[Model]) validate + dump_json (pydantic-core)
+  fastpath  Core row tuples -> app.utils.serialization.encode_rows (orjson)
+
+No database is needed; rows are synthesized in memory.
+
+Usage (from backend/):
+    python benchmarks/bench_serialization.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.models.models import Trabajo, Incidencia, FormularioTrabajo
+from app.schemas.schemas import TrabajoOut, IncidenciaOut, FormularioTrabajoOut
+from app.utils.serialization import encode_rows
+
+
+def _date(rng, i):
+    return datetime(2024, 1, 1) + timedelta(days=rng.randrange(540), minutes=i % 1440)
+
+
+def make_trabajos(rng, n):
+    return [Trabajo(id=i, cliente=f"Cliente {rng.randrange(300)}", fecha=_date(rng, i)) for i in range(n)]
+
+
+def make_incidencias(rng, n):
+    rows = []
+    for i in range(n):
+        fecha = _date(rng, i)
+        resuelta = rng.random() < 0.6
+        rows.append(Incidencia(
+            id_incidencia=i, id_coche=rng.randrange(40), gravedad=rng.choice(["Crítica", "Alta", "Media", "Baja"]),
+            fecha=fecha, resuelta=resuelta, descripcion="Estado del Coche: Sucio. Otros Comentarios: ruido en los frenos",
+            id_mecanico=rng.randrange(10_000_000, 99_999_999) if resuelta else None,
+            fecha_resolucion=fecha + timedelta(hours=rng.randrange(1, 72)) if resuelta else None,
+        ))
+    return rows
+
+
+def make_formularios_trabajo(rng, n):
+    return [FormularioTrabajo(
+        id_coche=rng.randrange(40), dni_trabajador=rng.randrange(10_000_000, 99_999_999), id_trabajo=i,
+        otros="Cliente satisfecho", fecha=_date(rng, i), hora_final="15:00",
+        horas_trabajadas=round(rng.uniform(1, 9), 2), lugar_trabajo=rng.choice(["Gáldar", "Telde", "Arucas"]),
+        tiempo_llegada=rng.randrange(10, 90),
+    ) for i in range(n)]
+
+
+def as_rows(objects, schema):
+    keys = list(schema.model_fields)
+    return keys, [tuple(getattr(o, k) for k in keys) for o in objects]
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    cases = [
+        (TrabajoOut, make_trabajos(rng, args.rows)),
+        (IncidenciaOut, make_incidencias(rng, args.rows)),
+        (FormularioTrabajoOut, make_formularios_trabajo(rng, args.rows)),
+    ]
+    print(f"{'schema':<22}{'path':<10}{'total ms':>10}{'us/row':>9}{'speedup':>9}")
+    for schema, objects in cases:
+        adapter = TypeAdapter(List[schema])
+        keys, rows = as_rows(objects, schema)
+
+        generic_bytes = json.dumps(jsonable_encoder([schema.model_validate(o) for o in objects])).encode()
+        assert json.loads(generic_bytes) == json.loads(encode_rows(rows, keys)), f"{schema.__name__}: outputs differ"
+
+        paths = {
+            "generic": lambda: json.dumps(jsonable_encoder([schema.model_validate(o) for o in objects])).encode(),
+            "compiled": lambda: adapter.dump_json(adapter.validate_python(objects, from_attributes=True)),
+            "fastpath": lambda: encode_rows(rows, keys),
+        }
+        baseline = None
+        for name, fn in paths.items():
+            elapsed = best_of(args.repeat, fn)
+            baseline = baseline or elapsed
+            print(f"{schema.__name__:<22}{name:<10}{elapsed * 1000:>10.1f}{elapsed / args.rows * 1e6:>9.2f}{baseline / elapsed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
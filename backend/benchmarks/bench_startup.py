@@ -0,0 +1,174 @@
+"""
+Worker startup cost: import time, boot time and idle memory, against targets.
+
+- imports: `python -X importtime -c "import app.main"` in a fresh process,
+  summarized as the slowest top-level packages (self time of all their
+  modules) and the cumulative time of each app module;
+- boot: time from launching `uvicorn main:app` to its first response, and
+  the worker's resident memory (VmRSS) once the lifespan handler and the first
+  background refresh have run (--settle seconds later), median of --runs;
+- lazy modules: pandas, openpyxl and google.genai must not be loaded at boot
+  (they load on the first Excel export / classification).
+
+The app runs against a small generated SQLite database. Results are written
+as JSON. The exit status is 1 if a target is missed, for CI.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py [--runs 5] [--max-boot 2.2] [--max-rss 120]
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Targets per worker (Linux, Python 3.11), with headroom over the measured values:
+# boot ~1.7 s / idle RSS ~90 MB once pandas and google.genai load lazily (previously ~2.8 s / ~138 MB)
+TARGET_BOOT_SECONDS = 2.2
+TARGET_IDLE_RSS_MB = 120
+LAZY_MODULES = ("pandas", "openpyxl", "google.genai")
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_profile(env) -> dict:
+    """-X importtime of `import app.main`: totals, slowest packages and app modules."""
+    script = ("import sys, app.main; "
+              f"print('LOADED:' + ','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", script], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    self_by_package = defaultdict(int)
+    app_modules = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = int(match[1]), int(match[2]), match[3], match[4]
+        self_by_package[module.split(".")[0]] += self_us
+        if module.startswith("app.") or module == "app":
+            app_modules[module] = cumulative_us
+        if len(indent) == 1:  # top-level import of the -c script
+            total += cumulative_us
+    marker = next(line for line in result.stdout.splitlines() if line.startswith("LOADED:"))
+    loaded = [m for m in marker[len("LOADED:"):].split(",") if m]
+    return {
+        "total_ms": round(total / 1000, 1),
+        "packages_ms": {name: round(us / 1000, 1) for name, us in
+                        sorted(self_by_package.items(), key=lambda item: -item[1])[:15]},
+        "app_modules_ms": {name: round(us / 1000, 1) for name, us in
+                           sorted(app_modules.items(), key=lambda item: -item[1])[:15]},
+        "lazy_modules_loaded": loaded,
+    }
+
+
+def _rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError("VmRSS not found")
+
+
+def boot_once(env, settle: float) -> dict:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                time.sleep(0.01)
+        boot = time.perf_counter() - started
+        time.sleep(settle)
+        # One process with a single worker: the server pid is the worker
+        return {"boot_s": boot, "idle_rss_mb": _rss_mb(server.pid) if os.path.exists("/proc") else None}
+    finally:
+        server.terminate()
+        server.wait(timeout=15)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds after the first response before reading RSS")
+    parser.add_argument("--max-boot", type=float, default=TARGET_BOOT_SECONDS, help="boot time target (s)")
+    parser.add_argument("--max-rss", type=float, default=TARGET_IDLE_RSS_MB, help="idle RSS target (MB)")
+    parser.add_argument("--out", help="results file (default benchmarks/results/startup-<timestamp>.json)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="sepcan-startup-")
+    database_url = f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+    env = dict(os.environ, DATABASE_URL=database_url, SEPCAN_DATA_DIR=os.path.join(workdir, "data"),
+               LOG_LEVEL="WARNING", GEMMA_KEY="unused")
+    subprocess.run([sys.executable, os.path.join("database_management", "generate_dataset.py"), "generate",
+                    "--workers", "20", "--cars", "10", "--years", "1", "--jobs-per-day", "20", "--processes", "1"],
+                   cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    imports = import_profile(env)
+    print(f"import app.main: {imports['total_ms']} ms")
+    print("  slowest packages (self time):")
+    for name, ms in imports["packages_ms"].items():
+        print(f"    {name:<28}{ms:>9.1f} ms")
+    print("  app modules (cumulative):")
+    for name, ms in imports["app_modules_ms"].items():
+        print(f"    {name:<40}{ms:>9.1f} ms")
+
+    runs = [boot_once(env, args.settle) for _ in range(args.runs)]
+    boot = statistics.median(r["boot_s"] for r in runs)
+    rss = statistics.median(r["idle_rss_mb"] for r in runs) if runs[0]["idle_rss_mb"] is not None else None
+    print(f"\nboot to first response: {boot:.2f} s (median of {args.runs}, target {args.max_boot} s)")
+    if rss is not None:
+        print(f"idle RSS per worker:    {rss:.1f} MB (target {args.max_rss} MB)")
+
+    failures = []
+    if boot > args.max_boot:
+        failures.append(f"boot time {boot:.2f} s > {args.max_boot} s")
+    if rss is not None and rss > args.max_rss:
+        failures.append(f"idle RSS {rss:.1f} MB > {args.max_rss} MB")
+    if imports["lazy_modules_loaded"]:
+        failures.append(f"loaded at boot: {', '.join(imports['lazy_modules_loaded'])}")
+
+    out = args.out or os.path.join(BACKEND_DIR, "benchmarks", "results", f"startup-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({
+            "meta": {"started": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                     "platform": platform.platform()},
+            "targets": {"boot_s": args.max_boot, "idle_rss_mb": args.max_rss},
+            "imports": imports,
+            "boot_s": round(boot, 3),
+            "idle_rss_mb": None if rss is None else round(rss, 1),
+            "runs": runs,
+            "failures": failures,
+        }, f, indent=1)
+    print(f"Results written to {out}")
+    if failures:
+        print("Targets missed: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare two result files of run_endpoints.py.
+
+Prints, per dataset size and scenario, p50/p95 latency, queries per request
+and peak memory of both runs with the relative change, and flags p95
+regressions above --threshold percent (exit status 1 if any, for CI).
+
+Usage (from backend/):
+    python benchmarks/compare_endpoints.py benchmarks/results/before.json benchmarks/results/after.json [--threshold 10]
+"""
+import argparse
+import json
+import sys
+
+
+def _change(old, new):
+    if not old:
+        return "    n/a"
+    return f"{(new - old) / old * 100:+6.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="p95 regression (%%) that is flagged")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"before: {before['meta'].get('commit')} ({before['meta']['started']})")
+    print(f"after:  {after['meta'].get('commit')} ({after['meta']['started']})")
+
+    regressions = []
+    for size in sorted(set(before["sizes"]) & set(after["sizes"]), key=int):
+        old_run, new_run = before["sizes"][size], after["sizes"][size]
+        print(f"\n{size} trabajos ({new_run['dialect']})")
+        print(f"  {'scenario':<30}{'p50 ms':>18}{'p95 ms':>26}{'queries':>12}{'peak KB':>20}")
+        for name in sorted(set(old_run["scenarios"]) & set(new_run["scenarios"])):
+            old, new = old_run["scenarios"][name], new_run["scenarios"][name]
+            p95_change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+            flag = " <-- regression" if p95_change > args.threshold else ""
+            if flag:
+                regressions.append((size, name, p95_change))
+            print(
+                f"  {name:<30} {old['p50_ms']:8.2f} {new['p50_ms']:8.2f}"
+                f" {old['p95_ms']:8.2f} {new['p95_ms']:8.2f} {_change(old['p95_ms'], new['p95_ms'])}"
+                f" {old['queries_per_request']:5.1f} {new['queries_per_request']:5.1f}"
+                f" {old['peak_kb']:9.1f} {new['peak_kb']:9.1f}{flag}"
+            )
+
+    if regressions:
+        print(f"\n{len(regressions)} scenario(s) with p95 more than {args.threshold:g}% slower")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Stand-in Gemini API for load tests: answers generateContent with a severity
+level ("0".."4") after a configurable delay, so form submissions pay a
+realistic LLM wait without calling Google.
+
+- latency: lognormal around --latency seconds (median), spread --jitter;
+- --error-rate: share of calls answered 503 (the app then rejects the form);
+- --max-concurrency: calls in flight beyond it get 429, like a rate limit.
+
+The severity is a deterministic function of the prompt, weighted towards
+"no incidence" like real car forms.
+
+Usage (from backend/):
+    python benchmarks/fake_gemini.py [--port 8790] [--latency 0.8] [--jitter 0.4]
+    GEMINI_BASE_URL=http://127.0.0.1:8790 uvicorn main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+from typing import Optional
+
+SEVERITY_WEIGHTS = (("4", 60), ("3", 20), ("2", 10), ("1", 7), ("0", 3))
+
+
+def severity(prompt: bytes) -> str:
+    point = int.from_bytes(hashlib.sha256(prompt).digest()[:4], "big") % 100
+    for level, weight in SEVERITY_WEIGHTS:
+        if point < weight:
+            return level
+        point -= weight
+    return "4"
+
+
+def _response(status: int, reason: str, body: bytes) -> bytes:
+    return (
+        f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode() + body
+
+
+class FakeGemini:
+    def __init__(self, latency: float, jitter: float, error_rate: float, max_concurrency: Optional[int]):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.calls = 0
+
+    def delay(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        return self.latency * math.exp(random.gauss(0, self.jitter))
+
+    async def answer(self, body: bytes) -> bytes:
+        self.calls += 1
+        if self.max_concurrency is not None and self.in_flight >= self.max_concurrency:
+            return _response(429, "Too Many Requests", b'{"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}')
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.delay())
+        finally:
+            self.in_flight -= 1
+        if random.random() < self.error_rate:
+            return _response(503, "Service Unavailable", b'{"error": {"code": 503, "status": "UNAVAILABLE"}}')
+        text = severity(body)
+        payload = {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": len(body) // 4, "candidatesTokenCount": 1},
+            "modelVersion": "gemini-2.0-flash",
+        }
+        return _response(200, "OK", json.dumps(payload).encode())
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:  # keep-alive: one request after another on the connection
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value.strip())
+                body = await reader.readexactly(length) if length else b""
+                request_line = head.split(b"\r\n", 1)[0]
+                if b":generateContent" in request_line:
+                    writer.write(await self.answer(body))
+                else:
+                    writer.write(_response(404, "Not Found", b'{"error": {"code": 404}}'))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host: str, port: int, fake: FakeGemini):
+    server = await asyncio.start_server(fake.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--latency", type=float, default=0.8, help="median seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.4, help="lognormal sigma of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, help="calls in flight before answering 429")
+    args = parser.parse_args()
+    fake = FakeGemini(args.latency, args.jitter, args.error_rate, args.max_concurrency)
+    print(f"Fake Gemini on http://{args.host}:{args.port} (median latency {args.latency} s)", flush=True)
+    try:
+        asyncio.run(serve(args.host, args.port, fake))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,612 @@
+"""
+Load test: open-loop replay of a working day against a real server.
+
+Starts uvicorn (--workers processes, each with a DB pool of --pool-size +
+--max-overflow connections) on a generated or restored database, plus the
+fake Gemini server of fake_gemini.py, and replays the day's traffic:
+
+- morning: every driver opens the car form (the three lists the page loads)
+  a few minutes before departing and submits /formulario-coche/ at the
+  departure time. Departure times follow generate_dataset.py, 7:00 to 10:00.
+- evening: drivers submit /formulario-trabajo/ when their job ends. End times
+  follow generate_dataset.py: departure + travel + hours worked. Meanwhile the
+  managers query /query/combined-data (with facets) from 16:00 and half of
+  them export it to Excel.
+- day: both.
+
+The simulated window is compressed into --duration seconds. Arrivals are
+open-loop: every request is sent at its scheduled time whether or not the
+earlier ones have finished, so a slow server builds up queues as it would in
+production. Latency is measured from the scheduled time, which avoids
+coordinated omission.
+
+The report has one row per endpoint with throughput, p50/p95/p99 latency and
+error rate, plus the time spent waiting for a pooled DB connection and for
+Gemini. The server-side figures come from /metrics, summed over the workers.
+
+--find-saturation repeats the run with more drivers and managers (--scale),
+doubling and then bisecting, until the form submissions miss --slo-ms at
+p95 or more than --max-error-rate of the requests fail. The last passing
+scale is the saturation point of that worker/pool configuration.
+
+By default the database is a temporary SQLite file with a year of history
+from generate_dataset.py. SQLite serializes writers, so point
+--database-url at Postgres (ITS TABLES ARE DROPPED, or replaced with
+--snapshot) to study pool sizing.
+
+Usage (from backend/):
+    python benchmarks/loadtest.py --profile morning --drivers 200 --duration 60
+    python benchmarks/loadtest.py --profile day --workers 2 --pool-size 5 --max-overflow 5 --find-saturation
+    python benchmarks/loadtest.py --database-url postgresql://user:pw@localhost/sepcan_load --snapshot bench-1m
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "database_management"))
+
+PROFILES = {  # simulated window, minutes since midnight
+    "morning": (6 * 60 + 50, 10 * 60),
+    "evening": (9 * 60, 20 * 60),
+    "day": (6 * 60 + 50, 20 * 60),
+}
+FORM_ENDPOINTS = ("POST /api/formulario-coche/", "POST /api/formulario-trabajo/")
+
+# Most car forms repeat a few texts (their classification is cached); the rest need Gemini
+COMMON_TEXTS = ["", "Todo en orden", "Ninguno", "Revisar niveles", "Limpiar antes de uso"]
+ISSUE_TEXTS = ["Luz interior no funciona", "Pequeño rasguño en la carrocería", "Ruido en los frenos",
+               "Testigo de aceite encendido", "Neumático con poca presión", "Aire acondicionado no enfría"]
+CAR_STATES = (("Limpio", 0.4), ("Sucio", 0.25), ("Muy Limpio", 0.2), ("Muy Sucio", 0.15))
+LOCATIONS = ["Las Palmas de Gran Canaria", "Telde", "Arucas", "Ingenio", "Agüimes", "Mogán", "Maspalomas"]
+
+
+class Arrival:
+    """One scheduled request."""
+    __slots__ = ("at", "endpoint", "method", "url", "kwargs")
+
+    def __init__(self, at: float, endpoint: str, method: str, url: str, kwargs: Dict):
+        self.at = at  # seconds since the start of the run
+        self.endpoint = endpoint
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+
+
+# --- Servers ------------------------------------------------------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[1:4]} exited with status {process.returncode}")
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f} s")
+
+
+def start_servers(args, database_url: str, workdir: str) -> Tuple[str, List[subprocess.Popen]]:
+    gemini_port, app_port = _free_port(), _free_port()
+    gemini = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "fake_gemini.py"), "--port", str(gemini_port),
+         "--latency", str(args.gemini_latency), "--jitter", str(args.gemini_jitter),
+         "--error-rate", str(args.gemini_error_rate)],
+        stdout=subprocess.DEVNULL,
+    )
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        DB_POOL_SIZE=str(args.pool_size),
+        DB_MAX_OVERFLOW=str(args.max_overflow),
+        DB_POOL_TIMEOUT=str(args.pool_timeout),
+        GEMMA_KEY="fake",
+        GEMINI_BASE_URL=f"http://127.0.0.1:{gemini_port}",
+        SEPCAN_DATA_DIR=os.path.join(workdir, "data"),
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+    )
+    # Server errors (pool timeouts...) go to a file; the report counts them
+    server_log = open(os.path.join(workdir, "server.log"), "wb")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=env, stdout=server_log, stderr=subprocess.STDOUT,
+    )
+    server_log.close()
+    print(f"Server log: {server_log.name}")
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        _wait_ready(base_url + "/", server)
+    except Exception:
+        stop_servers([gemini, server])
+        raise
+    return base_url, [gemini, server]
+
+
+def stop_servers(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# --- Database -------------------------------------------------------------------------
+def prepare_database(args, workdir: str) -> str:
+    """Fresh history (or a restored snapshot); returns the database URL."""
+    url = args.database_url or f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    os.environ["DATABASE_URL"] = url  # read by database_management/database.py on import
+    import generate_dataset
+
+    engine = generate_dataset.make_engine(url)
+    started = time.perf_counter()
+    if args.snapshot:
+        generate_dataset.restore(engine, args.snapshot)
+        print(f"Restored snapshot {args.snapshot} in {time.perf_counter() - started:.1f} s")
+    else:
+        today = date.today()
+        spec = generate_dataset.DatasetSpec(
+            workers=max(4, args.drivers), cars=max(3, args.drivers * 2 // 3),
+            start=today - timedelta(days=round(args.history_years * 365.25)), end=today - timedelta(days=1),
+            jobs_per_day=args.history_jobs_per_day, seed=args.seed,
+        )
+        generate_dataset.reset_tables(engine)
+        counts = generate_dataset.generate(engine, spec, processes=os.cpu_count() or 1)
+        print(f"Generated {spec.describe()}: {counts['trabajos']} trabajos "
+              f"in {time.perf_counter() - started:.1f} s")
+    engine.dispose()
+    return url
+
+
+async def _post_all(base_url: str, requests: List[Tuple[str, Dict]], concurrency: int = 16):
+    """Unmeasured setup requests; any failure aborts the run."""
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        async def post(url, payload):
+            async with semaphore:
+                response = await client.post(url, json=payload)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"setup POST {url} failed: {response.status_code} {response.text[:200]}")
+        await asyncio.gather(*(post(url, payload) for url, payload in requests))
+
+
+def plan_day(base_url: str, profile: str, drivers: int, rng: random.Random) -> List[Dict]:
+    """Create today's trabajos through the API (as the office does) and return the drivers' plans."""
+    trabajadores = httpx.get(base_url + "/api/trabajadores/", timeout=120).json()
+    coches = httpx.get(base_url + "/api/coches/", timeout=120).json()
+    trabajos = httpx.get(base_url + "/api/trabajos/", timeout=300).json()
+    next_id = max((t["id"] for t in trabajos), default=0) + 1
+    today = date.today().isoformat()
+
+    plans = []
+    for n in range(drivers):
+        worker = trabajadores[n % len(trabajadores)]
+        # Departure and end times as in generate_dataset.py
+        departure = rng.randint(7, 9) * 60 + rng.randint(0, 59) + rng.random()
+        finish = departure + rng.randint(10, 60) + round(rng.uniform(2, 8), 1) * 60
+        plans.append({
+            "id_trabajo": next_id + n, "dni": worker["dni"], "coche": coches[n % len(coches)]["id_coche"],
+            "departure": departure, "finish": finish, "fecha": today,
+        })
+
+    setup = [("/api/trabajos/", {"id": p["id_trabajo"], "cliente": f"Cliente Marino {rng.randint(1, 200)}",
+                                 "fecha": today}) for p in plans]
+    asyncio.run(_post_all(base_url, setup))
+    if profile == "evening":
+        # The morning already happened: car forms with a cached classification, so no Gemini waits
+        asyncio.run(_post_all(base_url, [("/api/formulario-coche/", _car_form(p, "", "Limpio")) for p in plans]))
+    return plans
+
+
+def _car_form(plan: Dict, otros: str, estado: str) -> Dict:
+    hours, minutes = divmod(int(plan["departure"]), 60)
+    return {"id_coche": plan["coche"], "dni_trabajador": plan["dni"], "id_trabajo": plan["id_trabajo"],
+            "fecha": plan["fecha"], "hora_partida": f"{hours}:{minutes:02d}", "estado_coche": estado, "otros": otros}
+
+
+# --- Schedule ---------------------------------------------------------------------------
+def build_schedule(profile: str, plans: List[Dict], managers: int, duration: float, dialect: str,
+                   rng: random.Random) -> List[Arrival]:
+    window_start, window_end = PROFILES[profile]
+    speed = (window_end - window_start) * 60 / duration  # simulated seconds per real second
+
+    def at(minute: float) -> float:
+        return max(0.0, (minute - window_start) * 60 / speed)
+
+    arrivals = []
+
+    def page_load(minute: float, available: str):
+        for url in (available, "/api/trabajadores/", "/api/coches/"):
+            arrivals.append(Arrival(at(minute), f"GET {url}", "GET", url, {}))
+
+    states, weights = zip(*CAR_STATES)
+    for plan in plans:
+        if profile in ("morning", "day"):
+            page_load(plan["departure"] - rng.uniform(2, 10), "/api/trabajos/available-for-coche-form")
+            otros = rng.choice(COMMON_TEXTS) if rng.random() < 0.7 else \
+                f"{rng.choice(ISSUE_TEXTS)} (trabajo {plan['id_trabajo']})"
+            arrivals.append(Arrival(at(plan["departure"]), f"POST /api/formulario-coche/", "POST",
+                                    "/api/formulario-coche/",
+                                    {"json": _car_form(plan, otros, rng.choices(states, weights)[0])}))
+        if profile in ("evening", "day") and plan["finish"] < window_end:
+            page_load(plan["finish"] - rng.uniform(2, 10), "/api/trabajos/available-for-trabajo-form")
+            hours, minutes = divmod(int(plan["finish"]), 60)
+            lugar = rng.choice(LOCATIONS)
+            arrivals.append(Arrival(at(plan["finish"]), "POST /api/formulario-trabajo/", "POST",
+                                    "/api/formulario-trabajo/", {"json": {
+                                        "id_coche": plan["coche"], "dni_trabajador": plan["dni"],
+                                        "id_trabajo": plan["id_trabajo"], "fecha": plan["fecha"],
+                                        "hora_final": f"{hours}:{minutes:02d}",
+                                        "horas_trabajadas": round((plan["finish"] - plan["departure"]) / 60, 1),
+                                        "lugar_trabajo": lugar, "tiempo_llegada": rng.randint(10, 60),
+                                        "otros": f"Trabajo completado en {lugar}.",
+                                    }}))
+
+    if profile in ("evening", "day"):
+        today = date.today()
+        for _ in range(managers):
+            minute = rng.uniform(16 * 60, window_end - 5)
+            if dialect == "sqlite":
+                # The date filter compares CAST(fecha AS DATE), which SQLite does not support
+                params = {"dni_trabajador": rng.choice(plans)["dni"]}
+            else:
+                params = {"fecha_inicio": (today - timedelta(days=30)).strftime("%d/%m/%Y"),
+                          "fecha_fin": today.strftime("%d/%m/%Y")}
+            arrivals.append(Arrival(at(minute), "GET /api/query/combined-data", "GET",
+                                    "/api/query/combined-data", {"params": params}))
+            arrivals.append(Arrival(at(minute), "GET /api/query/facets", "GET", "/api/query/facets",
+                                    {"params": {k: v for k, v in params.items() if k.startswith("fecha")}}))
+            if rng.random() < 0.5:
+                arrivals.append(Arrival(at(minute + 1), "GET /api/query/combined-data (excel)", "GET",
+                                        "/api/query/combined-data", {"params": {**params, "format": "excel"}}))
+
+    arrivals.sort(key=lambda a: a.at)
+    return arrivals
+
+
+# --- Running ------------------------------------------------------------------------------
+async def run_schedule(base_url: str, arrivals: List[Arrival], timeout: float, max_connections: int) -> List[Dict]:
+    """Fire every arrival at its time; returns one outcome per request."""
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    outcomes = []
+    loop = asyncio.get_running_loop()
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        start = loop.time()
+
+        async def fire(arrival: Arrival):
+            sent = loop.time()
+            status, error = None, None
+            try:
+                response = await client.request(arrival.method, arrival.url, **arrival.kwargs)
+                await response.aread()
+                status = response.status_code
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            done = loop.time()
+            outcomes.append({
+                "endpoint": arrival.endpoint, "status": status, "error": error,
+                "latency": done - start - arrival.at, "lag": sent - start - arrival.at, "done": done - start,
+            })
+
+        tasks = []
+        for arrival in arrivals:
+            delay = start + arrival.at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(fire(arrival)))
+        await asyncio.gather(*tasks)
+    return outcomes
+
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _parse_metrics(text: str) -> Dict[Tuple[str, Tuple], float]:
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            samples[(name, tuple(_LABEL.findall(labels or "")))] = float(value)
+    return samples
+
+
+def scrape(base_url: str, workers: int) -> Dict[int, Dict]:
+    """/metrics of every worker: new connections until each process has answered."""
+    per_process = {}
+    for _ in range(25 * workers):
+        try:
+            samples = _parse_metrics(httpx.get(base_url + "/metrics", headers={"Connection": "close"}, timeout=30).text)
+        except httpx.HTTPError:
+            continue
+        per_process[int(samples.get(("sepcan_process_id", ()), 0))] = samples
+        if len(per_process) >= workers:
+            break
+    return per_process
+
+
+def _metrics_delta(before: Dict[int, Dict], after: Dict[int, Dict]) -> Dict[Tuple[str, Tuple], float]:
+    total = defaultdict(float)
+    for pid, samples in after.items():
+        previous = before.get(pid, {})
+        for key, value in samples.items():
+            total[key] += value - previous.get(key, 0.0)
+    return total
+
+
+async def _sample_pool(base_url: str, stop: asyncio.Event, peaks: Dict[int, float]):
+    """Highest number of connections in use per worker, sampled every 0.5 s."""
+    async with httpx.AsyncClient(base_url=base_url, timeout=5) as client:
+        while not stop.is_set():
+            try:
+                samples = _parse_metrics((await client.get("/metrics", headers={"Connection": "close"})).text)
+                pid = int(samples.get(("sepcan_process_id", ()), 0))
+                in_use = samples.get(("sepcan_db_pool_checked_out", ()))
+                if in_use is not None:
+                    peaks[pid] = max(peaks.get(pid, 0), in_use)
+            except httpx.HTTPError:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def _run_with_sampling(base_url, arrivals, timeout, max_connections, peaks):
+    stop = asyncio.Event()
+    sampler = asyncio.ensure_future(_sample_pool(base_url, stop, peaks))
+    try:
+        return await run_schedule(base_url, arrivals, timeout, max_connections)
+    finally:
+        stop.set()
+        await sampler
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+def _histogram_quantile(delta: Dict, name: str, q: float) -> Optional[float]:
+    """Upper bound of the bucket holding quantile q (Prometheus histogram_quantile, without interpolation)."""
+    buckets = sorted(
+        (float("inf") if dict(labels)["le"] == "+Inf" else float(dict(labels)["le"]), value)
+        for (metric, labels), value in delta.items() if metric == name + "_bucket"
+    )
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    target = q * buckets[-1][1]
+    return next(bound for bound, count in buckets if count >= target)
+
+
+def summarize(outcomes: List[Dict], arrivals: List[Arrival], delta: Dict, peaks: Dict[int, float],
+              duration: float) -> Dict:
+    elapsed = max([o["done"] for o in outcomes] + [duration])
+    per_second = defaultdict(int)
+    for arrival in arrivals:
+        per_second[int(arrival.at)] += 1
+
+    server = defaultdict(lambda: defaultdict(float))
+    for (name, labels), value in delta.items():
+        labels = dict(labels)
+        if "route" in labels:
+            server[(labels["method"], labels["route"])][name] += value
+
+    endpoints = {}
+    by_endpoint = defaultdict(list)
+    for outcome in outcomes:
+        by_endpoint[outcome["endpoint"]].append(outcome)
+    for endpoint, items in sorted(by_endpoint.items()):
+        latencies = [o["latency"] * 1000 for o in items]
+        failed = [o for o in items if o["error"] or o["status"] >= 400]
+        method, path = endpoint.split(" ")[:2]
+        route = server.get((method, path), {})
+        served = route.get("sepcan_http_request_duration_seconds_count", 0)
+        endpoints[endpoint] = {
+            "requests": len(items),
+            "throughput_rps": round(len(items) / elapsed, 2),
+            "p50_ms": round(_percentile(latencies, 50), 1),
+            "p95_ms": round(_percentile(latencies, 95), 1),
+            "p99_ms": round(_percentile(latencies, 99), 1),
+            "max_ms": round(max(latencies), 1),
+            "error_rate": round(len(failed) / len(items), 4),
+            "errors": dict(sorted(_count(o["error"] or str(o["status"]) for o in failed).items())),
+            # Server side (per route, so the Excel export shares the JSON export's figures)
+            "pool_wait_ms": round(route.get("sepcan_db_pool_wait_seconds_total", 0) / served * 1000, 2) if served else None,
+            "llm_ms": round(route.get("sepcan_llm_seconds_total", 0) / served * 1000, 1) if served else None,
+        }
+
+    failed = sum(1 for o in outcomes if o["error"] or o["status"] >= 400)
+    wait_p95 = _histogram_quantile(delta, "sepcan_db_pool_checkout_wait_seconds", 0.95)
+    checkouts = delta.get(("sepcan_db_pool_checkout_wait_seconds_count", ()), 0)
+    return {
+        "requests": len(outcomes),
+        "offered_rps": round(len(arrivals) / duration, 2),
+        "peak_offered_rps": max(per_second.values()) if per_second else 0,
+        "throughput_rps": round(len(outcomes) / elapsed, 2),
+        "elapsed_s": round(elapsed, 1),
+        "error_rate": round(failed / len(outcomes), 4) if outcomes else 0.0,
+        "client_lag_p95_ms": round(_percentile([o["lag"] * 1000 for o in outcomes], 95), 1) if outcomes else 0.0,
+        "pool": {
+            "checkouts": int(checkouts),
+            "wait_mean_ms": round(delta.get(("sepcan_db_pool_checkout_wait_seconds_sum", ()), 0) / checkouts * 1000, 2)
+            if checkouts else None,
+            "wait_p95_le_ms": None if wait_p95 is None else wait_p95 * 1000,
+            "timeouts": int(delta.get(("sepcan_db_pool_timeouts_total", ()), 0)),
+            "peak_checked_out": {str(pid): int(n) for pid, n in sorted(peaks.items())},
+        },
+        "endpoints": endpoints,
+    }
+
+
+def _count(values) -> Dict[str, int]:
+    counts = defaultdict(int)
+    for value in values:
+        counts[value] += 1
+    return counts
+
+
+def run_step(args, base_url: str, dialect: str, scale: float, rng: random.Random) -> Dict:
+    drivers = max(1, round(args.drivers * scale))
+    managers = max(1, round(args.managers * scale))
+    plans = plan_day(base_url, args.profile, drivers, rng)
+    arrivals = build_schedule(args.profile, plans, managers, args.duration, dialect, rng)
+    before = scrape(base_url, args.workers)
+    peaks: Dict[int, float] = {}
+    outcomes = asyncio.run(_run_with_sampling(base_url, arrivals, args.timeout, args.max_connections, peaks))
+    delta = _metrics_delta(before, scrape(base_url, args.workers))
+    result = summarize(outcomes, arrivals, delta, peaks, args.duration)
+    result.update(scale=scale, drivers=drivers, managers=managers)
+    return result
+
+
+def passes(result: Dict, args) -> bool:
+    forms = [result["endpoints"][e]["p95_ms"] for e in FORM_ENDPOINTS if e in result["endpoints"]]
+    return result["error_rate"] <= args.max_error_rate and all(p95 <= args.slo_ms for p95 in forms)
+
+
+def print_step(result: Dict):
+    pool = result["pool"]
+    print(f"\nscale {result['scale']:g}: {result['drivers']} drivers, {result['managers']} managers, "
+          f"{result['requests']} requests, offered {result['offered_rps']} req/s (peak {result['peak_offered_rps']}/s), "
+          f"served {result['throughput_rps']} req/s, errors {result['error_rate']:.2%}")
+    print(f"  pool: {pool['checkouts']} checkouts, mean wait {pool['wait_mean_ms']} ms, p95 <= {pool['wait_p95_le_ms']} ms, "
+          f"{pool['timeouts']} timeouts, peak in use {pool['peak_checked_out']}; client lag p95 {result['client_lag_p95_ms']} ms")
+    if result["client_lag_p95_ms"] > 100:
+        print("  warning: the load generator is falling behind its schedule; latencies include its own delay")
+    print(f"  {'endpoint':<42}{'req':>6}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'err':>8}{'pool ms':>9}{'llm ms':>8}")
+    for endpoint, e in result["endpoints"].items():
+        print(f"  {endpoint:<42}{e['requests']:>6}{e['throughput_rps']:>8}{e['p50_ms']:>9}{e['p95_ms']:>9}"
+              f"{e['p99_ms']:>9}{e['error_rate']:>8.1%}{e['pool_wait_ms'] if e['pool_wait_ms'] is not None else '-':>9}"
+              f"{e['llm_ms'] if e['llm_ms'] is not None else '-':>8}")
+
+
+def find_saturation(args, base_url: str, dialect: str, rng: random.Random) -> Tuple[List[Dict], Optional[Dict]]:
+    steps, good, bad = [], None, None
+    scale = args.scale
+    while bad is None and scale <= args.max_scale:
+        result = run_step(args, base_url, dialect, scale, rng)
+        result["passed"] = passes(result, args)
+        steps.append(result)
+        print_step(result)
+        if result["passed"]:
+            good, scale = result, scale * 2
+        else:
+            bad = result
+    for _ in range(args.bisect if good and bad else 0):
+        scale = (good["scale"] + bad["scale"]) / 2
+        result = run_step(args, base_url, dialect, scale, rng)
+        result["passed"] = passes(result, args)
+        steps.append(result)
+        print_step(result)
+        if result["passed"]:
+            good = result
+        else:
+            bad = result
+    return steps, good
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="morning")
+    parser.add_argument("--drivers", type=int, default=100, help="drivers (trabajos) in the day at scale 1")
+    parser.add_argument("--managers", type=int, default=5, help="managers querying/exporting at scale 1")
+    parser.add_argument("--duration", type=float, default=60, help="real seconds the simulated window is compressed into")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier of drivers and managers")
+    parser.add_argument("--seed", type=int, default=1)
+    # Server configuration
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--pool-size", type=int, default=5, help="DB_POOL_SIZE per worker")
+    parser.add_argument("--max-overflow", type=int, default=10, help="DB_MAX_OVERFLOW per worker")
+    parser.add_argument("--pool-timeout", type=float, default=30, help="DB_POOL_TIMEOUT seconds")
+    parser.add_argument("--gemini-latency", type=float, default=0.8, help="median seconds of the fake Gemini")
+    parser.add_argument("--gemini-jitter", type=float, default=0.4)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    # Database
+    parser.add_argument("--database-url", help="database to use instead of a temporary SQLite file (it is wiped)")
+    parser.add_argument("--snapshot", help="restore this generate_dataset.py snapshot instead of generating history")
+    parser.add_argument("--history-years", type=float, default=1.0)
+    parser.add_argument("--history-jobs-per-day", type=float, default=50.0)
+    # Client
+    parser.add_argument("--timeout", type=float, default=60, help="client timeout per request (seconds)")
+    parser.add_argument("--max-connections", type=int, default=500)
+    # Saturation search
+    parser.add_argument("--find-saturation", action="store_true")
+    parser.add_argument("--slo-ms", type=float, default=3000, help="p95 of the form submissions that must hold")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-scale", type=float, default=64)
+    parser.add_argument("--bisect", type=int, default=3, help="bisection steps after the first failing scale")
+    parser.add_argument("--out", help="results file (default benchmarks/results/loadtest-<timestamp>.json)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="sepcan-load-")
+    database_url = prepare_database(args, workdir)
+    dialect = database_url.split(":", 1)[0].split("+", 1)[0]
+    rng = random.Random(args.seed)
+    base_url, processes = start_servers(args, database_url, workdir)
+    try:
+        if args.find_saturation:
+            steps, good = find_saturation(args, base_url, dialect, rng)
+            if good is None:
+                print(f"\nNot even scale {args.scale:g} meets the SLO")
+            elif good is steps[-1] and all(s["passed"] for s in steps):
+                print(f"\nNo saturation up to scale {good['scale']:g} "
+                      f"({good['peak_offered_rps']} req/s at peak); raise --max-scale")
+            else:
+                print(f"\nSaturation point: scale {good['scale']:g} ({good['drivers']} drivers, "
+                      f"peak {good['peak_offered_rps']} req/s, {good['throughput_rps']} req/s on average)")
+        else:
+            steps = [run_step(args, base_url, dialect, args.scale, rng)]
+            print_step(steps[0])
+    finally:
+        stop_servers(processes)
+
+    out = args.out or os.path.join(BACKEND_DIR, "benchmarks", "results", f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "database_url")}
+    with open(out, "w") as f:
+        json.dump({
+            "meta": {"started": datetime.now().isoformat(timespec="seconds"), "commit": _git_commit(),
+                     "python": platform.python_version(), "platform": platform.platform(), "dialect": dialect},
+            "config": config,
+            "steps": steps,
+        }, f, indent=1)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Stand-in Redis server (RESP2 over TCP) for exercising the redis and broadcast
+cache backends without installing Redis.
+
+Supports PING, AUTH, SELECT, GET, SET (EX/PX/NX), DEL, EXISTS, INCR, SCAN
+(MATCH/COUNT), FLUSHDB, DBSIZE, PUBLISH and SUBSCRIBE. Single database, data in
+memory, expiry checked on access.
+
+Usage (from backend/):
+    python benchmarks/resp_server.py [--port 6399]
+    CACHE_BACKEND=redis CACHE_URL=redis://127.0.0.1:6399/0 uvicorn main:app
+"""
+import argparse
+import asyncio
+import fnmatch
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class Raw(bytes):
+    """Reply that is already RESP-encoded."""
+
+
+def encode(value) -> bytes:
+    if isinstance(value, Raw):
+        return value
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, Exception):
+        return b"-ERR %s\r\n" % str(value).encode()
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(v) for v in value)
+    raise TypeError(type(value))
+
+
+class Store:
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.subscribers: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args: List[bytes], writer: asyncio.StreamWriter):
+        command = args[0].upper()
+        if command == b"PING":
+            return "PONG"
+        if command in (b"AUTH", b"SELECT"):
+            return "OK"
+        if command == b"GET":
+            return self._get(args[1])
+        if command == b"SET":
+            expires_at = None
+            options = [a.upper() for a in args[3:]]
+            if b"PX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index(b"EX") + 1])
+            if b"NX" in options and self._get(args[1]) is not None:
+                return None
+            self.data[args[1]] = (args[2], expires_at)
+            return "OK"
+        if command == b"DEL":
+            return sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+        if command == b"EXISTS":
+            return sum(1 for key in args[1:] if self._get(key) is not None)
+        if command == b"INCR":
+            value = int(self._get(args[1]) or 0) + 1
+            self.data[args[1]] = (str(value).encode(), None)
+            return value
+        if command == b"SCAN":
+            pattern = b"*"
+            for i, arg in enumerate(args):
+                if arg.upper() == b"MATCH":
+                    pattern = args[i + 1]
+            keys = [k for k in list(self.data) if fnmatch.fnmatchcase(k.decode(), pattern.decode())]
+            return [b"0", keys]
+        if command == b"FLUSHDB":
+            self.data.clear()
+            return "OK"
+        if command == b"DBSIZE":
+            return len(self.data)
+        if command == b"PUBLISH":
+            receivers = self.subscribers.get(args[1], set())
+            for subscriber in list(receivers):
+                subscriber.write(encode([b"message", args[1], args[2]]))
+            return len(receivers)
+        if command == b"SUBSCRIBE":
+            replies = []
+            for i, channel in enumerate(args[1:], start=1):
+                self.subscribers.setdefault(channel, set()).add(writer)
+                replies.append(encode([b"subscribe", channel, i]))
+            return Raw(b"".join(replies))
+        return ValueError(f"unknown command '{command.decode()}'")
+
+
+async def read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()  # inline command (e.g. from telnet)
+    args = []
+    for _ in range(int(line[1:-2])):
+        length = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+def serve(store: Store):
+    async def handle(reader, writer):
+        try:
+            while True:
+                args = await read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                writer.write(encode(store.execute(args, writer)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for subscribers in store.subscribers.values():
+                subscribers.discard(writer)
+            writer.close()
+    return handle
+
+
+async def main(host: str, port: int):
+    server = await asyncio.start_server(serve(Store()), host, port)
+    print(f"RESP stand-in listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port))
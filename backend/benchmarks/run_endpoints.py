@@ -0,0 +1,426 @@
+"""
+Endpoint benchmark suite: every router, in-process, against a local database.
+
+For each dataset size a fresh database is created and seeded (size = number
+of trabajos; workers, cars, forms and incidences scale with it) and every
+scenario below is run through the ASGI app with TestClient:
+
+- p50/p95/mean latency over --repeat requests (after 2 warm-up requests);
+- SQL statements per request (cursor executions on the app's engine);
+- peak Python memory allocated while serving one request (tracemalloc, in a
+  separate pass so it does not distort the timings);
+- query budgets: every timed request runs inside diagnostics.query_budget(),
+  so an endpoint that runs more statements than its @declare_query_budget is
+  reported, and the run exits with status 1 once the results are written;
+- concurrency: CONCURRENT_BATCHES POST /api/batch/ requests sent at once
+  (httpx over the ASGI app, as concurrent clients would), followed by an
+  unrelated GET. If they do not all answer within CONCURRENT_TIMEOUT seconds
+  the worker is wedged (e.g. threadpool starvation) and the run exits with
+  status 1 too.
+
+Writes cover form creation (determine_incidencia is stubbed, no Gemini
+calls), incidence resolution and the create/update endpoints. Each size runs
+in its own process, so caches, indexes and memory start clean.
+
+By default each size gets a temporary SQLite file. --database-url points the
+suite at another database (e.g. a local Postgres); ITS TABLES ARE DROPPED AND
+RECREATED for every size.
+
+Results are written as JSON; compare two runs with compare_endpoints.py.
+
+Usage (from backend/):
+    python benchmarks/run_endpoints.py [--sizes 1000,10000,50000] [--repeat 30]
+        [--only coches,query] [--database-url postgresql://user:pw@localhost/sepcan_bench]
+        [--out benchmarks/results/<name>.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WARMUP = 2
+SEED = 20250101
+# More than the 40 threads of the threadpool, so a batch that parks one per sub-request shows up
+CONCURRENT_BATCHES = 30
+CONCURRENT_TIMEOUT = 60
+
+LOCATIONS = ["Las Palmas de Gran Canaria", "Telde", "Arucas", "Ingenio", "Agüimes", "Gáldar", "Mogán", "Maspalomas"]
+CAR_STATES = ["Limpio", "Sucio", "Muy Limpio", "Muy Sucio"]
+GRAVEDADES = ["Crítica", "Alta", "Media", "Baja"]
+ISSUES = [
+    "Frenos no responden correctamente, peligro inmediato.",
+    "Fuga de líquido de frenos detectada.",
+    "Desgaste irregular en los neumáticos, requiere alineación.",
+    "Luces principales no funcionan, peligroso para conducción nocturna.",
+    "Luz interior no funciona.",
+    "Pequeño rasguño en la carrocería.",
+]
+
+
+# --- Dataset ----------------------------------------------------------------------
+def seed(engine, size: int, reserve: int) -> dict:
+    """
+    Bulk-insert a deterministic dataset with `size` trabajos (90% with both
+    forms) plus `reserve` trabajos without forms and `reserve` unresolved
+    incidences for the write scenarios. Returns the ids the scenarios use.
+    """
+    from sqlalchemy import insert
+    from sqlalchemy.orm import Session
+    from app.models.models import Coche, FormularioCoche, FormularioTrabajo, Incidencia, Trabajador, Trabajo
+
+    rng = random.Random(SEED)
+    n_workers = max(4, size // 200)
+    n_cars = max(3, size // 300)
+    dnis = [40000000 + i for i in range(n_workers)]
+    cars = list(range(1, n_cars + 1))
+    start = datetime(2025, 1, 1)
+    days = max(1, size // 20)
+
+    trabajadores = [
+        {"dni": dni, "nombre": f"Nombre{i}", "apellido": f"Apellido{i}",
+         "fecha_nacimiento": datetime(1980 + i % 20, 1 + i % 12, 1), "fecha_empleo": datetime(2015 + i % 8, 1, 1)}
+        for i, dni in enumerate(dnis)
+    ]
+    coches = [{"id_coche": c, "placa": 10000 + c} for c in cars]
+    trabajos, forms_coche, forms_trabajo, incidencias = [], [], [], []
+    for i in range(1, size + reserve + 1):
+        fecha = start + timedelta(days=(i * days) // (size + reserve))
+        trabajos.append({"id": i, "cliente": f"Cliente Marino {i % 97}", "fecha": fecha})
+        if i > size or rng.random() >= 0.9:
+            continue
+        coche, dni = rng.choice(cars), rng.choice(dnis)
+        forms_coche.append({
+            "id_coche": coche, "dni_trabajador": dni, "id_trabajo": i, "fecha": fecha,
+            "otros": rng.choice(["Todo en orden", "Revisar niveles", "Comprobar presión neumáticos", ""]),
+            "hora_partida": f"{rng.randint(7, 9)}:{rng.randint(0, 59):02d}", "estado_coche": rng.choice(CAR_STATES),
+        })
+        forms_trabajo.append({
+            "id_coche": coche, "dni_trabajador": dni, "id_trabajo": i, "fecha": fecha,
+            "otros": rng.choice(["Cliente satisfecho", "Se requiere seguimiento", ""]),
+            "hora_final": f"{rng.randint(12, 19)}:{rng.randint(0, 59):02d}",
+            "horas_trabajadas": round(rng.uniform(2, 8), 1), "lugar_trabajo": rng.choice(LOCATIONS),
+            "tiempo_llegada": rng.randint(10, 60),
+        })
+    for i in range(1, size // 10 + reserve + 1):
+        resolved = i <= size // 10 and rng.random() < 0.5
+        fecha = start + timedelta(days=rng.randrange(days))
+        incidencias.append({
+            "id_incidencia": i, "id_coche": rng.choice(cars), "gravedad": rng.choice(GRAVEDADES), "fecha": fecha,
+            "resuelta": resolved, "descripcion": rng.choice(ISSUES),
+            "id_mecanico": rng.choice(dnis) if resolved else None,
+            "fecha_resolucion": fecha + timedelta(days=rng.randint(1, 14)) if resolved else None,
+        })
+
+    # ORM bulk INSERT (executemany in batches), keyed by attribute names
+    with Session(engine) as session:
+        for model, rows in (
+            (Trabajador, trabajadores), (Coche, coches), (Trabajo, trabajos),
+            (FormularioCoche, forms_coche), (FormularioTrabajo, forms_trabajo), (Incidencia, incidencias),
+        ):
+            for offset in range(0, len(rows), 5000):
+                session.execute(insert(model), rows[offset:offset + 5000])
+        session.commit()
+
+    return {
+        "dni": dnis[0],
+        "coche": cars[0],
+        "trabajo": 1,
+        "incidencia": 1,
+        "open_trabajos": list(range(size + 1, size + reserve + 1)),
+        "open_incidencias": [row["id_incidencia"] for row in incidencias if not row["resuelta"]][-reserve:],
+        "new_id": size + reserve + 1000,
+        "counts": {
+            "trabajadores": len(trabajadores), "coches": len(coches), "trabajos": len(trabajos),
+            "formularios_coche": len(forms_coche), "formularios_trabajo": len(forms_trabajo),
+            "incidencias": len(incidencias),
+        },
+    }
+
+
+# --- Scenarios --------------------------------------------------------------------
+def scenarios(d: dict, admin_token: str):
+    """(name, method, request(i) -> (url, kwargs), slow). `i` is the request number, warm-ups included."""
+    def get(url, **kwargs):
+        return lambda i: (url, kwargs)
+
+    forma_coche = lambda i: ("/api/formulario-coche/", {"json": {
+        "id_coche": d["coche"], "dni_trabajador": d["dni"], "id_trabajo": d["open_trabajos"][i],
+        "fecha": "2025-06-02", "hora_partida": "7:45", "estado_coche": "Sucio", "otros": "Revisar frenos",
+    }})
+    forma_trabajo = lambda i: ("/api/formulario-trabajo/", {"json": {
+        "id_coche": d["coche"], "dni_trabajador": d["dni"], "id_trabajo": d["open_trabajos"][i],
+        "fecha": "2025-06-02", "hora_final": "15:30", "horas_trabajadas": 6.5, "lugar_trabajo": "Telde",
+        "tiempo_llegada": 25, "otros": "Cliente satisfecho",
+    }})
+    check_form = lambda i: ("/api/incidencias/check-and-save-from-form", {"json": {
+        "id_coche": d["coche"], "dni_trabajador": d["dni"], "id_trabajo": d["trabajo"],
+        "fecha": "2025-06-02", "hora_partida": "8:10", "estado_coche": "Muy Sucio", "otros": "Luz interior no funciona",
+    }})
+    new = d["new_id"]
+    return [
+        ("coches.list", "GET", get("/api/coches/"), False),
+        ("coches.get", "GET", get(f"/api/coches/{d['coche']}"), False),
+        ("coches.suggest", "GET", get("/api/coches/suggest", params={"q": "1"}), False),
+        ("coches.create", "POST", lambda i: ("/api/coches/", {"json": {"id_coche": new + i, "placa": 800000 + i}}), False),
+        ("coches.update", "PUT", lambda i: (f"/api/coches/{d['coche']}", {"json": {"placa": 900000 + i}}), False),
+        ("trabajadores.list", "GET", get("/api/trabajadores/"), False),
+        ("trabajadores.get", "GET", get(f"/api/trabajadores/{d['dni']}"), False),
+        ("trabajadores.suggest", "GET", get("/api/trabajadores/suggest", params={"q": "Nombre1"}), False),
+        ("trabajadores.create", "POST", lambda i: ("/api/trabajadores/", {"json": {
+            "dni": 90000000 + i, "nombre": "Bench", "apellido": f"Apellido{i}",
+            "fecha_nacimiento": "01/01/1990", "fecha_empleo": "2022-03-01"}}), False),
+        ("trabajadores.update", "PUT", lambda i: (f"/api/trabajadores/{d['dni']}", {"json": {"nombre": f"Nombre {i}"}}), False),
+        ("trabajos.list", "GET", get("/api/trabajos/"), False),
+        ("trabajos.get", "GET", get(f"/api/trabajos/{d['trabajo']}"), False),
+        ("trabajos.suggest", "GET", get("/api/trabajos/suggest", params={"q": "Cliente Marino 1"}), False),
+        ("trabajos.available_coche", "GET", get("/api/trabajos/available-for-coche-form"), False),
+        ("trabajos.available_trabajo", "GET", get("/api/trabajos/available-for-trabajo-form"), False),
+        ("trabajos.create", "POST", lambda i: ("/api/trabajos/", {"json": {
+            "id": new + i, "cliente": "Cliente Bench", "fecha": "2025-06-02"}}), False),
+        ("trabajos.update", "PUT", lambda i: (f"/api/trabajos/{d['trabajo']}", {"json": {"cliente": f"Cliente {i}"}}), False),
+        ("formularios.list_coche", "GET", get("/api/formularios-coche/"), False),
+        ("formularios.list_trabajo", "GET", get("/api/formularios-trabajo/"), False),
+        ("formularios.create_coche", "POST", forma_coche, False),
+        ("formularios.create_trabajo", "POST", forma_trabajo, False),
+        ("incidencias.list", "GET", get("/api/incidencias/"), False),
+        ("incidencias.get", "GET", get(f"/api/incidencias/{d['incidencia']}"), False),
+        ("incidencias.similar_text", "GET", get("/api/incidencias/similar", params={"texto": "frenos no responden"}), False),
+        ("incidencias.similar", "GET", get(f"/api/incidencias/{d['incidencia']}/similar"), False),
+        ("incidencias.check_form", "POST", check_form, False),
+        ("incidencias.resolve", "PUT", lambda i: (
+            f"/api/incidencias/{d['open_incidencias'][i]}/resolve", {"params": {"id_mecanico": d["dni"]}}), False),
+        ("query.combined_json", "GET", get("/api/query/combined-data"), False),
+        ("query.combined_json_worker", "GET", get("/api/query/combined-data", params={"dni_trabajador": d["dni"]}), False),
+        ("query.combined_excel", "GET", get("/api/query/combined-data", params={"format": "excel"}), True),
+        ("query.facets", "GET", get("/api/query/facets"), False),
+        ("statistics.aggregate", "GET", get("/api/statistics/aggregate", params={
+            "group_by": "lugar_trabajo,mes", "measures": "count,sum:horas_trabajadas,avg:tiempo_llegada"}), False),
+        ("search.query", "GET", get("/api/search/", params={"q": "frenos"}), False),
+        ("admin.cache", "GET", get("/api/admin/cache", headers={"X-Admin-Token": admin_token}), False),
+        ("metrics", "GET", get("/metrics"), False),
+    ]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_scenario(client, counter, method, request, repeat):
+    from app.utils import diagnostics
+
+    latencies, queries, statuses, over_budget = [], [], {}, []
+    for i in range(WARMUP + repeat):
+        url, kwargs = request(i)
+        before = counter[0]
+        start = time.perf_counter()
+        try:
+            with diagnostics.query_budget():
+                response = client.request(method, url, **kwargs)
+                elapsed = time.perf_counter() - start
+        except diagnostics.QueryBudgetExceeded as e:
+            over_budget.append(str(e).splitlines()[0])
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if i >= WARMUP:
+            latencies.append(elapsed * 1000)
+            queries.append(counter[0] - before)
+
+    # Memory pass: one more request, traced
+    url, kwargs = request(WARMUP + repeat)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    response = client.request(method, url, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "queries_per_request": round(statistics.fmean(queries), 2),
+        "peak_kb": round(peak / 1024, 1),
+        "response_bytes": len(response.content),
+        "requests": repeat,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "over_budget": len(over_budget),
+        "budget_error": over_budget[-1] if over_budget else None,
+    }
+
+
+def run_concurrent_batches(app, d: dict):
+    """CONCURRENT_BATCHES batches of database-backed GETs at once, then one plain request."""
+    import asyncio
+    import httpx
+
+    batch = {"requests": [{"method": "GET", "path": path} for path in (
+        "/api/coches/", f"/api/trabajadores/{d['dni']}", "/api/trabajos/available-for-trabajo-form", "/api/incidencias/",
+    )]}
+
+    async def send_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            responses = await asyncio.gather(*(client.post("/api/batch/", json=batch) for _ in range(CONCURRENT_BATCHES)))
+            responses.append(await client.get(f"/api/coches/{d['coche']}"))
+            return responses
+
+    start = time.perf_counter()
+    try:
+        responses = asyncio.run(asyncio.wait_for(send_all(), CONCURRENT_TIMEOUT))
+    except asyncio.TimeoutError:
+        return {"batches": CONCURRENT_BATCHES, "completed": False, "seconds": None, "statuses": {}}
+    statuses = {}
+    for response in responses:
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return {
+        "batches": CONCURRENT_BATCHES,
+        "completed": True,
+        "seconds": round(time.perf_counter() - start, 3),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def child(args):
+    """Runs in a fresh process for one dataset size (DATABASE_URL is already set)."""
+    sys.path.insert(0, BACKEND_DIR)
+    from sqlalchemy import event
+    from app.database import connection
+    from app.models.models import Base
+
+    Base.metadata.drop_all(connection.engine)
+    Base.metadata.create_all(connection.engine)
+    reserve = WARMUP + max(args.repeat, 3) + 1
+    start = time.perf_counter()
+    dataset = seed(connection.engine, args.size, reserve)
+    seed_seconds = time.perf_counter() - start
+
+    # No Gemini calls: every car form is classified as a low-severity incidence
+    import app.routers.formularios as formularios
+    import app.routers.incidencias as incidencias
+    stub = lambda formulario: (3, "Baja")  # noqa: E731
+    formularios.determine_incidencia = incidencias.determine_incidencia = stub
+
+    counter = [0]
+
+    def count(*_):
+        counter[0] += 1
+    event.listen(connection.engine, "after_cursor_execute", count)
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    only = set(args.only.split(",")) if args.only else None
+    results = {}
+    with TestClient(app) as client:  # runs the lifespan handler (background services)
+        for name, method, request, slow in scenarios(dataset, os.environ["ADMIN_TOKEN"]):
+            if only and name.split(".")[0] not in only and name not in only:
+                continue
+            repeat = max(3, args.repeat // 5) if slow else args.repeat
+            results[name] = run_scenario(client, counter, method, request, repeat)
+            print(f"  {args.size:>8} {name:<30} p50 {results[name]['p50_ms']:9.2f} ms"
+                  f"  p95 {results[name]['p95_ms']:9.2f} ms  {results[name]['queries_per_request']:6.1f} q/req"
+                  f"  {results[name]['peak_kb']:9.1f} KB", file=sys.stderr)
+            if results[name]["over_budget"]:
+                print(f"  {args.size:>8} {name:<30} OVER QUERY BUDGET ({results[name]['over_budget']} requests):"
+                      f" {results[name]['budget_error']}", file=sys.stderr)
+        concurrency = None
+        if not only or "batch" in only:
+            concurrency = run_concurrent_batches(app, dataset)
+            print(f"  {args.size:>8} {'batch.concurrent':<30} "
+                  + (f"{concurrency['seconds']:9.2f} s for {CONCURRENT_BATCHES} batches" if concurrency["completed"]
+                     else f"DID NOT FINISH in {CONCURRENT_TIMEOUT} s"), file=sys.stderr)
+
+    with open(args.child_out, "w") as f:
+        json.dump({
+            "dialect": connection.engine.dialect.name,
+            "dataset": dataset["counts"],
+            "seed_seconds": round(seed_seconds, 2),
+            "scenarios": results,
+            "concurrency": concurrency,
+        }, f)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated numbers of trabajos")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--only", help="comma-separated routers or scenario names (e.g. query,coches.list)")
+    parser.add_argument("--database-url", help="database to use instead of a temporary SQLite file (it is wiped)")
+    parser.add_argument("--out", help="results file (default benchmarks/results/endpoints-<timestamp>.json)")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_out:
+        child(args)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="sepcan-endpoints-")
+    out = args.out or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", f"endpoints-{datetime.now():%Y%m%d-%H%M%S}.json",
+    )
+    run = {
+        "meta": {
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "warmup": WARMUP,
+        },
+        "sizes": {},
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        child_out = os.path.join(workdir, f"{size}.json")
+        env = dict(
+            os.environ,
+            DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(workdir, f'bench-{size}.db')}",
+            SEPCAN_DATA_DIR=os.path.join(workdir, f"data-{size}"),
+            ADMIN_TOKEN=os.environ.get("ADMIN_TOKEN", "bench"),
+            LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+        )
+        command = [sys.executable, os.path.abspath(__file__), "--size", str(size), "--repeat", str(args.repeat),
+                   "--child-out", child_out]
+        if args.only:
+            command += ["--only", args.only]
+        subprocess.run(command, env=env, cwd=BACKEND_DIR, check=True, stdout=subprocess.DEVNULL)
+        with open(child_out) as f:
+            run["sizes"][str(size)] = json.load(f)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(run, f, indent=1)
+    print(f"Results written to {out}")
+
+    over_budget = [
+        f"{size} {name}: {result['budget_error']}"
+        for size, data in run["sizes"].items()
+        for name, result in data["scenarios"].items()
+        if result["over_budget"]
+    ]
+    if over_budget:
+        print("Query budgets exceeded:\n  " + "\n  ".join(over_budget), file=sys.stderr)
+    hung = [size for size, data in run["sizes"].items() if data["concurrency"] and not data["concurrency"]["completed"]]
+    if hung:
+        print(f"Concurrent batches did not finish (size {', '.join(hung)})", file=sys.stderr)
+    if over_budget or hung:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
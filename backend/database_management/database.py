@@ -1,37 +1,28 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, Float, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, Float, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+import importlib.util
 import os
+import sys
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 import urllib
-from datetime import datetime
 
 # Load environment variables
 load_dotenv()
 
-# Date format constants
-DATE_FORMAT = "%d/%m/%Y"
+# Date codec shared with the API (app/utils/dates.py). It is loaded by path so
+# these scripts don't import the app package, whose __init__ builds the FastAPI app.
+_dates_spec = importlib.util.spec_from_file_location(
+    "sepcan_dates", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "utils", "dates.py")
+)
+dates = importlib.util.module_from_spec(_dates_spec)
+sys.modules[_dates_spec.name] = dates
+_dates_spec.loader.exec_module(dates)
 
-# Helper function to convert string to datetime object
-def parse_date(date_str):
-    """Convert a string in DD/MM/YYYY format to a datetime object."""
-    if not date_str:
-        return None
-    try:
-        return datetime.strptime(date_str, DATE_FORMAT)
-    except ValueError:
-        # Try alternate format (YYYY-MM-DD) that might come from frontend
-        try:
-            return datetime.strptime(date_str, "%Y-%m-%d")
-        except ValueError:
-            return None
-
-# Helper function to format datetime to string
-def format_date(date_obj):
-    """Convert a datetime object to a string in DD/MM/YYYY format."""
-    if not date_obj:
-        return None
-    return date_obj.strftime(DATE_FORMAT)
+DATE_FORMAT = dates.DATE_FORMAT
+parse_date = dates.try_parse_date  # DD/MM/YYYY or YYYY-MM-DD -> datetime, None if invalid
+format_date = dates.format_date    # datetime -> DD/MM/YYYY
 
 # Database connection details
 db_user = os.getenv("AZURE_SQL_USER")
@@ -53,6 +44,9 @@ params = urllib.parse.quote_plus(
 )
 DATABASE_URL = f"mssql+pyodbc:///?odbc_connect={params}"
 
+# A full DATABASE_URL (local SQLite/Postgres copies) takes precedence, as in the app
+DATABASE_URL = os.getenv("DATABASE_URL") or DATABASE_URL
+
 # Create SQLAlchemy engine
 engine = create_engine(DATABASE_URL)
 
@@ -62,8 +56,15 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Create base class for models
 Base = declarative_base()
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class Tracked:
+    """Change tracking for GET /sync: updated_at (UTC) is set on every insert and update."""
+    updated_at = Column(DateTime, nullable=False, default=utcnow, onupdate=utcnow, index=True)
+
 # Define models according to ER diagram
-class Coche(Base):
+class Coche(Tracked, Base):
     __tablename__ = "coches"
     
     # ID is PK, but company provides the ID, so it MUST NOT be an IDENTITY column.
@@ -76,7 +77,7 @@ class Coche(Base):
     formularios_trabajo = relationship("FormularioTrabajo", back_populates="coche")
     incidencias = relationship("Incidencia", back_populates="coche", foreign_keys="Incidencia.id_coche")
 
-class Trabajador(Base):
+class Trabajador(Tracked, Base):
     __tablename__ = "trabajadores"
     
     dni = Column(Integer, primary_key=True, index=True)
@@ -89,7 +90,7 @@ class Trabajador(Base):
     formularios_coche = relationship("FormularioCoche", back_populates="trabajador")
     formularios_trabajo = relationship("FormularioTrabajo", back_populates="trabajador")
 
-class Trabajo(Base):
+class Trabajo(Tracked, Base):
     __tablename__ = "trabajos"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -100,7 +101,7 @@ class Trabajo(Base):
     formularios_coche = relationship("FormularioCoche", back_populates="trabajo", uselist=False)
     formularios_trabajo = relationship("FormularioTrabajo", back_populates="trabajo", uselist=False)
 
-class FormularioCoche(Base):
+class FormularioCoche(Tracked, Base):
     __tablename__ = "formularios_coche"
     
     id_coche = Column(Integer, ForeignKey("coches.ID"), primary_key=True)
@@ -116,7 +117,7 @@ class FormularioCoche(Base):
     trabajador = relationship("Trabajador", back_populates="formularios_coche")
     trabajo = relationship("Trabajo", back_populates="formularios_coche")
 
-class FormularioTrabajo(Base):
+class FormularioTrabajo(Tracked, Base):
     __tablename__ = "formularios_trabajo"
     
     id_coche = Column(Integer, ForeignKey("coches.ID"), primary_key=True)
@@ -134,7 +135,7 @@ class FormularioTrabajo(Base):
     trabajador = relationship("Trabajador", back_populates="formularios_trabajo")
     trabajo = relationship("Trabajo", back_populates="formularios_trabajo")
 
-class Incidencia(Base):
+class Incidencia(Tracked, Base):
     __tablename__ = "incidencias"
     
     id_incidencia = Column(Integer, primary_key=True, index=True)
@@ -147,6 +148,28 @@ class Incidencia(Base):
     fecha_resolucion = Column(DateTime, nullable=True)
     coche = relationship("Coche", back_populates="incidencias", foreign_keys=[id_coche])
 
+class SyncDeletion(Base):
+    """Deletion log for GET /sync, written by the delete triggers below."""
+    __tablename__ = "sync_deletions"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String(64), nullable=False)
+    row_key = Column(String(255), nullable=False)  # primary key values joined with ":"
+    deleted_at = Column(DateTime, nullable=False, default=utcnow, index=True)
+
+# Delete triggers feeding sync_deletions, shared with the API (app/database/sync_triggers.py), loaded by path too
+_triggers_spec = importlib.util.spec_from_file_location(
+    "sepcan_sync_triggers",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "database", "sync_triggers.py"),
+)
+sync_triggers = importlib.util.module_from_spec(_triggers_spec)
+sys.modules[_triggers_spec.name] = sync_triggers
+_triggers_spec.loader.exec_module(sync_triggers)
+
+SYNC_KEYS = sync_triggers.SYNC_KEYS
+sync_trigger_ddl = sync_triggers.sync_trigger_ddl
+event.listen(Base.metadata, "after_create", sync_triggers.create_sync_triggers)
+
 # Function to get DB session
 def get_db():
     db = SessionLocal()
@@ -0,0 +1,588 @@
+"""
+Synthetic dataset generator (the model of populate_comprehensive.py, at any scale).
+
+Generates workers, cars, trabajos with both forms and incidences for an
+arbitrary date range:
+- jobs per open day follow the nautical seasonality of the original script
+  (busier from spring to late summer and on Fridays/Saturdays, closed on
+  Sundays), extended to every month;
+- car states, departure times, locations, hours and travel times, incidence
+  gravity, causes and resolution times follow the same distributions.
+
+Generation is deterministic for a given --seed, whatever the number of
+processes: every month is an independent partition with its own random
+stream and id range, generated in parallel (--processes) and inserted in
+large executemany batches (--batch-size).
+
+Snapshots save a generated database and restore it in seconds: a file copy
+for SQLite, a template database for Postgres, and a compressed table dump
+for anything else.
+
+Usage (from backend/; the database is DATABASE_URL, or the Azure one from .env):
+    python database_management/generate_dataset.py generate --workers 60 --cars 40 \\
+        --start 2021-01-01 --years 4 --jobs-per-day 400 --seed 7 --processes 8 --reset
+    python database_management/generate_dataset.py snapshot bench-1m
+    python database_management/generate_dataset.py restore bench-1m
+    python database_management/generate_dataset.py list
+"""
+import argparse
+import gzip
+import math
+import multiprocessing
+import os
+import pickle
+import random
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine, delete, event, func, insert, inspect, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from database import Base, Coche, Trabajador, Trabajo, FormularioCoche, FormularioTrabajo, Incidencia  # noqa: E402
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "var", "datasets")
+
+# --- Domain model (from the original populate_comprehensive.py) -------------------
+# Gran Canaria locations
+locations = [
+    "Las Palmas de Gran Canaria", "Telde", "Santa Lucía de Tirajana", "San Bartolomé de Tirajana",
+    "Arucas", "Ingenio", "Agüimes", "Gáldar", "Mogán", "Puerto Rico", "Maspalomas", "Playa del Inglés",
+    "Vecindario", "Doctoral", "Arrecife", "Arinaga", "Puerto del Carmen", "Arguineguín", "El Tablero",
+    "Meloneras", "Playa de Mogán", "San Agustín", "El Matorral", "La Garita", "Melenara",
+]
+
+# Car states
+car_states_weights = {
+    "Limpio": 0.4,
+    "Sucio": 0.25,
+    "Muy Limpio": 0.2,
+    "Muy Sucio": 0.15,
+}
+
+# Causes of incidences, by gravity
+issue_causes = {
+    "Crítica": [
+        "Motor sobrecalentado, riesgo de incendio.",
+        "Frenos no responden correctamente, peligro inmediato.",
+        "Dirección bloqueada parcialmente, inseguro para conducir.",
+        "Rueda a punto de soltarse, tornillos flojos.",
+        "Humo saliendo del motor, posible cortocircuito eléctrico.",
+        "Fuga de combustible detectada.",
+        "Airbag desplegado accidentalmente.",
+    ],
+    "Alta": [
+        "Luces principales no funcionan, peligroso para conducción nocturna.",
+        "Sistema ABS fallando, reducción significativa de seguridad.",
+        "Testigo de presión de aceite encendido constantemente.",
+        "Problemas con la transmisión, cambios bruscos.",
+        "Batería fallando, posible quedarse sin energía en ruta.",
+        "Cremallera de dirección con holgura excesiva.",
+        "Fuga de líquido de frenos detectada.",
+    ],
+    "Media": [
+        "Aire acondicionado no funciona, incómodo en clima caluroso.",
+        "Indicador de combustible impreciso, riesgo de quedarse sin gasolina.",
+        "Espejo retrovisor lateral suelto.",
+        "Desgaste irregular en los neumáticos, requiere alineación.",
+        "Bujías gastadas, arranque difícil.",
+        "Radio/sistema de entretenimiento no funciona.",
+        "Limpiaparabrisas desgastados, visibilidad reducida en lluvia.",
+    ],
+    "Baja": [
+        "Pequeño rasguño en la carrocería.",
+        "Ventana no baja completamente.",
+        "Luz interior no funciona.",
+        "Tapicería manchada.",
+        "Falta tapa del depósito de combustible.",
+        "Retrovisor interior desajustado.",
+        "Cenicero dañado o faltante.",
+    ],
+}
+
+# Weighted choice for gravity levels
+gravity_weights = {
+    "Crítica": 0.15,
+    "Alta": 0.25,
+    "Media": 0.20,
+    "Baja": 0.40,
+}
+
+# Older incidences are more likely resolved, higher gravities sooner: (cap, days to reach it)
+resolve_probability = {
+    "Crítica": (0.9, 150),
+    "Alta": (0.8, 170),
+    "Media": (0.7, 180),
+    "Baja": (0.6, 200),
+}
+
+# Resolution happens 1..N days after the incidence
+max_days_to_resolve = {
+    "Crítica": 3,
+    "Alta": 5,
+    "Media": 10,
+    "Baja": 14,
+}
+
+# Nautical business: busier from spring to late summer (the original covered January-June)
+month_weights = {
+    1: 0.6, 2: 0.7, 3: 0.8, 4: 1.0, 5: 1.2, 6: 1.5,
+    7: 1.6, 8: 1.6, 9: 1.3, 10: 1.0, 11: 0.7, 12: 0.6,
+}
+
+# Busier before and during weekends; closed on Sundays (weekday 6)
+day_weights = {
+    0: 0.8, 1: 0.8, 2: 0.9, 3: 1.0, 4: 1.3, 5: 1.2,
+}
+
+# The original four workers come first, so demo data stays recognisable
+base_workers = [
+    {"dni": 42871236, "nombre": "Carlos", "apellido": "Rodríguez", "birth": "1985-05-15", "employment": "2018-07-23"},
+    {"dni": 51432687, "nombre": "Ana", "apellido": "Martínez", "birth": "1992-11-03", "employment": "2020-03-10"},
+    {"dni": 37865421, "nombre": "Miguel", "apellido": "Hernández", "birth": "1988-02-27", "employment": "2019-09-15"},
+    {"dni": 68542319, "nombre": "Laura", "apellido": "Sánchez", "birth": "1990-08-21", "employment": "2021-01-05"},
+]
+nombres = ["Carlos", "Ana", "Miguel", "Laura", "José", "María", "Antonio", "Carmen", "Juan", "Lucía",
+           "David", "Elena", "Javier", "Sara", "Pedro", "Marta", "Alejandro", "Paula", "Sergio", "Raquel"]
+apellidos = ["Rodríguez", "Martínez", "Hernández", "Sánchez", "García", "López", "Pérez", "González",
+             "Santana", "Suárez", "Ramírez", "Díaz", "Cabrera", "Medina", "Quintana", "Betancor"]
+
+coche_comments = ["Todo en orden", "Revisar niveles", "Comprobar presión neumáticos", "Limpiar antes de uso", ""]
+trabajo_comments = ["Cliente satisfecho", "Se requiere seguimiento", "Todo completado según lo previsto",
+                    "Se recomendó mantenimiento adicional", ""]
+
+
+class DatasetSpec:
+    """What to generate. Everything derived from it is deterministic for a given seed."""
+
+    def __init__(self, workers: int = 4, cars: int = 3, start: date = date(2025, 1, 1),
+                 end: date = date(2025, 6, 30), jobs_per_day: float = 0.2, clients: int = 200,
+                 incidence_rate: float = 0.25, seed: int = 0):
+        if end < start:
+            raise ValueError("end must not be before start")
+        self.workers = workers
+        self.cars = cars
+        self.start = start
+        self.end = end
+        self.jobs_per_day = jobs_per_day
+        self.clients = clients
+        self.incidence_rate = incidence_rate
+        self.seed = seed
+
+    def describe(self) -> str:
+        return (f"{self.workers} workers, {self.cars} cars, {self.start} to {self.end}, "
+                f"{self.jobs_per_day:g} jobs per open day, seed {self.seed}")
+
+
+# --- Generation ---------------------------------------------------------------------
+def _poisson(rng: random.Random, lam: float) -> int:
+    if lam <= 0:
+        return 0
+    if lam > 30:  # normal approximation; Knuth's method underflows for large lambdas
+        return max(0, int(round(rng.gauss(lam, math.sqrt(lam)))))
+    limit, k, p = math.exp(-lam), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def day_counts(spec: DatasetSpec) -> List[Tuple[date, int]]:
+    """Jobs on every open day of the range: Poisson around the seasonal mean."""
+    days = []
+    current = spec.start
+    while current <= spec.end:
+        if current.weekday() in day_weights:
+            days.append(current)
+        current += timedelta(days=1)
+    if not days:
+        return []
+    weight = {d: month_weights[d.month] * day_weights[d.weekday()] for d in days}
+    mean_weight = sum(weight.values()) / len(days)
+    counts = []
+    for d in days:
+        rng = random.Random(f"{spec.seed}:day:{d.toordinal()}")
+        counts.append((d, _poisson(rng, spec.jobs_per_day * weight[d] / mean_weight)))
+    return counts
+
+
+def partitions(spec: DatasetSpec) -> List[Tuple[int, List[Tuple[date, int]]]]:
+    """Month partitions as (first trabajo id, [(day, jobs), ...])."""
+    months: "OrderedDict[Tuple[int, int], List[Tuple[date, int]]]" = OrderedDict()
+    for d, n in day_counts(spec):
+        months.setdefault((d.year, d.month), []).append((d, n))
+    result, next_id = [], 1
+    for days in months.values():
+        result.append((next_id, days))
+        next_id += sum(n for _, n in days)
+    return result
+
+
+def generate_people(spec: DatasetSpec) -> Tuple[List[Dict], List[Dict]]:
+    """Rows for trabajadores and coches."""
+    rng = random.Random(f"{spec.seed}:people")
+    trabajadores = []
+    for worker in base_workers[:spec.workers]:
+        trabajadores.append({
+            "dni": worker["dni"], "nombre": worker["nombre"], "apellido": worker["apellido"],
+            "fecha_nacimiento": datetime.strptime(worker["birth"], "%Y-%m-%d"),
+            "fecha_empleo": datetime.strptime(worker["employment"], "%Y-%m-%d"),
+        })
+    taken = {w["dni"] for w in trabajadores}
+    extra = spec.workers - len(trabajadores)
+    dnis = [dni for dni in rng.sample(range(10_000_000, 100_000_000), extra + len(taken)) if dni not in taken][:extra]
+    for dni in dnis:
+        employed = datetime(rng.randint(2010, max(2010, spec.start.year)), rng.randint(1, 12), rng.randint(1, 28))
+        trabajadores.append({
+            "dni": dni, "nombre": rng.choice(nombres), "apellido": rng.choice(apellidos),
+            "fecha_nacimiento": datetime(rng.randint(1960, 2000), rng.randint(1, 12), rng.randint(1, 28)),
+            "fecha_empleo": employed,
+        })
+    coches = [{"id_coche": i, "placa": 10000 + i} for i in range(1, spec.cars + 1)]
+    return trabajadores, coches
+
+
+def generate_partition(spec: DatasetSpec, partition: Tuple[int, List[Tuple[date, int]]],
+                       dnis: List[int], car_ids: List[int]) -> Dict[str, List[Dict]]:
+    """Rows of one month: trabajos, both forms of each, and the incidences found in the car forms."""
+    first_id, days = partition
+    rng = random.Random(f"{spec.seed}:partition:{days[0][0].toordinal()}")
+    end = datetime.combine(spec.end, datetime.min.time())
+    states, state_weights = list(car_states_weights), list(car_states_weights.values())
+    gravities, gravity_w = list(gravity_weights), list(gravity_weights.values())
+    rows = {"trabajos": [], "formularios_coche": [], "formularios_trabajo": [], "incidencias": []}
+    id_trabajo = first_id
+    for day, jobs in days:
+        fecha = datetime.combine(day, datetime.min.time())
+        for _ in range(jobs):
+            id_coche, dni = rng.choice(car_ids), rng.choice(dnis)
+            rows["trabajos"].append({"id": id_trabajo, "cliente": f"Cliente Marino {rng.randint(1, spec.clients)}", "fecha": fecha})
+
+            # Morning departure
+            hora_partida = f"{rng.randint(7, 9)}:{rng.randint(0, 59):02d}"
+            estado_coche = rng.choices(states, weights=state_weights, k=1)[0]
+            rows["formularios_coche"].append({
+                "id_coche": id_coche, "dni_trabajador": dni, "id_trabajo": id_trabajo,
+                "otros": f"Observaciones para trabajo {id_trabajo}: {rng.choice(coche_comments)}",
+                "fecha": fecha, "hora_partida": hora_partida, "estado_coche": estado_coche,
+            })
+
+            lugar_trabajo = rng.choice(locations)
+            tiempo_llegada = rng.randint(10, 60)
+            horas_trabajadas = round(rng.uniform(2, 8), 1)
+            partida_h, partida_m = map(int, hora_partida.split(":"))
+            total_minutes = partida_h * 60 + partida_m + tiempo_llegada + int(horas_trabajadas * 60)
+            rows["formularios_trabajo"].append({
+                "id_coche": id_coche, "dni_trabajador": dni, "id_trabajo": id_trabajo,
+                "otros": f"Trabajo completado en {lugar_trabajo}. {rng.choice(trabajo_comments)}",
+                "fecha": fecha, "hora_final": f"{(total_minutes // 60) % 24}:{total_minutes % 60:02d}",
+                "horas_trabajadas": horas_trabajadas, "lugar_trabajo": lugar_trabajo, "tiempo_llegada": tiempo_llegada,
+            })
+
+            if rng.random() < spec.incidence_rate:
+                gravedad = rng.choices(gravities, weights=gravity_w, k=1)[0]
+                cap, scale = resolve_probability[gravedad]
+                resuelta = rng.random() < min(cap, (end - fecha).days / scale)
+                fecha_resolucion = id_mecanico = None
+                if resuelta:
+                    fecha_resolucion = min(end, fecha + timedelta(days=rng.randint(1, max_days_to_resolve[gravedad])))
+                    id_mecanico = rng.choice(dnis)
+                rows["incidencias"].append({
+                    "id_incidencia": id_trabajo,  # at most one per car form: unique and deterministic
+                    "id_coche": id_coche, "gravedad": gravedad, "fecha": fecha, "resuelta": resuelta,
+                    "descripcion": f"Estado del coche: {estado_coche}. Problema detectado: {rng.choice(issue_causes[gravedad])}",
+                    "id_mecanico": id_mecanico, "fecha_resolucion": fecha_resolucion,
+                })
+            id_trabajo += 1
+    return rows
+
+
+# --- Loading --------------------------------------------------------------------------
+MODELS = OrderedDict([
+    ("trabajos", Trabajo),
+    ("formularios_coche", FormularioCoche),
+    ("formularios_trabajo", FormularioTrabajo),
+    ("incidencias", Incidencia),
+])
+
+
+def make_engine(url: str):
+    backend = make_url(url).get_backend_name()
+    options = {"fast_executemany": True} if backend == "mssql" else {}
+    engine = create_engine(url, **options)
+    if backend == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _bulk_load_pragmas(dbapi_connection, _):
+            # Throwaway benchmark data: trade durability for load speed
+            dbapi_connection.execute("PRAGMA synchronous=OFF")
+            dbapi_connection.execute("PRAGMA journal_mode=WAL")
+    return engine
+
+
+def insert_rows(engine, model, rows: List[Dict], batch_size: int):
+    """ORM bulk INSERT (executemany) in batches, keyed by attribute name."""
+    with Session(engine) as session:
+        for offset in range(0, len(rows), batch_size):
+            session.execute(insert(model), rows[offset:offset + batch_size])
+        session.commit()
+
+
+def _insert_partition(engine, rows: Dict[str, List[Dict]], batch_size: int) -> Dict[str, int]:
+    for name, model in MODELS.items():
+        insert_rows(engine, model, rows[name], batch_size)
+    return {name: len(rows[name]) for name in MODELS}
+
+
+# Worker processes: each generates (and, for server databases, inserts) whole partitions
+_worker: Dict = {}
+
+
+def _init_worker(spec, dnis, car_ids, url, batch_size):
+    _worker.update(spec=spec, dnis=dnis, car_ids=car_ids, batch_size=batch_size,
+                   engine=make_engine(url) if url else None)
+
+
+def _run_partition(partition):
+    rows = generate_partition(_worker["spec"], partition, _worker["dnis"], _worker["car_ids"])
+    if _worker["engine"] is None:
+        return rows
+    return _insert_partition(_worker["engine"], rows, _worker["batch_size"])
+
+
+def generate(engine, spec: DatasetSpec, processes: int = 1, batch_size: int = 10000, progress=None) -> Dict[str, int]:
+    """Generate `spec` into the (empty) tables of `engine`. Returns the number of rows per table."""
+    trabajadores, coches = generate_people(spec)
+    insert_rows(engine, Trabajador, trabajadores, batch_size)
+    insert_rows(engine, Coche, coches, batch_size)
+    counts = {"trabajadores": len(trabajadores), "coches": len(coches), **{name: 0 for name in MODELS}}
+
+    parts = partitions(spec)
+    dnis = [w["dni"] for w in trabajadores]
+    car_ids = [c["id_coche"] for c in coches]
+    # SQLite has a single writer: workers only generate and this process inserts
+    parallel_insert = processes > 1 and engine.dialect.name != "sqlite"
+    url = engine.url.render_as_string(hide_password=False) if parallel_insert else None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, _init_worker, (spec, dnis, car_ids, url, batch_size))
+        results = pool.imap(_run_partition, parts)
+    else:
+        pool = None
+        results = (generate_partition(spec, part, dnis, car_ids) for part in parts)
+    try:
+        for done, result in enumerate(results, 1):
+            added = result if parallel_insert else _insert_partition(engine, result, batch_size)
+            for name, n in added.items():
+                counts[name] += n
+            if progress:
+                progress(done, len(parts), counts)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if engine.dialect.name == "postgresql":
+        # Explicit ids do not advance the SERIAL sequences the app's inserts rely on
+        with engine.begin() as conn:
+            for table, column in (("incidencias", "id_incidencia"), ("trabajos", "id")):
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                    f"COALESCE((SELECT MAX({column}) FROM {table}), 0) + 1, false)"
+                ))
+    return counts
+
+
+def reset_tables(engine):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def row_counts(engine) -> Dict[str, int]:
+    with Session(engine) as session:
+        return {
+            model.__tablename__: session.scalar(select(func.count()).select_from(model))
+            for model in (Trabajador, Coche, *MODELS.values())
+        }
+
+
+# --- Snapshots --------------------------------------------------------------------------
+def _snapshot_path(name: str, suffix: str) -> str:
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    return os.path.join(SNAPSHOT_DIR, name + suffix)
+
+
+def _pg_admin(engine):
+    """Connection to the server's maintenance database (CREATE/DROP DATABASE cannot run in a transaction)."""
+    return create_engine(engine.url.set(database="postgres"), isolation_level="AUTOCOMMIT")
+
+
+def snapshot(engine, name: str) -> str:
+    backend = engine.dialect.name
+    engine.dispose()
+    if backend == "sqlite":
+        path = _snapshot_path(name, ".sqlite3")
+        source = sqlite3.connect(engine.url.database)
+        target = sqlite3.connect(path)
+        with target:
+            source.backup(target)
+        source.close()
+        target.close()
+        return path
+    if backend == "postgresql":
+        database = engine.url.database
+        admin = _pg_admin(engine)
+        with admin.connect() as conn:
+            conn.execute(text(f'DROP DATABASE IF EXISTS "{database}__{name}"'))
+            conn.execute(text(f'CREATE DATABASE "{database}__{name}" TEMPLATE "{database}"'))
+        admin.dispose()
+        return f"{database}__{name}"
+    # Portable: every table, pickled in batches into one gzip file
+    path = _snapshot_path(name, ".dump.gz")
+    with gzip.open(path, "wb", compresslevel=1) as f, engine.connect() as conn:
+        for table in Base.metadata.sorted_tables:
+            result = conn.execute(select(table)).mappings()
+            while True:
+                batch = [dict(row) for row in result.fetchmany(50000)]
+                if not batch:
+                    break
+                pickle.dump((table.name, batch), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def restore(engine, name: str):
+    backend = engine.dialect.name
+    engine.dispose()
+    if backend == "sqlite":
+        path = _snapshot_path(name, ".sqlite3")
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        source = sqlite3.connect(path)
+        target = sqlite3.connect(engine.url.database)
+        with target:
+            source.backup(target)
+        source.close()
+        target.close()
+        return
+    if backend == "postgresql":
+        database = engine.url.database
+        admin = _pg_admin(engine)
+        with admin.connect() as conn:
+            conn.execute(text(
+                "SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = :db AND pid <> pg_backend_pid()"
+            ), {"db": database})
+            conn.execute(text(f'DROP DATABASE IF EXISTS "{database}"'))
+            conn.execute(text(f'CREATE DATABASE "{database}" TEMPLATE "{database}__{name}"'))
+        admin.dispose()
+        return
+    path = _snapshot_path(name, ".dump.gz")
+    tables = {table.name: table for table in Base.metadata.sorted_tables}
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(delete(table))
+        with gzip.open(path, "rb") as f:
+            while True:
+                try:
+                    table_name, batch = pickle.load(f)
+                except EOFError:
+                    break
+                conn.execute(tables[table_name].insert(), batch)
+
+
+def list_snapshots(engine) -> List[str]:
+    if engine.dialect.name == "postgresql":
+        prefix = engine.url.database + "__"
+        admin = _pg_admin(engine)
+        with admin.connect() as conn:
+            names = [row[0][len(prefix):] for row in conn.execute(
+                text("SELECT datname FROM pg_database WHERE datname LIKE :p"), {"p": prefix + "%"})]
+        admin.dispose()
+        return sorted(names)
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    suffix = ".sqlite3" if engine.dialect.name == "sqlite" else ".dump.gz"
+    return sorted(name[:-len(suffix)] for name in os.listdir(SNAPSHOT_DIR) if name.endswith(suffix))
+
+
+# --- CLI ------------------------------------------------------------------------------------
+def _date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                        help="target database (default: DATABASE_URL, else the Azure database)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="generate a dataset")
+    gen.add_argument("--workers", type=int, default=4)
+    gen.add_argument("--cars", type=int, default=3)
+    gen.add_argument("--start", type=_date, default=date(2025, 1, 1), help="YYYY-MM-DD")
+    period = gen.add_mutually_exclusive_group()
+    period.add_argument("--end", type=_date, help="YYYY-MM-DD (default: six months)")
+    period.add_argument("--years", type=float, help="length of the period in years")
+    gen.add_argument("--jobs-per-day", type=float, default=0.2, help="mean trabajos per open day")
+    gen.add_argument("--clients", type=int, default=200)
+    gen.add_argument("--incidence-rate", type=float, default=0.25, help="share of car forms with an incidence")
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    gen.add_argument("--batch-size", type=int, default=10000)
+    gen.add_argument("--reset", action="store_true", help="drop and recreate the tables first")
+    gen.add_argument("--snapshot", metavar="NAME", help="save the result as a snapshot")
+
+    snap = commands.add_parser("snapshot", help="save the current database")
+    snap.add_argument("name")
+    rest = commands.add_parser("restore", help="replace the database with a snapshot")
+    rest.add_argument("name")
+    commands.add_parser("list", help="list snapshots")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        engine = make_engine(args.database_url)
+    else:
+        from database import engine
+
+    if args.command == "generate":
+        if args.years is not None:
+            end = args.start + timedelta(days=round(args.years * 365.25) - 1)
+        else:
+            end = args.end or args.start + timedelta(days=180)
+        spec = DatasetSpec(
+            workers=args.workers, cars=args.cars, start=args.start, end=end, jobs_per_day=args.jobs_per_day,
+            clients=args.clients, incidence_rate=args.incidence_rate, seed=args.seed,
+        )
+        if args.reset:
+            reset_tables(engine)
+        else:
+            Base.metadata.create_all(bind=engine)
+            if inspect(engine).has_table("trabajos") and any(row_counts(engine).values()):
+                parser.error("the database already has data; use --reset to replace it")
+        print(f"Generating {spec.describe()}")
+        started = time.perf_counter()
+
+        def progress(done, total, counts):
+            print(f"\r  {done}/{total} months, {counts['formularios_coche'] + counts['formularios_trabajo']} forms",
+                  end="", flush=True)
+        counts = generate(engine, spec, processes=args.processes, batch_size=args.batch_size, progress=progress)
+        print(f"\nDone in {time.perf_counter() - started:.1f} s: "
+              + ", ".join(f"{n} {name}" for name, n in counts.items()))
+        if args.snapshot:
+            print(f"Snapshot saved: {snapshot(engine, args.snapshot)}")
+    elif args.command == "snapshot":
+        print(f"Snapshot saved: {snapshot(engine, args.name)}")
+    elif args.command == "restore":
+        started = time.perf_counter()
+        restore(engine, args.name)
+        print(f"Restored {args.name} in {time.perf_counter() - started:.1f} s")
+    else:
+        for name in list_snapshots(engine):
+            print(name)
+
+
+if __name__ == "__main__":
+    main()
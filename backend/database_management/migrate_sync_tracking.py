@@ -0,0 +1,86 @@
+"""
+Adds the change tracking behind GET /api/sync to an existing database:
+
+- an indexed updated_at column (UTC) on coches, trabajadores, trabajos,
+  formularios_coche, formularios_trabajo and incidencias; existing rows get
+  the time of the migration;
+- the sync_deletions table, and a delete trigger per table that logs the
+  primary key of every deleted row.
+
+Databases created from scratch with create_all() on either set of models
+(app.database.connection.create_tables, database_management/database.py,
+generate_dataset.py, benchmarks/run_endpoints.py) already have all of it.
+Run this before deploying the API on an older database: the models declare
+updated_at NOT NULL, so until the column exists every query on those tables
+fails. The script is idempotent; --sql prints the statements
+instead of running them (e.g. to review them before an Azure SQL change).
+
+Usage (from backend/):
+    python database_management/migrate_sync_tracking.py [--sql]
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from database import SYNC_KEYS, SyncDeletion, engine, sync_trigger_ddl  # noqa: E402
+
+ADD_COLUMN = {
+    "mssql": "ALTER TABLE [{table}] ADD updated_at DATETIME2 NOT NULL "
+             "CONSTRAINT df_{table}_updated_at DEFAULT SYSUTCDATETIME()",
+    "postgresql": "ALTER TABLE \"{table}\" ADD COLUMN updated_at TIMESTAMP NOT NULL "
+                  "DEFAULT (now() AT TIME ZONE 'utc')",
+    # SQLite only accepts a constant default here; the rows are stamped right after
+    "sqlite": "ALTER TABLE \"{table}\" ADD COLUMN updated_at DATETIME NOT NULL DEFAULT '1970-01-01 00:00:00.000000'",
+}
+STAMP_ROWS = {
+    "sqlite": "UPDATE \"{table}\" SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', 'now')",
+}
+CREATE_INDEX = "CREATE INDEX ix_{table}_updated_at ON {quoted} (updated_at)"
+
+
+def statements(connection) -> list:
+    dialect = connection.dialect.name
+    if dialect not in ADD_COLUMN:
+        raise SystemExit(f"Unsupported database dialect: {dialect}")
+    inspector = inspect(connection)
+    quote = (lambda t: f"[{t}]") if dialect == "mssql" else (lambda t: f'"{t}"')
+    result = []
+    for table in SYNC_KEYS:
+        if not any(column["name"] == "updated_at" for column in inspector.get_columns(table)):
+            result.append(ADD_COLUMN[dialect].format(table=table))
+            if dialect in STAMP_ROWS:
+                result.append(STAMP_ROWS[dialect].format(table=table))
+        if not any(index["name"] == f"ix_{table}_updated_at" for index in inspector.get_indexes(table)):
+            result.append(CREATE_INDEX.format(table=table, quoted=quote(table)))
+    if not inspector.has_table(SyncDeletion.__tablename__):
+        result.append(str(CreateTable(SyncDeletion.__table__).compile(connection)).strip())
+        result.extend(str(CreateIndex(index).compile(connection)) for index in SyncDeletion.__table__.indexes)
+    result.extend(sync_trigger_ddl(dialect))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sql", action="store_true", help="print the statements instead of running them")
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        pending = statements(connection)
+        if args.sql:
+            # One batch per statement on SQL Server (CREATE TRIGGER must start its batch)
+            terminator = "\nGO" if connection.dialect.name == "mssql" else ";"
+            for statement in pending:
+                print(statement + terminator)
+            return
+        for statement in pending:
+            print(statement.splitlines()[0][:100])
+            connection.exec_driver_sql(statement)
+    print(f"Change tracking ready on {len(SYNC_KEYS)} tables.")
+
+
+if __name__ == "__main__":
+    main()
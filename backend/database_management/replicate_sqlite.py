@@ -0,0 +1,46 @@
+"""
+Simulated read replica for local development: copies a SQLite primary onto
+a replica file every --interval seconds (the replication lag).
+
+Run the API against both files to exercise the read-replica routing:
+
+    DATABASE_URL=sqlite:///primary.db DATABASE_READ_URL=sqlite:///replica.db uvicorn main:app
+    python database_management/replicate_sqlite.py primary.db replica.db --interval 5
+
+(With Postgres, use a streaming-replication standby as DATABASE_READ_URL.)
+"""
+import argparse
+import sqlite3
+import time
+
+
+def copy(primary: str, replica: str):
+    source = sqlite3.connect(primary)
+    target = sqlite3.connect(replica, timeout=30)
+    try:
+        with target:
+            source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("primary")
+    parser.add_argument("replica")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between copies")
+    parser.add_argument("--once", action="store_true", help="copy once and exit")
+    args = parser.parse_args()
+
+    while True:
+        started = time.perf_counter()
+        copy(args.primary, args.replica)
+        print(f"Replicated {args.primary} -> {args.replica} in {time.perf_counter() - started:.2f} s", flush=True)
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
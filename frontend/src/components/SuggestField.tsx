@@ -0,0 +1,80 @@
+import { useEffect, useState } from 'react'
+import { Autocomplete, TextField } from '@mui/material'
+
+// Select box with typeahead: shows `options` (the list loaded with the page)
+// until the user types, then the server's suggestions for the typed text
+// (/…/suggest, answered from memory, so it is called on every keystroke).
+
+interface SuggestFieldProps<T> {
+  id: string
+  label: string
+  value: number
+  options: T[]
+  getId: (option: T) => number
+  getLabel: (option: T) => string
+  suggest: (q: string) => Promise<T[]>
+  onChange: (value: number) => void
+  disabled?: boolean
+  required?: boolean
+}
+
+const SUGGEST_DELAY_MS = 120
+
+function SuggestField<T>({
+  id, label, value, options, getId, getLabel, suggest, onChange, disabled, required
+}: SuggestFieldProps<T>) {
+  const [input, setInput] = useState('')
+  const [suggestions, setSuggestions] = useState<T[] | null>(null)
+  // Kept so the chosen option still shows when it is not among the current suggestions
+  const [chosen, setChosen] = useState<T | null>(null)
+
+  const selected = value
+    ? (chosen && getId(chosen) === value ? chosen : options.find((option) => getId(option) === value) ?? null)
+    : null
+
+  useEffect(() => {
+    const q = input.trim()
+    if (!q || (selected && q === getLabel(selected))) {
+      setSuggestions(null)
+      return
+    }
+    let current = true
+    const timer = setTimeout(() => {
+      suggest(q)
+        .then((results) => {
+          if (current) setSuggestions(results)
+        })
+        .catch(() => {
+          // Fall back to filtering the loaded list
+          if (current) setSuggestions(null)
+        })
+    }, SUGGEST_DELAY_MS)
+    return () => {
+      current = false
+      clearTimeout(timer)
+    }
+  }, [input]) // eslint-disable-line react-hooks/exhaustive-deps
+
+  return (
+    <Autocomplete
+      id={id}
+      options={suggestions ?? options}
+      value={selected}
+      inputValue={input}
+      disabled={disabled}
+      getOptionLabel={getLabel}
+      isOptionEqualToValue={(option, current) => getId(option) === getId(current)}
+      // Suggestions are already ranked by the server; the loaded list is filtered here
+      filterOptions={suggestions ? (list) => list : undefined}
+      onInputChange={(_, text) => setInput(text)}
+      onChange={(_, option) => {
+        setChosen(option)
+        onChange(option ? getId(option) : 0)
+      }}
+      noOptionsText="Sin resultados"
+      renderInput={(params) => <TextField {...params} label={label} required={required} />}
+    />
+  )
+}
+
+export default SuggestField
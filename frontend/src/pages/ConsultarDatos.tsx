@@ -33,7 +33,7 @@ import {
   styled
 } from '@mui/material'
 import FilterListIcon from '@mui/icons-material/FilterList'
-import { queryCombinedData } from '../services/api'
+import { queryCombinedData, getQueryFacets } from '../services/api'
 
 // Styled components for custom tabs with stronger styling
 const StyledTabs = styled(Tabs)(() => ({
@@ -172,42 +172,9 @@ const ConsultarDatos = () => {
     },
   })
 
-  // Extract unique workers and cars from results for filter options
+  // Initialize the filtered view with all results
   useEffect(() => {
-    if (results.formularios_coche.length > 0 || results.formularios_trabajo.length > 0) {
-      // Extract unique workers
-      const workersSet = new Set<string>()
-      const carsSet = new Set<string>()
-      
-      // Process car forms
-      results.formularios_coche.forEach(form => {
-        workersSet.add(`${form.dni_trabajador}:${form.nombre_trabajador} ${form.apellido_trabajador}`)
-        carsSet.add(`${form.id_coche}:Coche ${form.id_coche}`)
-      })
-      
-      // Process work forms
-      results.formularios_trabajo.forEach(form => {
-        workersSet.add(`${form.dni_trabajador}:${form.nombre_trabajador} ${form.apellido_trabajador}`)
-        carsSet.add(`${form.id_coche}:Coche ${form.id_coche}`)
-      })
-      
-      // Convert to array of objects for select options
-      const workerOptionsArray = Array.from(workersSet).map(worker => {
-        const [id, name] = worker.split(':')
-        return { id: parseInt(id), name }
-      })
-      
-      const carOptionsArray = Array.from(carsSet).map(car => {
-        const [id, name] = car.split(':')
-        return { id: parseInt(id), name }
-      })
-      
-      setWorkerOptions(workerOptionsArray)
-      setCarOptions(carOptionsArray)
-      
-      // Initialize with all results
-      setFilteredResults(results)
-    }
+    setFilteredResults(results)
   }, [results])
   
   // Apply filters when selection changes
@@ -276,8 +243,21 @@ const ConsultarDatos = () => {
         dateMessage += dateMessage ? ` hasta ${formattedEndDate}` : `hasta ${formattedEndDate}`;
       }
       
-      const data = await queryCombinedData(queryData)
+      // Filter options come from the facets endpoint (GROUP BY in the database)
+      // instead of being deduplicated from the full result set
+      const [data, facets] = await Promise.all([
+        queryCombinedData(queryData),
+        getQueryFacets({ fecha_inicio: queryData.fecha_inicio, fecha_fin: queryData.fecha_fin }),
+      ])
       setResults(data || { formularios_coche: [], formularios_trabajo: [] })
+      setWorkerOptions(facets.trabajadores.map(worker => ({
+        id: worker.dni,
+        name: `${worker.nombre} ${worker.apellido} (${worker.count})`,
+      })))
+      setCarOptions(facets.coches.map(car => ({
+        id: car.id_coche,
+        name: `Coche ${car.id_coche} (${car.count})`,
+      })))
       
       // Reset filters when new data is loaded
       setSelectedWorkers([])
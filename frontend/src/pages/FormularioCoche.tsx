@@ -11,9 +11,16 @@ import {
   getAvailableTrabajosForCocheForm, 
   getAllTrabajadores, 
   getAllCoches,
+  suggestCoches,
+  suggestTrabajadores,
+  suggestTrabajos,
+  Coche,
+  Trabajador,
+  Trabajo,
   formatDate,
   htmlDateToApiDate
 } from '../services/api'
+import SuggestField from '../components/SuggestField'
 
 interface LocationState {
   id_coche?: number
@@ -47,9 +54,9 @@ const FormularioCochePage: React.FC = () => {
   })
   
   // Options for dropdowns
-  const [trabajos, setTrabajos] = useState<any[]>([])
-  const [trabajadores, setTrabajadores] = useState<any[]>([])
-  const [coches, setCoches] = useState<any[]>([])
+  const [trabajos, setTrabajos] = useState<Trabajo[]>([])
+  const [trabajadores, setTrabajadores] = useState<Trabajador[]>([])
+  const [coches, setCoches] = useState<Coche[]>([])
   
   // UI state
   const [submitting, setSubmitting] = useState(false)
@@ -106,15 +113,6 @@ const FormularioCochePage: React.FC = () => {
       }
     }
     
-    // Handle numeric fields
-    if (['id_coche', 'dni_trabajador', 'id_trabajo'].includes(name) && typeof value === 'string') {
-      setFormData({
-        ...formData,
-        [name]: value === '' ? 0 : parseInt(value)
-      })
-      return
-    }
-    
     setFormData({
       ...formData,
       [name]: value
@@ -215,71 +213,50 @@ const FormularioCochePage: React.FC = () => {
           <Grid container spacing={3}>
             {/* Coche selection */}
             <Grid item xs={12} md={4}>
-              <FormControl fullWidth required>
-                <InputLabel id="coche-label">Coche</InputLabel>
-                <Select
-                  labelId="coche-label"
-                  id="id_coche"
-                  name="id_coche"
-                  value={formData.id_coche || ''}
-                  label="Coche"
-                  onChange={handleChange}
-                  disabled={Boolean(locationState.id_coche)}
-                >
-                  <MenuItem value={0} disabled>Seleccione un coche</MenuItem>
-                  {coches.map((coche) => (
-                    <MenuItem key={coche.id_coche} value={coche.id_coche}>
-                      ID: {coche.id_coche} - Placa: {coche.placa}
-                    </MenuItem>
-                  ))}
-                </Select>
-              </FormControl>
+              <SuggestField<Coche>
+                id="id_coche"
+                label="Coche"
+                value={formData.id_coche}
+                options={coches}
+                getId={(coche) => coche.id_coche}
+                getLabel={(coche) => `ID: ${coche.id_coche} - Placa: ${coche.placa}`}
+                suggest={(q) => suggestCoches(q)}
+                onChange={(id_coche) => setFormData((current) => ({ ...current, id_coche }))}
+                disabled={Boolean(locationState.id_coche)}
+                required
+              />
             </Grid>
             
             {/* Trabajador selection */}
             <Grid item xs={12} md={4}>
-              <FormControl fullWidth required>
-                <InputLabel id="trabajador-label">Trabajador</InputLabel>
-                <Select
-                  labelId="trabajador-label"
-                  id="dni_trabajador"
-                  name="dni_trabajador"
-                  value={formData.dni_trabajador || ''}
-                  label="Trabajador"
-                  onChange={handleChange}
-                  disabled={Boolean(locationState.dni_trabajador)}
-                >
-                  <MenuItem value={0} disabled>Seleccione un trabajador</MenuItem>
-                  {trabajadores.map((trabajador) => (
-                    <MenuItem key={trabajador.dni} value={trabajador.dni}>
-                      {trabajador.nombre} {trabajador.apellido} (DNI: {trabajador.dni})
-                    </MenuItem>
-                  ))}
-                </Select>
-              </FormControl>
+              <SuggestField<Trabajador>
+                id="dni_trabajador"
+                label="Trabajador"
+                value={formData.dni_trabajador}
+                options={trabajadores}
+                getId={(trabajador) => trabajador.dni}
+                getLabel={(trabajador) => `${trabajador.nombre} ${trabajador.apellido} (DNI: ${trabajador.dni})`}
+                suggest={(q) => suggestTrabajadores(q)}
+                onChange={(dni_trabajador) => setFormData((current) => ({ ...current, dni_trabajador }))}
+                disabled={Boolean(locationState.dni_trabajador)}
+                required
+              />
             </Grid>
             
             {/* Trabajo selection */}
             <Grid item xs={12} md={4}>
-              <FormControl fullWidth required>
-                <InputLabel id="trabajo-label">Trabajo</InputLabel>
-                <Select
-                  labelId="trabajo-label"
-                  id="id_trabajo"
-                  name="id_trabajo"
-                  value={formData.id_trabajo || ''}
-                  label="Trabajo"
-                  onChange={handleChange}
-                  disabled={Boolean(locationState.id_trabajo)}
-                >
-                  <MenuItem value={0} disabled>Seleccione un trabajo</MenuItem>
-                  {trabajos.map((trabajo) => (
-                    <MenuItem key={trabajo.id} value={trabajo.id}>
-                      ID: {trabajo.id} - Cliente: {trabajo.cliente}
-                    </MenuItem>
-                  ))}
-                </Select>
-              </FormControl>
+              <SuggestField<Trabajo>
+                id="id_trabajo"
+                label="Trabajo"
+                value={formData.id_trabajo}
+                options={trabajos}
+                getId={(trabajo) => trabajo.id}
+                getLabel={(trabajo) => `ID: ${trabajo.id} - Cliente: ${trabajo.cliente}`}
+                suggest={(q) => suggestTrabajos(q, 10, 'coche')}
+                onChange={(id_trabajo) => setFormData((current) => ({ ...current, id_trabajo }))}
+                disabled={Boolean(locationState.id_trabajo)}
+                required
+              />
             </Grid>
             
             {/* Date picker */}
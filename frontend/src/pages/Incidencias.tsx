@@ -38,7 +38,8 @@ import {
   getAllIncidencias, 
   resolveIncidencia, 
   formatDate,
-  getTrabajador
+  getTrabajador,
+  subscribeIncidencias
 } from '../services/api'
 
 const Incidencias = () => {
@@ -84,6 +85,28 @@ const Incidencias = () => {
 
     fetchIncidencias()
   }, [refreshTrigger]) // Refetch when refreshTrigger changes
+
+  // Live updates: incidences created by new car forms or resolved elsewhere
+  // show up without reloading; a reset (events lost) triggers a refetch
+  useEffect(() => {
+    return subscribeIncidencias(
+      (incidencia) => {
+        setIncidencias(prev => {
+          const index = prev.findIndex(inc => inc.id_incidencia === incidencia.id_incidencia)
+          if (index === -1) {
+            return [...prev, incidencia]
+          }
+          const next = [...prev]
+          next[index] = incidencia
+          return next
+        })
+        if (incidencia.resuelta && incidencia.id_mecanico) {
+          fetchMechanicNames([incidencia.id_mecanico])
+        }
+      },
+      () => setRefreshTrigger(prev => prev + 1),
+    )
+  }, [])
   
   // Helper function to fetch mechanic names
   const fetchMechanicNames = async (mechanicIds: number[]) => {
@@ -104,7 +127,7 @@ const Incidencias = () => {
       namesMap[result.id] = result.name
     })
     
-    setMechanicNames(namesMap)
+    setMechanicNames(prev => ({ ...prev, ...namesMap }))
   }
 
   // Toggle row expansion
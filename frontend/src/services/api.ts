@@ -1,10 +1,178 @@
 import axios from 'axios'
+import { createMirror, type SyncResponse } from './sync'
 
 // Create axios instance with base URL
 const api = axios.create({
   baseURL: '/api',
+  // 304 is a valid answer to a conditional GET (see the interceptors below)
+  validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
 })
 
+// Conditional GET: list endpoints send an ETag; we keep the last body per URL,
+// revalidate with If-None-Match and reuse the body when the server answers 304.
+const etagCache = new Map<string, { etag: string; data: unknown }>()
+
+const etagKey = (url?: string, params?: unknown): string =>
+  `${url ?? ''}?${params ? JSON.stringify(params) : ''}`
+
+api.interceptors.request.use((config) => {
+  if ((config.method ?? 'get').toLowerCase() === 'get') {
+    const cached = etagCache.get(etagKey(config.url, config.params))
+    if (cached) {
+      config.headers.set('If-None-Match', cached.etag)
+    }
+  }
+  return config
+})
+
+api.interceptors.response.use((response) => {
+  if ((response.config.method ?? 'get').toLowerCase() !== 'get') {
+    return response
+  }
+  const key = etagKey(response.config.url, response.config.params)
+  if (response.status === 304) {
+    const cached = etagCache.get(key)
+    return cached ? { ...response, status: 200, data: cached.data } : response
+  }
+  const etag = response.headers['etag']
+  if (typeof etag === 'string') {
+    etagCache.set(key, { etag, data: response.data })
+  }
+  return response
+})
+
+// Idempotency keys: every POST/PUT/PATCH/DELETE carries an Idempotency-Key. A
+// request that got no answer (timeout, lost connection) keeps its key, so when
+// the user submits the same data again the server replays the first response
+// instead of running it twice. Any answer from the server retires the key.
+const MUTATING_METHODS = new Set(['post', 'put', 'patch', 'delete'])
+const READ_ONLY_POSTS = new Set(['/batch/']) // nothing to deduplicate
+const pendingKeys = new Map<string, string>() // request fingerprint -> key
+const keyFingerprints = new Map<string, string>() // key -> request fingerprint
+
+const newIdempotencyKey = (): string =>
+  typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function'
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+
+const retireIdempotencyKey = (key: unknown) => {
+  if (typeof key !== 'string') return
+  const fingerprint = keyFingerprints.get(key)
+  if (fingerprint !== undefined) {
+    pendingKeys.delete(fingerprint)
+    keyFingerprints.delete(key)
+  }
+}
+
+api.interceptors.request.use((config) => {
+  const method = (config.method ?? 'get').toLowerCase()
+  if (MUTATING_METHODS.has(method) && !READ_ONLY_POSTS.has(config.url ?? '') && !config.headers.has('Idempotency-Key')) {
+    const fingerprint = `${method} ${config.url ?? ''}?${JSON.stringify(config.params ?? null)} ${JSON.stringify(config.data ?? null)}`
+    let key = pendingKeys.get(fingerprint)
+    if (!key) {
+      key = newIdempotencyKey()
+      pendingKeys.set(fingerprint, key)
+      keyFingerprints.set(key, fingerprint)
+    }
+    config.headers.set('Idempotency-Key', key)
+  }
+  return config
+})
+
+api.interceptors.response.use(
+  (response) => {
+    retireIdempotencyKey(response.config.headers?.['Idempotency-Key'])
+    return response
+  },
+  (error) => {
+    // No response: the request may have reached the server, keep the key for the retry
+    if (error?.response) {
+      retireIdempotencyKey(error.config?.headers?.['Idempotency-Key'])
+    }
+    return Promise.reject(error)
+  },
+)
+
+// Page bootstrap: GETs issued in the same tick (e.g. the Promise.all of a form
+// page) are sent together as one POST /batch/, which the server answers in one
+// round trip over one database connection. A lone GET goes out as usual, and
+// if the batch itself fails each GET is sent on its own.
+const BATCH_MAX_REQUESTS = 20
+
+interface BatchedGet {
+  url: string
+  params?: Record<string, unknown>
+  resolve: (data: any) => void
+  reject: (error: unknown) => void
+}
+
+let batchQueue: BatchedGet[] = []
+
+const sendAlone = (request: BatchedGet) => {
+  api.get(request.url, { params: request.params }).then((response) => request.resolve(response.data), request.reject)
+}
+
+const sendBatch = async (requests: BatchedGet[]) => {
+  if (requests.length === 1) {
+    sendAlone(requests[0])
+    return
+  }
+  let results: { status: number; body: unknown }[]
+  try {
+    const response = await api.post('/batch/', {
+      requests: requests.map(({ url, params }) => ({ method: 'GET', path: `${api.defaults.baseURL}${url}`, params })),
+    })
+    results = response.data.results
+  } catch (error) {
+    console.warn('Lote de peticiones fallido, enviándolas por separado:', error)
+    requests.forEach(sendAlone)
+    return
+  }
+  requests.forEach((request, i) => {
+    const { status, body } = results[i]
+    if (status >= 200 && status < 300) {
+      request.resolve(body)
+    } else {
+      // Shaped like an axios error, for the callers' error handling
+      request.reject(Object.assign(new Error(`Request failed with status code ${status}`), { response: { status, data: body } }))
+    }
+  })
+}
+
+const flushBatchQueue = () => {
+  const queued = batchQueue
+  batchQueue = []
+  for (let i = 0; i < queued.length; i += BATCH_MAX_REQUESTS) {
+    sendBatch(queued.slice(i, i + BATCH_MAX_REQUESTS))
+  }
+}
+
+export const batchedGet = <T>(url: string, params?: Record<string, unknown>): Promise<T> =>
+  new Promise<T>((resolve, reject) => {
+    batchQueue.push({ url, params, resolve, reject })
+    if (batchQueue.length === 1) {
+      setTimeout(flushBatchQueue, 0)
+    }
+  })
+
+// Coches, trabajadores, trabajos and incidencias are read from a local mirror
+// that only downloads what changed since the last read (see ./sync). If the
+// sync fails the lists fall back to the full endpoints.
+const mirror = createMirror(
+  ['coches', 'trabajadores', 'trabajos', 'incidencias'],
+  (params) => batchedGet<SyncResponse>('/sync/', params),
+)
+
+const mirroredRows = async <T>(table: string, fallbackUrl: string): Promise<T[]> => {
+  try {
+    return await mirror.rows<T>(table)
+  } catch (error) {
+    console.warn(`Sincronización de ${table} fallida, leyendo la lista completa:`, error)
+    const response = await api.get(fallbackUrl)
+    return response.data
+  }
+}
+
 // Date format constants and utilities
 export const DATE_FORMAT = 'DD/MM/YYYY'
 
@@ -201,6 +369,13 @@ export interface CombinedDataResponse {
   formularios_trabajo: any[];
 }
 
+export interface QueryFacetsResponse {
+  trabajadores: { dni: number; nombre: string; apellido: string; count: number }[];
+  coches: { id_coche: number; placa: number; count: number }[];
+  clientes: { cliente: string; count: number }[];
+  lugares: { lugar_trabajo: string; count: number }[];
+}
+
 // API functions for Coche
 // Note: Path parameter for get/update Coche should be id_coche if it's the PK
 export const createCoche = async (data: CocheCreate) => {
@@ -239,8 +414,7 @@ export const getCoche = async (id_coche: number): Promise<Coche> => {
 
 export const getAllCoches = async (): Promise<Coche[]> => { // Return type updated
   try {
-    const response = await api.get('/coches/')
-    return response.data
+    return await mirroredRows('coches', '/coches/')
   } catch (error) {
     console.error('Error obteniendo coches:', error)
     throw error
@@ -300,8 +474,7 @@ export const getTrabajador = async (dni: number): Promise<Trabajador> => {
 
 export const getAllTrabajadores = async (): Promise<Trabajador[]> => { // Return type updated
   try {
-    const response = await api.get('/trabajadores/')
-    return response.data
+    return await mirroredRows('trabajadores', '/trabajadores/')
   } catch (error) {
     console.error('Error obteniendo trabajadores:', error)
     throw error
@@ -355,8 +528,7 @@ export const getTrabajo = async (id: number): Promise<Trabajo> => {
 
 export const getAllTrabajos = async (): Promise<Trabajo[]> => { // Return type updated
   try {
-    const response = await api.get('/trabajos/')
-    return response.data
+    return await mirroredRows('trabajos', '/trabajos/')
   } catch (error) {
     console.error('Error obteniendo trabajos:', error)
     throw error
@@ -456,17 +628,43 @@ export const queryCombinedData = async (params: QueryParams): Promise<CombinedDa
   }
 }
 
+// Filter options (distinct workers, cars, clients, locations with counts) for the same filters as queryCombinedData
+export const getQueryFacets = async (params: Omit<QueryParams, 'format'>): Promise<QueryFacetsResponse> => {
+  try {
+    const response = await api.get<QueryFacetsResponse>('/query/facets', { params })
+    return response.data
+  } catch (error) {
+    console.error('Error obteniendo opciones de filtro:', error)
+    throw error
+  }
+}
+
 // API functions for Incidencias
 export const getAllIncidencias = async (): Promise<Incidencia[]> => {
   try {
-    const response = await api.get('/incidencias/')
-    return response.data
+    return await mirroredRows('incidencias', '/incidencias/')
   } catch (error) {
     console.error('Error fetching incidencias:', error)
     throw error
   }
 }
 
+// Live changes of incidencias (Server-Sent Events): every incidence created or
+// resolved is passed to `onChange`. The browser reconnects on its own and the
+// server resends what was missed; `onReset` means events were lost and the
+// list must be reloaded. Returns a function that closes the stream.
+export const subscribeIncidencias = (
+  onChange: (incidencia: Incidencia) => void,
+  onReset: () => void,
+): (() => void) => {
+  const source = new EventSource(`${api.defaults.baseURL}/incidencias/stream`)
+  source.addEventListener('incidencia', (event) => {
+    onChange(JSON.parse((event as MessageEvent<string>).data))
+  })
+  source.addEventListener('reset', () => onReset())
+  return () => source.close()
+}
+
 export const getIncidencia = async (id: number): Promise<Incidencia> => {
   try {
     const response = await api.get(`/incidencias/${id}`)
@@ -490,8 +688,7 @@ export const resolveIncidencia = async (id: number, id_mecanico: number): Promis
 // New functions to get trabajos without formularios
 export const getAvailableTrabajosForCocheForm = async (): Promise<Trabajo[]> => {
   try {
-    const response = await api.get('/trabajos/available-for-coche-form')
-    return response.data
+    return await batchedGet<Trabajo[]>('/trabajos/available-for-coche-form')
   } catch (error) {
     console.error('Error obteniendo trabajos disponibles para formulario de coche:', error)
     throw error
@@ -500,10 +697,40 @@ export const getAvailableTrabajosForCocheForm = async (): Promise<Trabajo[]> =>
 
 export const getAvailableTrabajosForTrabajoForm = async (): Promise<Trabajo[]> => {
   try {
-    const response = await api.get('/trabajos/available-for-trabajo-form')
-    return response.data
+    return await batchedGet<Trabajo[]>('/trabajos/available-for-trabajo-form')
   } catch (error) {
     console.error('Error obteniendo trabajos disponibles para formulario de trabajo:', error)
     throw error
   }
-} 
\ No newline at end of file
+} 
+
+// Typeahead suggestions (served from in-memory indexes, cheap to call on every keystroke)
+export const suggestTrabajos = async (q: string, limit = 10, disponible_para?: 'coche' | 'trabajo'): Promise<Trabajo[]> => {
+  try {
+    const response = await api.get('/trabajos/suggest', { params: { q, limit, disponible_para } })
+    return response.data
+  } catch (error) {
+    console.error('Error obteniendo sugerencias de trabajos:', error)
+    throw error
+  }
+}
+
+export const suggestTrabajadores = async (q: string, limit = 10): Promise<Trabajador[]> => {
+  try {
+    const response = await api.get('/trabajadores/suggest', { params: { q, limit } })
+    return response.data
+  } catch (error) {
+    console.error('Error obteniendo sugerencias de trabajadores:', error)
+    throw error
+  }
+}
+
+export const suggestCoches = async (q: string, limit = 10): Promise<Coche[]> => {
+  try {
+    const response = await api.get('/coches/suggest', { params: { q, limit } })
+    return response.data
+  } catch (error) {
+    console.error('Error obteniendo sugerencias de coches:', error)
+    throw error
+  }
+}
@@ -0,0 +1,103 @@
+// Local mirror of the reference tables, kept current with GET /api/sync.
+//
+// The first sync downloads every table; later ones send the token of the
+// previous sync and get back only the rows changed and the keys deleted since
+// then. The mirror is kept in localStorage, so a reload (or a phone coming
+// back online) only downloads the delta.
+
+export interface SyncTableDelta {
+  columns: string[]
+  key: string[]
+  rows: unknown[][]
+  deleted: string[]
+}
+
+export interface SyncResponse {
+  token: string
+  full: boolean
+  tables: Record<string, SyncTableDelta>
+}
+
+type Row = Record<string, unknown>
+
+interface MirrorState {
+  token: string | null
+  tables: Record<string, Record<string, Row>> // table -> primary key ('a:b') -> row
+}
+
+const STORAGE_KEY = 'sepcan-sync-v1'
+
+const load = (tables: readonly string[]): MirrorState => {
+  const empty: MirrorState = { token: null, tables: {} }
+  try {
+    const stored = JSON.parse(localStorage.getItem(STORAGE_KEY) ?? 'null') as MirrorState | null
+    // A copy without one of the tables is useless: start over with a full sync
+    if (stored && stored.token && tables.every((name) => stored.tables?.[name])) {
+      return stored
+    }
+  } catch {
+    // Corrupt or unavailable storage: start over with a full sync
+  }
+  return empty
+}
+
+const save = (state: MirrorState) => {
+  try {
+    localStorage.setItem(STORAGE_KEY, JSON.stringify(state))
+  } catch {
+    // Quota exceeded or private mode: the mirror still works for this page
+  }
+}
+
+const applyDelta = (current: Record<string, Row> | undefined, delta: SyncTableDelta, full: boolean) => {
+  const table: Record<string, Row> = full || !current ? {} : { ...current }
+  // Deletions first: a key deleted and created again is in `rows`
+  for (const key of delta.deleted) {
+    delete table[key]
+  }
+  for (const values of delta.rows) {
+    const row: Row = {}
+    delta.columns.forEach((column, i) => {
+      row[column] = values[i]
+    })
+    table[delta.key.map((field) => String(row[field])).join(':')] = row
+  }
+  return table
+}
+
+export const createMirror = (tables: readonly string[], fetchChanges: (params: Record<string, string>) => Promise<SyncResponse>) => {
+  let state = load(tables)
+  let inFlight: Promise<MirrorState> | null = null
+
+  // Concurrent callers (several lists mounting at once) share one request
+  const sync = (): Promise<MirrorState> => {
+    if (!inFlight) {
+      const params: Record<string, string> = { tables: tables.join(',') }
+      if (state.token) {
+        params.since = state.token
+      }
+      inFlight = fetchChanges(params)
+        .then((response) => {
+          const next: MirrorState = { token: response.token, tables: { ...state.tables } }
+          for (const [name, delta] of Object.entries(response.tables)) {
+            next.tables[name] = applyDelta(state.tables[name], delta, response.full)
+          }
+          state = next
+          save(state)
+          return state
+        })
+        .finally(() => {
+          inFlight = null
+        })
+    }
+    return inFlight
+  }
+
+  return {
+    // Current rows of `table`, after bringing the mirror up to date
+    rows: async <T>(table: string): Promise<T[]> => {
+      const current = await sync()
+      return Object.values(current.tables[table] ?? {}) as T[]
+    },
+  }
+}